@@ -0,0 +1,119 @@
+"""Load benchmark comparing the WSGI and ASGI entry points.
+
+Opens many concurrent keep-alive connections against two running servers and reports
+the throughput and latency of each. Start the servers with one worker each, e.g. from
+the orgtorii directory:
+
+    gunicorn orgtorii.wsgi --workers 1 --threads 8 --bind 127.0.0.1:8001
+    uvicorn orgtorii.asgi:application --workers 1 --no-access-log --port 8002
+
+and run:
+
+    python benchmarks/asgi_vs_wsgi.py --wsgi http://127.0.0.1:8001 \\
+        --asgi http://127.0.0.1:8002 --connections 500 --duration 20 --path /
+
+Neither server is a project dependency, install them in your environment to run this.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class Result:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    connect_errors: int = 0
+
+
+async def _read_response(reader: asyncio.StreamReader) -> int:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    status = int(status_line.split()[1])
+    length = None
+    chunked = False
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+    if chunked:
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            await reader.readexactly(size + 2)
+        await reader.readline()
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _client(host: str, port: int, request: bytes, deadline: float, result: Result):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        result.connect_errors += 1
+        return
+    try:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await _read_response(reader)
+            if status >= 400:
+                result.errors += 1
+            else:
+                result.latencies.append(time.perf_counter() - started)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+        result.errors += 1
+    finally:
+        writer.close()
+
+
+async def run(url: str, path: str, connections: int, duration: float) -> Result:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    request = (
+        f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: keep-alive\r\n\r\n"
+    ).encode()
+    result = Result()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        *(_client(host, port, request, deadline, result) for _ in range(connections))
+    )
+    return result
+
+
+def report(name: str, result: Result, duration: float) -> None:
+    latencies = sorted(result.latencies)
+    if not latencies:
+        print(f"{name}: no successful requests ({result.errors} errors)")
+        return
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(
+        f"{name}: {len(latencies) / duration:,.0f} req/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms, "
+        f"{result.errors} errors, {result.connect_errors} failed connections"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--wsgi", required=True, help="Base URL of the WSGI server")
+    parser.add_argument("--asgi", required=True, help="Base URL of the ASGI server")
+    parser.add_argument("--path", default="/", help="Path to request")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per server")
+    args = parser.parse_args()
+
+    for name, url in (("WSGI", args.wsgi), ("ASGI", args.asgi)):
+        result = asyncio.run(run(url, args.path, args.connections, args.duration))
+        report(name, result, args.duration)
+
+
+if __name__ == "__main__":
+    main()
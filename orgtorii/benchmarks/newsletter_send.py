@@ -0,0 +1,117 @@
+"""Throughput of sending a newsletter campaign, with and without pooled connections.
+
+Sends a campaign to generated subscribers through a local SMTP server which, like a
+remote one, takes a while to greet new connections and to accept every message:
+
+- send_mail: a connection per message, as a plain send_mail loop does
+- pooled: newsletter_campaign_send on pooled connections, with 1 and more threads
+
+The subscribers are created in a temporary test database. Run it from the orgtorii
+directory, with the same environment as the development server:
+
+    python benchmarks/newsletter_send.py --subscribers 500 --threads 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orgtorii.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.mail import send_mail  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from orgtorii import mailing, services  # noqa: E402
+from orgtorii.core import models as core_models  # noqa: E402
+
+SMTP_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+
+def write_campaign(directory: Path) -> None:
+    campaign = directory / "core/emails/newsletter/benchmark"
+    campaign.mkdir(parents=True)
+    (campaign / "subject.txt").write_text("Benchmark")
+    (campaign / "body.txt").write_text(
+        '{% extends "core/emails/newsletter/base.txt" %}{% block content %}'
+        + "Lorem ipsum dolor sit amet. " * 50
+        + "{% endblock %}"
+    )
+
+
+def run_send_mail() -> int:
+    emails = core_models.NewsletterSignup.objects.values_list("email", flat=True)
+    for email in emails:
+        send_mail("Benchmark", "Lorem ipsum dolor sit amet. " * 50, None, [email])
+    return len(emails)
+
+
+def run_pooled(threads: int) -> int:
+    core_models.ImportCheckpoint.objects.all().delete()
+    pool = mailing.EmailConnectionPool(size=threads, backend=SMTP_BACKEND)
+    try:
+        result = services.newsletter_campaign_send(
+            campaign="benchmark", pool=pool, rate=1_000_000, threads=threads
+        )
+    finally:
+        pool.close()
+    return result.sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8, help="Threads of the pooled run")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds to accept a message")
+    parser.add_argument(
+        "--connect-latency", type=float, default=0.05, help="Seconds to greet a connection"
+    )
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    directory = tempfile.TemporaryDirectory()
+    try:
+        write_campaign(Path(directory.name))
+        core_models.NewsletterSignup.objects.bulk_create(
+            core_models.NewsletterSignup(email=f"{i}@example.com") for i in range(args.subscribers)
+        )
+        with mailing.LocalSMTPServer(
+            latency=args.latency, connect_latency=args.connect_latency
+        ) as server:
+            server.start()
+            templates = [{**settings.TEMPLATES[0], "DIRS": [directory.name]}]
+            runs = {
+                "send_mail": run_send_mail,
+                "pooled, 1 thread": lambda: run_pooled(1),
+                f"pooled, {args.threads} threads": lambda: run_pooled(args.threads),
+            }
+            with override_settings(
+                TEMPLATES=templates,
+                EMAIL_BACKEND=SMTP_BACKEND,
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=server.port,
+            ):
+                for name, run in runs.items():
+                    connections = server.connections
+                    started = time.perf_counter()
+                    sent = run()
+                    elapsed = time.perf_counter() - started
+                    print(
+                        f"{name:<20} {sent / elapsed:>8.0f} messages/s "
+                        f"{server.connections - connections:>6} connections"
+                    )
+    finally:
+        directory.cleanup()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Concurrent reads and writes against SQLite, before and after the pooled backend.
+
+Reader and writer threads run request-like units of work against a temporary database,
+opening their connection at the start and closing it at the end like Django does:
+
+- readers run a query, then two queries in a transaction
+- writers insert a row in a transaction held for ``--write-hold`` seconds
+
+in two configurations:
+
+- stock: django-prometheus' SQLite backend, every request opens a connection and
+  transactions on the single alias are IMMEDIATE
+- pooled: orgtorii.db.backends.sqlite3 with a pool per alias, query_only read
+  connections with DEFERRED transactions and serialized writes
+
+With ``--writer-process`` the writers run in a process of their own, like the workers
+of a production server, instead of sharing the GIL with the readers. ``--no-write-lock``
+leaves the pooled writers to SQLite's busy handler instead of the write lock of the
+process, and ``--switch-interval`` sets ``sys.setswitchinterval`` (5 ms by default).
+
+With 16 readers, 4 writers and 2 ms write transactions, the pooled writers sharing the
+process of the readers wrote between 8/s and 154/s from one run to the next, with or
+without the write lock (without it, some writes failed on busy_timeout). Timing the
+steps of a write showed the time went to the 2 ms sleep, i.e. to waiting for the GIL
+once it returned, not to SQLite nor to acquiring the write lock. In a separate process
+they wrote a steady 310/s, close to the limit of 4 writers taking turns. The write lock
+doesn't starve the writers, but while its holder waits for the GIL the other writers of
+the process wait too, so writes belong in processes (or a write queue thread) that
+aren't saturated with reads.
+
+Run it from the orgtorii directory, with the same environment as the development server:
+
+    python benchmarks/sqlite_concurrency.py --readers 16 --writers 4 --duration 5
+    python benchmarks/sqlite_concurrency.py --writer-process
+    python benchmarks/sqlite_concurrency.py --no-write-lock
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orgtorii.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import DatabaseError  # noqa: E402
+from django.db.utils import ConnectionHandler  # noqa: E402
+
+ROWS = 10_000
+
+
+def configurations(name: str, *, write_lock: bool = True) -> dict[str, dict]:
+    init_command = settings.DATABASES["default"]["OPTIONS"]["init_command"]
+    default_options = dict(settings.DATABASES["default"]["OPTIONS"])
+    if not write_lock:
+        default_options["write_lock_timeout"] = None
+    stock = {
+        "ENGINE": "django_prometheus.db.backends.sqlite3",
+        "NAME": name,
+        "OPTIONS": {"init_command": init_command, "transaction_mode": "IMMEDIATE"},
+    }
+    return {
+        "stock": {"default": stock, "read": stock},
+        "pooled": {
+            "default": {**settings.DATABASES["default"], "NAME": name, "OPTIONS": default_options},
+            "read": {**settings.DATABASES["read"], "NAME": name},
+        },
+    }
+
+
+def begin(connection) -> None:
+    # What transaction.atomic() does on SQLite
+    connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+
+def end(connection) -> None:
+    connection.commit()
+    connection.set_autocommit(True)
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+def reader(connections: ConnectionHandler, deadline: float, stats: Stats) -> None:
+    connection = connections["read"]
+    i = 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        i += 1
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT value FROM item WHERE id = %s", [i % ROWS + 1])
+                cursor.fetchall()
+            begin(connection)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM item WHERE id < %s", [i % ROWS])
+                cursor.fetchall()
+                cursor.execute("SELECT value FROM item ORDER BY id DESC LIMIT 10")
+                cursor.fetchall()
+            end(connection)
+        except DatabaseError:
+            with stats.lock:
+                stats.errors += 1
+            connection.rollback()
+            connection.set_autocommit(True)
+        finally:
+            connection.close()
+        with stats.lock:
+            stats.latencies.append(time.perf_counter() - started)
+
+
+def writer(connections: ConnectionHandler, deadline: float, hold: float, stats: Stats) -> None:
+    connection = connections["default"]
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            begin(connection)
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO item (value) VALUES (%s)", ["new"])
+            time.sleep(hold)
+            end(connection)
+        except DatabaseError:
+            with stats.lock:
+                stats.errors += 1
+            if connection.connection is not None and not connection.get_autocommit():
+                connection.rollback()
+                connection.set_autocommit(True)
+        finally:
+            connection.close()
+        with stats.lock:
+            stats.latencies.append(time.perf_counter() - started)
+
+
+def run_threads(threads: list[threading.Thread]) -> None:
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def writer_process(databases: dict, args: argparse.Namespace, ready, start, results) -> None:
+    sys.setswitchinterval(args.switch_interval)
+    connections = ConnectionHandler(databases)
+    writes = Stats()
+    ready.set()
+    start.wait()
+    deadline = time.monotonic() + args.duration
+    run_threads(
+        [
+            threading.Thread(target=writer, args=(connections, deadline, args.write_hold, writes))
+            for _ in range(args.writers)
+        ]
+    )
+    results.put((writes.latencies, writes.errors))
+
+
+def run(databases: dict, args: argparse.Namespace) -> tuple[Stats, Stats]:
+    connections = ConnectionHandler(databases)
+    connection = connections["default"]
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS item")
+        cursor.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, value TEXT)")
+        cursor.executemany("INSERT INTO item (value) VALUES (%s)", [["value"]] * ROWS)
+    connection.close()
+
+    reads, writes = Stats(), Stats()
+    if not args.writer_process:
+        deadline = time.monotonic() + args.duration
+        run_threads(
+            [
+                threading.Thread(target=reader, args=(connections, deadline, reads))
+                for _ in range(args.readers)
+            ]
+            + [
+                threading.Thread(
+                    target=writer, args=(connections, deadline, args.write_hold, writes)
+                )
+                for _ in range(args.writers)
+            ]
+        )
+        return reads, writes
+
+    # Spawned rather than forked, the connections of this process mustn't be shared
+    context = multiprocessing.get_context("spawn")
+    ready, start, results = context.Event(), context.Event(), context.Queue()
+    process = context.Process(target=writer_process, args=(databases, args, ready, start, results))
+    process.start()
+    ready.wait()
+    start.set()
+    deadline = time.monotonic() + args.duration
+    run_threads(
+        [
+            threading.Thread(target=reader, args=(connections, deadline, reads))
+            for _ in range(args.readers)
+        ]
+    )
+    writes.latencies, writes.errors = results.get()
+    process.join()
+    return reads, writes
+
+
+def summary(stats: Stats, duration: float) -> str:
+    p99 = statistics.quantiles(stats.latencies, n=100)[98] * 1000 if stats.latencies else 0
+    return f"{len(stats.latencies) / duration:>8.0f}/s p99 {p99:>7.1f} ms {stats.errors:>5} errors"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per configuration")
+    parser.add_argument(
+        "--write-hold", type=float, default=0.002, help="Seconds a write transaction lasts"
+    )
+    parser.add_argument(
+        "--writer-process",
+        action="store_true",
+        help="Run the writers in a separate process, which doesn't share the GIL",
+    )
+    parser.add_argument(
+        "--no-write-lock",
+        action="store_true",
+        help="Don't serialize the pooled writers with the write lock of the process",
+    )
+    parser.add_argument(
+        "--switch-interval",
+        type=float,
+        default=sys.getswitchinterval(),
+        help="Seconds a thread runs before handing the GIL to a waiting one",
+    )
+    args = parser.parse_args()
+    sys.setswitchinterval(args.switch_interval)
+
+    with tempfile.TemporaryDirectory() as directory:
+        databases_by_name = configurations(
+            f"{directory}/db.sqlite3", write_lock=not args.no_write_lock
+        )
+        for name, databases in databases_by_name.items():
+            reads, writes = run(databases, args)
+            print(
+                f"{name:<8} reads {summary(reads, args.duration)}"
+                f"   writes {summary(writes, args.duration)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
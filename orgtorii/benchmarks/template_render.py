@@ -0,0 +1,82 @@
+"""Render time of the page templates with and without template and fragment caching.
+
+Renders every page template repeatedly in three configurations:
+
+- parse: templates parsed on every render (no cached loader)
+- cached loader: templates parsed once, fragments rendered every time
+- fragment cache: templates parsed once, {% fragmentcache %} blocks served from the cache
+
+Run it from the orgtorii directory, with the same environment as the development server:
+
+    python benchmarks/template_render.py --renders 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orgtorii.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.template.loader import render_to_string  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from django.utils.safestring import mark_safe  # noqa: E402
+
+PAGES = {
+    "orgtorii/homepage.html": {},
+    "orgtorii/pricing.html": {
+        "pricing_table": mark_safe(render_to_string("partials/orgtorii/pricing_table.html"))
+    },
+    "core/pages/newsletter/success.html": {},
+    "core/pages/reviews/list.html": {"reviews": [], "next_cursor": None},
+}
+
+_uncached_templates = [
+    {
+        **settings.TEMPLATES[0],
+        "OPTIONS": {
+            **settings.TEMPLATES[0]["OPTIONS"],
+            "loaders": settings.TEMPLATES[0]["OPTIONS"]["loaders"][0][1],
+        },
+    }
+]
+
+CONFIGURATIONS = {
+    "parse": {"TEMPLATES": _uncached_templates, "TEMPLATE_FRAGMENT_CACHE_TIMEOUT": 0},
+    "cached loader": {"TEMPLATE_FRAGMENT_CACHE_TIMEOUT": 0},
+    "fragment cache": {"TEMPLATE_FRAGMENT_CACHE_TIMEOUT": 60},
+}
+
+
+def measure(template_name: str, context: dict, renders: int) -> float:
+    request = RequestFactory().get("/")
+    request.user = AnonymousUser()
+    render_to_string(template_name, context, request=request)  # warm up
+    started = time.perf_counter()
+    for _ in range(renders):
+        render_to_string(template_name, context, request=request)
+    return (time.perf_counter() - started) / renders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--renders", type=int, default=2000, help="Renders per template")
+    args = parser.parse_args()
+
+    print(f"{'template':<40}" + "".join(f"{name:>16}" for name in CONFIGURATIONS))
+    for template_name, context in PAGES.items():
+        timings = []
+        for overrides in CONFIGURATIONS.values():
+            with override_settings(**overrides):
+                timings.append(measure(template_name, context, args.renders))
+        print(f"{template_name:<40}" + "".join(f"{t * 1e6:>13.0f} us" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Write latency of concurrent writers, each writing on its own or through the write queue.
+
+Worker processes, like gunicorn's, run threads which each write a row in a loop against
+a temporary database with the settings of ``DATABASES``:
+
+- direct: every write runs in its own transaction on the thread, like a request
+- queued: writes are handed to ``orgtorii.db.writer.WriteQueue``, one writer thread per
+  process commits them in groups, the writer threads take turns with a lock file
+
+Writes hold their transaction for ``--write-hold`` seconds, standing in for the model
+signals and validation running inside it. Writes failing with ``database is locked``
+count as errors.
+
+Run it from the orgtorii directory, with the same environment as the development server:
+
+    python benchmarks/write_contention.py --processes 4 --threads 8 --duration 5
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orgtorii.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import DatabaseError, connection, transaction  # noqa: E402
+
+from orgtorii.db.writer import get_write_queue  # noqa: E402
+
+
+def insert(hold: float) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO item (value) VALUES (%s)", ["new"])
+    time.sleep(hold)
+
+
+def write_direct(hold: float) -> None:
+    with transaction.atomic():
+        insert(hold)
+
+
+def write_queued(hold: float) -> None:
+    get_write_queue().run(insert, hold, timeout=settings.WRITE_QUEUE_TIMEOUT)
+
+
+def worker(mode: str, args: argparse.Namespace, results: multiprocessing.Queue) -> None:
+    write = write_direct if mode == "direct" else write_queued
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    def loop() -> None:
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                write(args.write_hold)
+            except DatabaseError:
+                with lock:
+                    errors += 1
+                continue
+            finally:
+                connection.close()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=loop) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors))
+
+
+def run(mode: str, args: argparse.Namespace) -> tuple[list[float], int]:
+    # Forked before any connection is opened, so the workers don't share them
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(mode, args, results)) for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies += process_latencies
+        errors += process_errors
+    for process in processes:
+        process.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="Writing threads per process")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per mode")
+    parser.add_argument(
+        "--write-hold", type=float, default=0.001, help="Seconds a write transaction lasts"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        name = f"{directory}/db.sqlite3"
+        for database in settings.DATABASES.values():
+            database["NAME"] = name
+        with sqlite3.connect(name) as db:
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, value TEXT)")
+
+        for mode in ("direct", "queued"):
+            latencies, errors = run(mode, args)
+            p50, p99 = (
+                (statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 98))
+                if len(latencies) > 1
+                else (0, 0)
+            )
+            print(
+                f"{mode:<7} {len(latencies) / args.duration:>7.0f} writes/s"
+                f"  p50 {p50:>7.1f} ms  p99 {p99:>7.1f} ms  {errors:>5} errors"
+            )
+
+
+if __name__ == "__main__":
+    main()
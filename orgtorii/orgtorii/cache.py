@@ -0,0 +1,249 @@
+import threading
+import time
+from dataclasses import dataclass, field
+
+from diskcache import Cache, DjangoCache, FanoutCache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django_prometheus.cache.metrics import (
+    django_cache_get_total,
+    django_cache_hits_total,
+    django_cache_misses_total,
+)
+from prometheus_client import REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .lru import LRUCache
+
+_missing = object()
+# Incremented by clear(), the generation of a namespace is kept under "generation:<namespace>"
+_GENERATION_KEY = "generation"
+
+_local_get_total = django_cache_get_total.labels(backend="local")
+_local_hits_total = django_cache_hits_total.labels(backend="local")
+_local_misses_total = django_cache_misses_total.labels(backend="local")
+_shared_get_total = django_cache_get_total.labels(backend="diskcache")
+_shared_hits_total = django_cache_hits_total.labels(backend="diskcache")
+_shared_misses_total = django_cache_misses_total.labels(backend="diskcache")
+
+
+@dataclass
+class _LocalTier:
+    entries: LRUCache
+    shared: FanoutCache
+    generations: Cache  # Not emptied by clear()
+    # The generations last read from ``generations`` and when, by key
+    checked: dict[str, tuple[int, float]] = field(default_factory=dict)
+
+
+# Django creates a cache backend per thread (and per request under ASGI), the in-process
+# tier and the diskcache connections are shared by all of them
+_local_tiers: dict[str, _LocalTier] = {}
+_local_tiers_lock = threading.Lock()
+
+
+class TieredDjangoCache(DjangoCache):
+    """diskcache's Django cache backend behind a per-process LRU cache.
+
+    Values read or written by a process are kept in its memory for ``LOCAL_TIMEOUT``
+    seconds, so hot keys are served without a SQLite read and an unpickle. Values are
+    returned as is rather than copied, so they must not be mutated (prefer immutable
+    values such as frozen dataclasses).
+
+    In-memory entries are stamped with generation counters shared by all processes
+    through diskcache: one for the whole cache, incremented by ``clear`` and ``evict``,
+    and one per namespace, the part of the key before its first ":" (e.g. ``page`` for
+    ``page:<hash>``), incremented by deleting a key of the namespace. Other processes
+    notice it within ``GENERATION_CHECK_INTERVAL`` seconds and drop the in-memory values
+    of that namespace only, so keys which are deleted often should get a namespace of
+    their own. A value overwritten by another process is only seen once the in-memory
+    copy expires.
+
+    Extra parameters, next to diskcache's:
+
+    - ``LOCAL_MAX_ENTRIES``: the maximum number of values kept in memory
+    - ``LOCAL_TIMEOUT``: seconds a value is kept in memory
+    - ``GENERATION_CHECK_INTERVAL``: seconds between reads of the shared generation
+    """
+
+    def __init__(self, directory, params):
+        # Opening diskcache's shards is slow, so DjangoCache.__init__ is skipped to reuse them
+        BaseCache.__init__(self, params)
+        self.local_timeout = params.get("LOCAL_TIMEOUT", 5)
+        self.generation_check_interval = params.get("GENERATION_CHECK_INTERVAL", 1)
+        with _local_tiers_lock:
+            if directory not in _local_tiers:
+                shared = FanoutCache(
+                    directory,
+                    params.get("SHARDS", 8),
+                    params.get("DATABASE_TIMEOUT", 0.010),
+                    **params.get("OPTIONS", {}),
+                )
+                _local_tiers[directory] = _LocalTier(
+                    entries=LRUCache(params.get("LOCAL_MAX_ENTRIES", 1024), self.local_timeout),
+                    shared=shared,
+                    generations=shared.cache("generations"),
+                )
+            self._local = _local_tiers[directory]
+        self._cache = self._local.shared
+
+    @staticmethod
+    def _namespace_generation_key(key) -> str:
+        return f"{_GENERATION_KEY}:{str(key).partition(':')[0]}"
+
+    def _generation(self, generation_key: str) -> int:
+        checked = self._local.checked.get(generation_key)
+        now = time.monotonic()
+        if checked is None or now - checked[1] >= self.generation_check_interval:
+            checked = self._local.generations.get(generation_key, 0), now
+            self._local.checked[generation_key] = checked
+        return checked[0]
+
+    def _invalidate(self, generation_key: str = _GENERATION_KEY) -> None:
+        generation = self._local.generations.incr(generation_key, retry=True)
+        self._local.checked[generation_key] = generation, time.monotonic()
+
+    def _local_key(self, key, version):
+        return (
+            self._generation(_GENERATION_KEY),
+            self._generation(self._namespace_generation_key(key)),
+            self.make_key(key, version=version),
+        )
+
+    def _local_set(self, key, value, version, timeout: float | None) -> None:
+        local_key = self._local_key(key, version)
+        if timeout is not None and timeout <= 0:
+            self._local.entries.delete(local_key)
+            return
+        ttl = self.local_timeout if timeout is None else min(self.local_timeout, timeout)
+        self._local.entries.set(local_key, value, ttl)
+
+    def get(
+        self,
+        key,
+        default=None,
+        version=None,
+        read=False,
+        expire_time=False,
+        tag=False,
+        retry=False,
+    ):
+        if read or expire_time or tag:
+            return super().get(key, default, version, read, expire_time, tag, retry)
+        _local_get_total.inc()
+        value = self._local.entries.get(self._local_key(key, version), _missing)
+        if value is not _missing:
+            _local_hits_total.inc()
+            return value
+        _local_misses_total.inc()
+
+        _shared_get_total.inc()
+        result = super().get(key, _missing, version, expire_time=True, retry=retry)
+        # diskcache returns the bare default when the database is busy
+        value, expires_at = result if result is not _missing else (_missing, None)
+        if value is _missing:
+            _shared_misses_total.inc()
+            return default
+        _shared_hits_total.inc()
+        self._local_set(key, value, version, expires_at and expires_at - time.time())
+        return value
+
+    def set(
+        self,
+        key,
+        value,
+        timeout=DEFAULT_TIMEOUT,
+        version=None,
+        read=False,
+        tag=None,
+        retry=True,
+    ):
+        result = super().set(key, value, timeout, version, read, tag, retry)
+        if read:
+            # The value is a file, only its contents are cached
+            self._local.entries.delete(self._local_key(key, version))
+        elif result:
+            self._local_set(key, value, version, self.get_backend_timeout(timeout))
+        return result
+
+    def add(
+        self,
+        key,
+        value,
+        timeout=DEFAULT_TIMEOUT,
+        version=None,
+        read=False,
+        tag=None,
+        retry=True,
+    ):
+        added = super().add(key, value, timeout, version, read, tag, retry)
+        if added and not read:
+            self._local_set(key, value, version, self.get_backend_timeout(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, retry=True):
+        self._local.entries.delete(self._local_key(key, version))
+        return super().touch(key, timeout, version, retry)
+
+    def incr(self, key, delta=1, version=None, default=None, retry=True):
+        self._local.entries.delete(self._local_key(key, version))
+        return super().incr(key, delta, version, default, retry)
+
+    def decr(self, key, delta=1, version=None, default=None, retry=True):
+        self._local.entries.delete(self._local_key(key, version))
+        return super().decr(key, delta, version, default, retry)
+
+    def pop(self, key, default=None, version=None, expire_time=False, tag=False, retry=True):
+        value = super().pop(key, default, version, expire_time, tag, retry)
+        self._invalidate(self._namespace_generation_key(key))
+        return value
+
+    def delete(self, key, version=None, retry=True):
+        deleted = super().delete(key, version, retry)
+        self._invalidate(self._namespace_generation_key(key))
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        generation_keys = set()
+        for key in keys:
+            super().delete(key, version, retry=True)
+            generation_keys.add(self._namespace_generation_key(key))
+        for generation_key in generation_keys:
+            self._invalidate(generation_key)
+
+    def evict(self, tag):
+        count = super().evict(tag)
+        self._invalidate()
+        return count
+
+    def clear(self):
+        result = super().clear()
+        self._invalidate()
+        self._local.entries.clear()
+        return result
+
+    def close(self, **kwargs):
+        # Called at the end of every request, keep the connections of the thread open as
+        # they are shared by all the requests it serves
+        pass
+
+
+class _LocalTierCollector:
+    def collect(self):
+        evictions = CounterMetricFamily(
+            "django_cache_local_evictions",
+            "Values evicted from the in-process cache to make room for others",
+            labels=["directory"],
+        )
+        size = GaugeMetricFamily(
+            "django_cache_local_entries",
+            "Values held in the in-process cache",
+            labels=["directory"],
+        )
+        for directory, local in list(_local_tiers.items()):
+            evictions.add_metric([directory], local.entries.evictions)
+            size.add_metric([directory], len(local.entries))
+        yield evictions
+        yield size
+
+
+REGISTRY.register(_LocalTierCollector())
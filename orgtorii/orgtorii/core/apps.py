@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "orgtorii.core"
+
+    def ready(self):
+        from allauth.core import ratelimit
+
+        from . import signals, tasks  # noqa: F401
+
+        # allauth counts the attempts in the default cache, which doesn't share them
+        # between processes: count them in the RATELIMIT_CACHE_ALIAS cache instead
+        ratelimit.cache = ConnectionProxy(caches, settings.RATELIMIT_CACHE_ALIAS)
@@ -1,4 +1,5 @@
 from django import forms
+from django.urls import reverse_lazy
 
 from . import models
 
@@ -12,10 +13,8 @@ class NewsletterSignupForm(forms.ModelForm):
         widgets = {"email": forms.EmailInput(attrs={"data-testid": "newsletter-signup-form"})}
 
     def validate_unique(self) -> None:
-        try:
-            self.instance.validate_unique()
-        except forms.ValidationError:
-            self.add_error("email", self.ALREADY_SUBSCRIBED_ERROR)
+        # Checked when subscribing, see services.newsletter_signup_create
+        pass
 
 
 class EmployerReviewMVPForm(forms.ModelForm):
@@ -35,6 +34,15 @@ class EmployerReviewMVPForm(forms.ModelForm):
             "culture_rating",
         )
         widgets = {
+            "company_name": forms.TextInput(
+                attrs={
+                    "autocomplete": "off",
+                    "list": "company-suggestions",
+                    "hx-get": reverse_lazy("core:company_autocomplete"),
+                    "hx-trigger": "input changed delay:150ms",
+                    "hx-target": "#company-suggestions",
+                }
+            ),
             "estimated_review_date": forms.DateInput(attrs={"type": "date"}),
             "payslip": forms.FileInput(attrs={"accept": ".pdf"}),
         }
@@ -62,6 +70,9 @@ class EmployerReviewMVPForm(forms.ModelForm):
             "culture_rating": "A rating from 1 to 5",
         }
         error_messages = {
+            "payslip": {
+                "empty": "The payslip is empty.",
+            },
             "company_domain": {
                 "invalid": "Please enter a valid domain name.",
             },
@@ -75,3 +86,11 @@ class EmployerReviewMVPForm(forms.ModelForm):
                 "invalid": "Please enter a valid number.",
             },
         }
+
+    def clean_payslip(self):
+        payslip = self.cleaned_data["payslip"]
+        # Uploads rejected while streaming, see uploads.PayslipUploadHandler
+        upload_error = getattr(payslip, "upload_error", None)
+        if upload_error is not None:
+            raise forms.ValidationError(upload_error)
+        return payslip
@@ -0,0 +1,80 @@
+import os
+import statistics
+import time
+
+from argon2.low_level import Type, hash_secret_raw
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Memory costs tried (KiB), from OWASP's minimum upwards
+MEMORY_COSTS = (19 * 1024, 32 * 1024, 46 * 1024, 64 * 1024, 96 * 1024, 128 * 1024)
+MAX_TIME_COST = 10
+
+
+class Command(BaseCommand):
+    help = "Measure argon2 on this host and recommend parameters hashing within a target time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms",
+            type=float,
+            default=250,
+            help="The longest a password hash may take, in milliseconds",
+        )
+        parser.add_argument(
+            "--max-memory-mib",
+            type=int,
+            default=64,
+            help="The most memory a single password hash may use, in MiB",
+        )
+        parser.add_argument("--samples", type=int, default=3, help="Hashes timed per setting")
+
+    def _measure(self, *, time_cost: int, memory_cost: int, samples: int) -> float:
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            hash_secret_raw(
+                b"calibration password",
+                os.urandom(16),
+                time_cost=time_cost,
+                memory_cost=memory_cost,
+                parallelism=1,
+                hash_len=32,
+                type=Type.ID,
+            )
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        target_ms = options["target_ms"]
+        memory_costs = [m for m in MEMORY_COSTS if m <= options["max_memory_mib"] * 1024]
+        best = None  # (time_cost * memory_cost, time_cost, memory_cost, milliseconds)
+        for memory_cost in memory_costs:
+            fitting = None
+            for time_cost in range(1, MAX_TIME_COST + 1):
+                milliseconds = self._measure(
+                    time_cost=time_cost, memory_cost=memory_cost, samples=options["samples"]
+                )
+                self.stdout.write(
+                    f"memory_cost={memory_cost} KiB time_cost={time_cost}: {milliseconds:.0f} ms"
+                )
+                if milliseconds > target_ms:
+                    break
+                fitting = (time_cost * memory_cost, time_cost, memory_cost, milliseconds)
+            if fitting is not None and (best is None or fitting > best):
+                best = fitting
+
+        if best is None:
+            self.stderr.write(
+                self.style.ERROR(f"No setting hashes within {target_ms:.0f} ms on this host")
+            )
+            return
+        _, time_cost, memory_cost, milliseconds = best
+        threads = settings.PASSWORD_HASHING_THREADS
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recommended: ARGON2_TIME_COST={time_cost} ARGON2_MEMORY_COST={memory_cost} "
+                f"({milliseconds:.0f} ms per hash, up to {threads * memory_cost // 1024} MiB "
+                f"per process with PASSWORD_HASHING_THREADS={threads})"
+            )
+        )
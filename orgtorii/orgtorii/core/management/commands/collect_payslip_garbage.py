@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from orgtorii.core.models import get_payslip_storage
+
+
+class Command(BaseCommand):
+    help = "Deduplicate stored payslips and remove payslip blobs which are no longer referenced"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deduplicated and removed",
+        )
+
+    def handle(self, *args, **options):
+        result = get_payslip_storage().collect_garbage(dry_run=options["dry_run"])
+        prefix = "Would have" if options["dry_run"] else "Have"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} deduplicated {result.adopted} payslips and removed "
+                f"{result.removed} unreferenced files ({filesizeformat(result.freed_bytes)})"
+            )
+        )
@@ -0,0 +1,40 @@
+import gzip
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Export the newsletter signups to a CSV or JSON lines file, gzipped if it ends in .gz"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", type=Path, help="The CSV (.csv) or JSON lines (.jsonl) file, e.g. list.csv.gz"
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="The file format, detected from the file extension by default",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of signups to fetch from the database at a time",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        extension = path.name.lower().removesuffix(".gz").rpartition(".")[2]
+        file_format = options["format"] or extension
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+
+        open_output = gzip.open if path.suffix.lower() == ".gz" else open
+        with open_output(path, "wt", encoding="utf-8", newline="") as output:
+            written = services.newsletter_signup_export(
+                output=output, file_format=file_format, chunk_size=options["chunk_size"]
+            )
+        self.stdout.write(self.style.SUCCESS(f"Exported {written} newsletter signups"))
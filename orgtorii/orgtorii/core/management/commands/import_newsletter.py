@@ -0,0 +1,91 @@
+import csv
+import gzip
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orgtorii import services
+
+
+def _open(path: Path):
+    if path.suffix.lower() == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return path.open(encoding="utf-8", newline="")
+
+
+def _read_csv(path: Path):
+    with _open(path) as f:
+        for row in csv.DictReader(f):
+            yield row.get("email")
+
+
+def _read_jsonl(path: Path):
+    with _open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line).get("email")
+
+
+class Command(BaseCommand):
+    help = (
+        "Subscribe the emails of a CSV or JSON lines file (gzipped if it ends in .gz) to "
+        "the newsletter. Emails already subscribed are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            type=Path,
+            help="The CSV (.csv) or JSON lines (.jsonl) file with an email column or key",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="The file format, detected from the file extension by default",
+        )
+        parser.add_argument(
+            "--run-size",
+            type=int,
+            default=100_000,
+            help="Number of emails sorted in memory at a time to find duplicates",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of emails to insert per transaction",
+        )
+        parser.add_argument(
+            "--rejected",
+            type=Path,
+            help="Where to write rejected emails, defaults to <path>.rejected.jsonl",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+        extension = path.name.lower().removesuffix(".gz").rpartition(".")[2]
+        file_format = options["format"] or extension
+        readers = {"csv": _read_csv, "jsonl": _read_jsonl}
+        if file_format not in readers:
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+
+        rejected_path = options["rejected"] or path.with_name(f"{path.name}.rejected.jsonl")
+        with rejected_path.open("a", encoding="utf-8") as rejected:
+            result = services.newsletter_signup_import(
+                emails=readers[file_format](path),
+                rejected=rejected,
+                run_size=options["run_size"],
+                batch_size=options["batch_size"],
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.imported} emails, skipped {result.duplicates} duplicates "
+                f"and rejected {result.rejected}"
+            )
+        )
+        if result.rejected:
+            self.stdout.write(f"Rejected emails were written to {rejected_path}")
@@ -0,0 +1,82 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orgtorii import services
+
+
+def _read_csv(path: Path):
+    with path.open(newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _read_jsonl(path: Path):
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import employer reviews in bulk from a CSV or JSON lines file. "
+        "Interrupted imports resume from the last committed chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="The CSV (.csv) or JSON lines (.jsonl) file")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="The file format, detected from the file extension by default",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows to validate and insert per transaction",
+        )
+        parser.add_argument(
+            "--rejected",
+            type=Path,
+            help="Where to write rejected rows, defaults to <path>.rejected.jsonl",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="The checkpoint name to resume from, defaults to the absolute path",
+        )
+        parser.add_argument(
+            "--skip-rebuild",
+            action="store_true",
+            help="Don't rebuild the rating aggregates and salary sketches afterwards",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist.")
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        readers = {"csv": _read_csv, "jsonl": _read_jsonl}
+        if file_format not in readers:
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+
+        rejected_path = options["rejected"] or path.with_name(f"{path.name}.rejected.jsonl")
+        with rejected_path.open("a", encoding="utf-8") as rejected:
+            result = services.review_import(
+                rows=readers[file_format](path),
+                source=options["checkpoint"] or str(path.resolve()),
+                rejected=rejected,
+                chunk_size=options["chunk_size"],
+                rebuild_statistics=not options["skip_rebuild"],
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.imported} reviews, rejected {result.rejected} "
+                f"and skipped {result.skipped} already imported"
+            )
+        )
+        if result.rejected:
+            self.stdout.write(f"Rejected rows were written to {rejected_path}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Link employer reviews without a company to their canonical company"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of reviews to update per transaction",
+        )
+
+    def handle(self, *args, **options):
+        linked = services.company_link_reviews(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} reviews to companies"))
@@ -0,0 +1,48 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Recompute the company leaderboards of every rating and location from the reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=services.LEADERBOARD_SIZE,
+            help="Number of companies kept per leaderboard",
+        )
+        parser.add_argument(
+            "--prior-reviews",
+            type=int,
+            default=services.LEADERBOARD_PRIOR_REVIEWS,
+            help="Reviews at the leaderboard's average every company's score starts with",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep rebuilding every this many minutes instead of once, e.g. from a process "
+            "manager rather than cron",
+        )
+
+    def rebuild(self, options):
+        written = services.leaderboard_rebuild(
+            size=options["size"], prior_reviews=options["prior_reviews"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} leaderboard entries"))
+
+    def handle(self, *args, **options):
+        if options["interval"] is None:
+            self.rebuild(options)
+            return
+        stop = threading.Event()
+        # Finish the rebuild before exiting
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+        while not stop.is_set():
+            self.rebuild(options)
+            stop.wait(options["interval"] * 60)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-company rating aggregates from all employer reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of aggregate rows to insert per query",
+        )
+
+    def handle(self, *args, **options):
+        written = services.company_rating_aggregate_rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rating aggregates"))
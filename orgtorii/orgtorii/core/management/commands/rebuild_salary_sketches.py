@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Rebuild the salary quantile sketches from all employer reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of reviews to fetch from the database at a time",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of sketches to insert per query",
+        )
+
+    def handle(self, *args, **options):
+        written = services.salary_sketch_rebuild(
+            chunk_size=options["chunk_size"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} salary sketches"))
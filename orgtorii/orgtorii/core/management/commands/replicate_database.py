@@ -0,0 +1,96 @@
+import signal
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orgtorii.db.replication import WALReplicator
+
+
+class Command(BaseCommand):
+    help = (
+        "Continuously back up the database to DATABASE_REPLICA_DIRECTORY by shipping its "
+        "WAL, and run its checkpoints. Restore it with the restore_database command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            type=Path,
+            help="The backup directory, DATABASE_REPLICA_DIRECTORY by default",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds between shipping the new WAL frames",
+        )
+        parser.add_argument(
+            "--snapshot-interval",
+            type=float,
+            default=24,
+            help="Hours between snapshots starting a new generation",
+        )
+        parser.add_argument(
+            "--snapshot-throttle",
+            type=float,
+            default=0.01,
+            help="Seconds to pause every 1024 pages copied to a snapshot",
+        )
+        parser.add_argument(
+            "--retain",
+            type=int,
+            default=2,
+            help="Number of generations to keep",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Ship the new WAL frames and checkpoint once instead of continuously",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICATION:
+            self.stderr.write(
+                self.style.WARNING(
+                    "DATABASE_REPLICATION is off: checkpoints run by the application can "
+                    "force new snapshots"
+                )
+            )
+        # Restart the WAL at the size it is truncated to
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_size_limit")
+            journal_size_limit = cursor.fetchone()[0]
+        connection.close()
+
+        directory = options["directory"] or Path(settings.DATABASE_REPLICA_DIRECTORY)
+        replicator = WALReplicator(
+            database=settings.DATABASES["default"]["NAME"],
+            directory=directory,
+            snapshot_interval=options["snapshot_interval"] * 60 * 60,
+            snapshot_throttle=options["snapshot_throttle"],
+            retain=options["retain"],
+            **({"max_wal_size": journal_size_limit} if journal_size_limit > 0 else {}),
+        )
+        try:
+            if options["once"]:
+                shipped = replicator.sync()
+                checkpoint = replicator.checkpoint()
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Shipped {shipped} WAL frames to {directory}"
+                        + (f", ran a {checkpoint} checkpoint" if checkpoint else "")
+                    )
+                )
+                return
+            stop = threading.Event()
+            # Finish shipping before exiting
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+            self.stdout.write(f"Replicating to {directory}")
+            replicator.run(interval=options["interval"], stop=stop)
+            self.stdout.write(self.style.SUCCESS("Replication stopped"))
+        finally:
+            replicator.close()
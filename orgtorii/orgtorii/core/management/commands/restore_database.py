@@ -0,0 +1,66 @@
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from orgtorii.db import replication
+
+
+class Command(BaseCommand):
+    help = (
+        "Restore the database from the backups of the replicate_database command. Stop "
+        "the application first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            type=Path,
+            help="The backup directory, DATABASE_REPLICA_DIRECTORY by default",
+        )
+        parser.add_argument(
+            "--generation",
+            help="The generation to restore, the latest by default",
+        )
+        parser.add_argument(
+            "--until",
+            type=datetime.fromisoformat,
+            help="Restore the transactions shipped until this ISO 8601 time",
+        )
+        parser.add_argument(
+            "--output",
+            type=Path,
+            help="Where to restore the database, the database of the application by default",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Overwrite the output if it exists",
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"] or Path(settings.DATABASES["default"]["NAME"])
+        if output.exists() and not options["force"]:
+            raise CommandError(f"{output} exists, pass --force to overwrite it.")
+        until = options["until"]
+        if until is not None and timezone.is_naive(until):
+            until = timezone.make_aware(until)
+
+        try:
+            result = replication.restore(
+                directory=options["directory"] or Path(settings.DATABASE_REPLICA_DIRECTORY),
+                target=output,
+                generation=options["generation"],
+                until=until,
+            )
+        except FileNotFoundError as e:
+            raise CommandError(str(e)) from e
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Restored generation {result.generation} and {result.segments} WAL segments "
+                f"to {output}, up to {result.restored_to.isoformat()}"
+            )
+        )
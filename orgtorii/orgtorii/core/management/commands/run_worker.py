@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from orgtorii import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs, such as payslip verification"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Maximum number of jobs to run at once",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more jobs",
+        )
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(concurrency=options["concurrency"])
+        # Finish the running jobs before exiting
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        self.stdout.write(f"Running jobs with a concurrency of {options['concurrency']}")
+        worker.run(burst=options["burst"])
+        self.stdout.write(self.style.SUCCESS("Worker stopped"))
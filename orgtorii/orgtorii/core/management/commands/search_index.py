@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from orgtorii import services
+
+
+class Command(BaseCommand):
+    help = "Rebuild or optimize the full-text search index of employer reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=["rebuild", "optimize"],
+            help="Rebuild the index from scratch or merge its segments",
+        )
+
+    def handle(self, *args, **options):
+        if options["action"] == "rebuild":
+            indexed = services.review_search_index_rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} reviews"))
+        else:
+            services.review_search_index_optimize()
+            self.stdout.write(self.style.SUCCESS("Optimized the search index"))
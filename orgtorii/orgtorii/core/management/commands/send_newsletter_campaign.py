@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template import TemplateDoesNotExist
+
+from orgtorii import mailing, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Send a newsletter campaign, rendered from the templates in "
+        "core/emails/newsletter/<campaign>/, to every subscriber. "
+        "Interrupted campaigns resume after the last subscriber sent to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("campaign", help="The name of the campaign templates directory")
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.NEWSLETTER_CAMPAIGN_RATE,
+            help="The maximum number of messages sent per second",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.NEWSLETTER_CAMPAIGN_THREADS,
+            help="The number of messages sent concurrently, each on its own connection",
+        )
+
+    def handle(self, *args, **options):
+        pool = mailing.EmailConnectionPool(
+            size=options["threads"], max_messages=settings.EMAIL_MAX_MESSAGES_PER_CONNECTION
+        )
+        try:
+            result = services.newsletter_campaign_send(
+                campaign=options["campaign"],
+                pool=pool,
+                rate=options["rate"],
+                threads=options["threads"],
+            )
+        except TemplateDoesNotExist as e:
+            raise CommandError(f"The campaign template {e} does not exist.") from e
+        finally:
+            pool.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Sent {result.sent} messages, {result.refused} were refused and "
+                f"{result.skipped} subscribers were sent the campaign before"
+            )
+        )
@@ -0,0 +1,56 @@
+# Generated by Django 5.1 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_employerreviewmvp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyRatingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('company_name', models.CharField(max_length=255)),
+                ('verified_only', models.BooleanField(default=False)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('culture_rating_sum', models.PositiveIntegerField(default=0)),
+                ('culture_rating_1', models.PositiveIntegerField(default=0)),
+                ('culture_rating_2', models.PositiveIntegerField(default=0)),
+                ('culture_rating_3', models.PositiveIntegerField(default=0)),
+                ('culture_rating_4', models.PositiveIntegerField(default=0)),
+                ('culture_rating_5', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_sum', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_1', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_2', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_3', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_4', models.PositiveIntegerField(default=0)),
+                ('work_life_balance_rating_5', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_sum', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_1', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_2', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_3', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_4', models.PositiveIntegerField(default=0)),
+                ('leadership_rating_5', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_sum', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_1', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_2', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_3', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_4', models.PositiveIntegerField(default=0)),
+                ('opportunities_rating_5', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_sum', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_1', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_2', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_3', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_4', models.PositiveIntegerField(default=0)),
+                ('compensation_rating_5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company_name', 'verified_only'), name='unique_company_rating_aggregate')],
+            },
+        ),
+    ]
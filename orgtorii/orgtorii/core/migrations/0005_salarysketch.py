@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_companyratingaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalarySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('company_name', models.CharField(max_length=255)),
+                ('job_title', models.CharField(max_length=255)),
+                ('currency', models.CharField(max_length=3)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('base_salary_digest', models.JSONField(default=dict)),
+                ('total_compensation_digest', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('company_name', 'job_title', 'currency'), name='unique_salary_sketch')],
+            },
+        ),
+    ]
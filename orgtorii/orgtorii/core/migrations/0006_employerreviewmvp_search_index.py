@@ -0,0 +1,71 @@
+# Full-text search index over employer reviews using SQLite FTS5
+# https://www.sqlite.org/fts5.html
+
+from django.db import migrations
+
+INDEXED_COLUMNS = "review_title, review, company_name, job_title, pros, cons"
+
+# The pros and cons are JSON lists, index their values rather than the raw JSON
+INSERT_ROW = """
+    INSERT INTO core_employerreviewmvp_fts(rowid, {columns})
+    VALUES (
+        {row}.id, {row}.review_title, {row}.review, {row}.company_name, {row}.job_title,
+        (SELECT group_concat(value, ' ') FROM json_each({row}.pros)),
+        (SELECT group_concat(value, ' ') FROM json_each({row}.cons))
+    );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_salarysketch'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS core_employerreviewmvp_fts USING fts5(
+                    {INDEXED_COLUMNS},
+                    tokenize = 'porter unicode61 remove_diacritics 2'
+                );
+                """,
+                f"""
+                CREATE TRIGGER IF NOT EXISTS core_employerreviewmvp_fts_insert
+                AFTER INSERT ON core_employerreviewmvp BEGIN
+                    {INSERT_ROW.format(columns=INDEXED_COLUMNS, row="new")}
+                END;
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_employerreviewmvp_fts_delete
+                AFTER DELETE ON core_employerreviewmvp BEGIN
+                    DELETE FROM core_employerreviewmvp_fts WHERE rowid = old.id;
+                END;
+                """,
+                f"""
+                CREATE TRIGGER IF NOT EXISTS core_employerreviewmvp_fts_update
+                AFTER UPDATE OF {INDEXED_COLUMNS} ON core_employerreviewmvp BEGIN
+                    DELETE FROM core_employerreviewmvp_fts WHERE rowid = old.id;
+                    {INSERT_ROW.format(columns=INDEXED_COLUMNS, row="new")}
+                END;
+                """,
+                # Index any existing reviews
+                f"""
+                INSERT INTO core_employerreviewmvp_fts(rowid, {INDEXED_COLUMNS})
+                SELECT
+                    id, review_title, review, company_name, job_title,
+                    (SELECT group_concat(value, ' ') FROM json_each(pros)),
+                    (SELECT group_concat(value, ' ') FROM json_each(cons))
+                FROM core_employerreviewmvp
+                WHERE id NOT IN (SELECT rowid FROM core_employerreviewmvp_fts);
+                """,
+            ],
+            reverse_sql=[
+                "DROP TRIGGER IF EXISTS core_employerreviewmvp_fts_update;",
+                "DROP TRIGGER IF EXISTS core_employerreviewmvp_fts_delete;",
+                "DROP TRIGGER IF EXISTS core_employerreviewmvp_fts_insert;",
+                "DROP TABLE IF EXISTS core_employerreviewmvp_fts;",
+            ],
+        ),
+    ]
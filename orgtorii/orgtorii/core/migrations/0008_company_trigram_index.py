@@ -0,0 +1,56 @@
+# Trigram index over normalized company names for substring autocomplete
+# https://www.sqlite.org/fts5.html#the_trigram_tokenizer
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_company'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS core_company_trigram USING fts5(
+                    normalized_name,
+                    tokenize = 'trigram'
+                );
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_company_trigram_insert
+                AFTER INSERT ON core_company BEGIN
+                    INSERT INTO core_company_trigram(rowid, normalized_name)
+                    VALUES (new.id, new.normalized_name);
+                END;
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_company_trigram_delete
+                AFTER DELETE ON core_company BEGIN
+                    DELETE FROM core_company_trigram WHERE rowid = old.id;
+                END;
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS core_company_trigram_update
+                AFTER UPDATE OF normalized_name ON core_company BEGIN
+                    DELETE FROM core_company_trigram WHERE rowid = old.id;
+                    INSERT INTO core_company_trigram(rowid, normalized_name)
+                    VALUES (new.id, new.normalized_name);
+                END;
+                """,
+                """
+                INSERT INTO core_company_trigram(rowid, normalized_name)
+                SELECT id, normalized_name FROM core_company
+                WHERE id NOT IN (SELECT rowid FROM core_company_trigram);
+                """,
+            ],
+            reverse_sql=[
+                "DROP TRIGGER IF EXISTS core_company_trigram_update;",
+                "DROP TRIGGER IF EXISTS core_company_trigram_delete;",
+                "DROP TRIGGER IF EXISTS core_company_trigram_insert;",
+                "DROP TABLE IF EXISTS core_company_trigram;",
+            ],
+        ),
+    ]
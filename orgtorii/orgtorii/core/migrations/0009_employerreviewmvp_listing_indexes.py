@@ -0,0 +1,33 @@
+# Generated by Django 5.1 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_company_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employerreviewmvp',
+            index=models.Index(fields=['created_at', 'id'], name='review_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employerreviewmvp',
+            index=models.Index(fields=['company', 'created_at', 'id'], name='review_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employerreviewmvp',
+            index=models.Index(fields=['company', 'verified', 'created_at', 'id'], name='review_company_verified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employerreviewmvp',
+            index=models.Index(fields=['verified', 'created_at', 'id'], name='review_verified_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employerreviewmvp',
+            index=models.Index(fields=['current_employee', 'created_at', 'id'], name='review_current_created_idx'),
+        ),
+    ]
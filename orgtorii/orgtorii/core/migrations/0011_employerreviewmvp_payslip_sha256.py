@@ -0,0 +1,53 @@
+# Generated by Django 5.1 on 2026-10-18 12:51
+
+import orgtorii.core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_importcheckpoint'),
+    ]
+
+    # SQLite can only add NOT NULL columns by rebuilding the table, which would drop the
+    # search index triggers, so the column is added with ALTER TABLE instead
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=[
+                        """
+                        ALTER TABLE core_employerreviewmvp
+                        ADD COLUMN payslip_sha256 varchar(64) NOT NULL DEFAULT '';
+                        """,
+                        """
+                        CREATE INDEX core_employerreviewmvp_payslip_sha256
+                        ON core_employerreviewmvp (payslip_sha256);
+                        """,
+                    ],
+                    reverse_sql=[
+                        "DROP INDEX core_employerreviewmvp_payslip_sha256;",
+                        "ALTER TABLE core_employerreviewmvp DROP COLUMN payslip_sha256;",
+                    ],
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='employerreviewmvp',
+                    name='payslip_sha256',
+                    field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+                ),
+            ],
+        ),
+        # The storage only exists in Python, the column is unchanged
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='employerreviewmvp',
+                    name='payslip',
+                    field=models.FileField(blank=True, storage=orgtorii.core.models.get_payslip_storage, upload_to=orgtorii.core.models.get_payslip_upload_path),
+                ),
+            ],
+        ),
+    ]
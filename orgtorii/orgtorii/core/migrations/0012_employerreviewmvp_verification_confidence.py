@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_employerreviewmvp_payslip_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employerreviewmvp',
+            name='verification_confidence',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
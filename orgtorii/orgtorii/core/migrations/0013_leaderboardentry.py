@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-18 14:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_employerreviewmvp_verification_confidence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating_field', models.CharField(choices=[('culture_rating', 'culture_rating'), ('work_life_balance_rating', 'work_life_balance_rating'), ('leadership_rating', 'leadership_rating'), ('opportunities_rating', 'opportunities_rating'), ('compensation_rating', 'compensation_rating')], max_length=32)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('rank', models.PositiveIntegerField()),
+                ('company_name', models.CharField(max_length=255)),
+                ('score', models.FloatField()),
+                ('average', models.FloatField()),
+                ('review_count', models.PositiveIntegerField()),
+                ('company', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.company')),
+            ],
+            options={
+                'verbose_name_plural': 'leaderboard entries',
+                'indexes': [models.Index(fields=['rating_field', 'location', 'rank', 'company', 'company_name', 'score', 'average', 'review_count'], name='leaderboard_covering_idx')],
+            },
+        ),
+    ]
@@ -6,9 +6,24 @@ from typing import Any
 
 from django.core import validators
 from django.core.exceptions import ValidationError
+from django.core.files.storage import Storage, storages
 from django.db import models
 from typeid import TypeID
 
+# The 1-5 star rating fields on a review
+RATING_FIELDS = (
+    "culture_rating",
+    "work_life_balance_rating",
+    "leadership_rating",
+    "opportunities_rating",
+    "compensation_rating",
+)
+RATING_STARS = range(1, 6)
+# The FTS5 table indexing the review text, kept in sync by triggers (see migration 0006)
+REVIEW_SEARCH_TABLE = "core_employerreviewmvp_fts"
+# The FTS5 trigram table indexing company names, kept in sync by triggers (see migration 0008)
+COMPANY_TRIGRAM_TABLE = "core_company_trigram"
+
 _filename_ascii_strip_re = re.compile(r"[^A-Za-z0-9_.-]")
 _windows_device_files = {
     "CON",
@@ -63,6 +78,77 @@ def secure_filename(filename: str) -> str:
     return filename
 
 
+_company_name_strip_re = re.compile(r"[^\w\s]")
+_company_legal_suffixes = {
+    "ab",
+    "ag",
+    "as",
+    "bv",
+    "co",
+    "company",
+    "corp",
+    "corporation",
+    "gmbh",
+    "inc",
+    "incorporated",
+    "limited",
+    "llc",
+    "llp",
+    "ltd",
+    "nv",
+    "oy",
+    "plc",
+    "pty",
+    "sa",
+    "sarl",
+    "srl",
+}
+
+
+def normalize_company_name(name: str) -> str:
+    """Normalize a company name so different spellings of a company compare equal.
+
+    Accents, punctuation, case and trailing legal suffixes are removed.
+
+    >>> normalize_company_name("ACME, Inc.")
+    'acme'
+    >>> normalize_company_name("Société Générale S.A.")
+    'societe generale'
+
+    :param name: the company name as entered by a user
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char)).casefold()
+    name = name.replace("&", " and ").replace(".", "")
+    words = _company_name_strip_re.sub(" ", name).split()
+    while len(words) > 1 and words[-1] in _company_legal_suffixes:
+        words.pop()
+    return " ".join(words)
+
+
+def normalize_domain(domain: str) -> str:
+    """Normalize a domain name for comparison.
+
+    >>> normalize_domain("WWW.Example.com.")
+    'example.com'
+
+    :param domain: the domain name as entered by a user
+    """
+    domain = domain.strip().lower().rstrip(".")
+    return domain.removeprefix("www.")
+
+
+def normalize_location(location: str) -> str:
+    """Normalize a location so different spellings of a location compare equal.
+
+    >>> normalize_location("  New  York ")
+    'new york'
+
+    :param location: the location as entered by a user
+    """
+    return " ".join(location.split()).casefold()
+
+
 class NewsletterSignup(models.Model):
     email = models.EmailField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -88,6 +174,11 @@ def get_payslip_upload_path(instance: "EmployerReviewMVP", filename: str) -> str
     return f"employer_reviews/payslips/{instance.id}/{type_id}-{sanitized_filename}"
 
 
+def get_payslip_storage() -> Storage:
+    """Return the storage payslips are saved to, see ``settings.STORAGES``."""
+    return storages["payslips"]
+
+
 def validate_not_in_future(value: Any) -> Any:
     if not isinstance(value, date):
         raise ValidationError("The value must be a date.")
@@ -96,8 +187,41 @@ def validate_not_in_future(value: Any) -> Any:
     return value
 
 
+class Company(models.Model):
+    """The canonical record of a company reviews are written about.
+
+    Reviewers type the company name freely, so companies are identified by their
+    normalized name (see ``normalize_company_name``) and domain instead.
+    """
+
+    name = models.CharField(max_length=255)  # The name as first entered, for display
+    normalized_name = models.CharField(max_length=255)
+    domain = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "companies"
+        constraints = [
+            # Also serves prefix searches on normalized_name
+            models.UniqueConstraint(
+                fields=["normalized_name", "domain"],
+                name="unique_company_normalized_name_domain",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
 class EmployerReviewMVP(models.Model):
     # Company info
+    company = models.ForeignKey(
+        Company,
+        on_delete=models.SET_NULL,
+        related_name="reviews",
+        null=True,
+        blank=True,
+    )  # Linked automatically from the company name and domain
     company_name = models.CharField(max_length=255)
     company_domain = models.CharField(
         max_length=255, validators=[validators.DomainNameValidator()], blank=True
@@ -111,7 +235,12 @@ class EmployerReviewMVP(models.Model):
     tenure_months = models.PositiveSmallIntegerField()  # how long have they worked there
     current_employee = models.BooleanField(default=False)
     # Any employee proof
-    payslip = models.FileField(upload_to=get_payslip_upload_path, blank=True)
+    payslip = models.FileField(
+        upload_to=get_payslip_upload_path, storage=get_payslip_storage, blank=True
+    )
+    payslip_sha256 = models.CharField(
+        max_length=64, blank=True, db_index=True, editable=False
+    )  # Set when a payslip is saved, used to detect duplicate payslips
     # The review
     review_title = models.CharField(max_length=255, validators=[validators.MinLengthValidator(10)])
     review = models.TextField(validators=[validators.MinLengthValidator(160)])
@@ -158,7 +287,171 @@ class EmployerReviewMVP(models.Model):
     )  # e.g. bonuses, stock options
     # Metadata
     verified = models.BooleanField(default=False)  # Have we verified this review?
+    verification_confidence = models.FloatField(
+        null=True, blank=True, editable=False
+    )  # How well the payslip matches the company, 0-1, set by the payslip verification job
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Listings are ordered by (created_at, id), with the filters as leading columns
+        # so filtered pages are read straight from an index without sorting
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="review_created_idx"),
+            models.Index(fields=["company", "created_at", "id"], name="review_company_created_idx"),
+            models.Index(
+                fields=["company", "verified", "created_at", "id"],
+                name="review_company_verified_idx",
+            ),
+            models.Index(
+                fields=["verified", "created_at", "id"], name="review_verified_created_idx"
+            ),
+            models.Index(
+                fields=["current_employee", "created_at", "id"], name="review_current_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.company_name
+
+
+class CompanyRatingAggregate(models.Model):
+    """Precomputed rating totals for a company.
+
+    Each company has two rows: one over all reviews and one over verified reviews only.
+    Rows are updated incrementally whenever a review is saved or deleted so company
+    pages never need to scan the review table. Besides the count, every rating has a
+    running ``<rating>_sum`` and a per-star histogram ``<rating>_<star>``
+    (e.g. ``culture_rating_5``), both added below the class definition.
+
+    Bulk updates that bypass signals (e.g. ``QuerySet.update``) are not tracked, use the
+    ``rebuild_rating_aggregates`` management command to recompute from scratch.
+    """
+
+    company_name = models.CharField(max_length=255)
+    verified_only = models.BooleanField(default=False)
+    review_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company_name", "verified_only"],
+                name="unique_company_rating_aggregate",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company_name} ({'verified' if self.verified_only else 'all'})"
+
+    def average(self, rating_field: str) -> float | None:
+        """The mean value of a rating, or None if there are no reviews."""
+        if not self.review_count:
+            return None
+        return getattr(self, f"{rating_field}_sum") / self.review_count
+
+    def histogram(self, rating_field: str) -> list[int]:
+        """The number of reviews per star for a rating, ordered from 1 to 5 stars."""
+        return [getattr(self, f"{rating_field}_{star}") for star in RATING_STARS]
+
+
+for _rating_field in RATING_FIELDS:
+    CompanyRatingAggregate.add_to_class(
+        f"{_rating_field}_sum", models.PositiveIntegerField(default=0)
+    )
+    for _star in RATING_STARS:
+        CompanyRatingAggregate.add_to_class(
+            f"{_rating_field}_{_star}", models.PositiveIntegerField(default=0)
+        )
+
+
+class SalarySketch(models.Model):
+    """Quantile sketches of the salaries reported for a job title at a company.
+
+    Salaries are only comparable within a currency so each currency has its own sketch.
+    The digests are serialized ``orgtorii.sketches.TDigest`` instances, one over the base
+    salary and one over the total compensation (base + additional), so percentiles can be
+    answered without reading the reviews. Sketches for different job titles can be merged
+    to get company-wide figures.
+    """
+
+    company_name = models.CharField(max_length=255)
+    job_title = models.CharField(max_length=255)
+    currency = models.CharField(max_length=3)
+    review_count = models.PositiveIntegerField(default=0)
+    base_salary_digest = models.JSONField(default=dict)
+    total_compensation_digest = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company_name", "job_title", "currency"],
+                name="unique_salary_sketch",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company_name} - {self.job_title} ({self.currency})"
+
+
+class LeaderboardEntry(models.Model):
+    """A company's place on a precomputed leaderboard.
+
+    There is a leaderboard per rating and location, and one per rating over all locations
+    (``location`` is empty). Companies are ranked by the Bayesian average of the rating,
+    which pulls the average of companies with few reviews towards the average of all
+    companies on the leaderboard. Entries are only written by
+    ``services.leaderboard_rebuild``, which replaces a leaderboard at a time.
+
+    The index holds every column, so a page of a leaderboard is read from the index
+    alone, starting at its first rank.
+    """
+
+    rating_field = models.CharField(max_length=32, choices=[(f, f) for f in RATING_FIELDS])
+    location = models.CharField(max_length=255, blank=True)  # See normalize_location
+    rank = models.PositiveIntegerField()  # 1 is the best, unique per leaderboard
+    company = models.ForeignKey(
+        Company, on_delete=models.CASCADE, related_name="+", db_index=False
+    )  # Not indexed, the entries are replaced far more often than companies are deleted
+    company_name = models.CharField(max_length=255)
+    score = models.FloatField()  # The Bayesian average of the rating
+    average = models.FloatField()
+    review_count = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name_plural = "leaderboard entries"
+        indexes = [
+            models.Index(
+                fields=[
+                    "rating_field",
+                    "location",
+                    "rank",
+                    "company",
+                    "company_name",
+                    "score",
+                    "average",
+                    "review_count",
+                ],
+                name="leaderboard_covering_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.rating_field} {self.location or 'everywhere'} #{self.rank}: {self.company_name}"
+        )
+
+
+class ImportCheckpoint(models.Model):
+    """How far a long running import got, so it can resume after being interrupted.
+
+    The position is saved in the same transaction as the imported rows so rows are
+    never imported twice.
+    """
+
+    name = models.CharField(max_length=255, unique=True)  # Identifies the import source
+    position = models.PositiveBigIntegerField(default=0)  # e.g. the number of rows processed
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
@@ -0,0 +1,161 @@
+import functools
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from djstripe import models as djstripe_models
+from djstripe.signals import WEBHOOK_SIGNALS
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from orgtorii import jobs, permissions, selectors, services
+
+from . import models, uploads
+
+# The review values the company link and precomputed statistics depend on
+_TRACKED_REVIEW_FIELDS = tuple(
+    dict.fromkeys(
+        (
+            "company_domain",
+            *services.RATING_AGGREGATE_REVIEW_FIELDS,
+            *services.SALARY_SKETCH_REVIEW_FIELDS,
+        )
+    )
+)
+
+
+def _tracked_values(review: models.EmployerReviewMVP) -> dict:
+    return {field: getattr(review, field) for field in _TRACKED_REVIEW_FIELDS}
+
+
+@receiver(pre_save, sender=models.EmployerReviewMVP)
+def remember_previous_review_values(sender, instance, raw=False, **kwargs):
+    # Fetch the stored values so changes to the company and statistics can be detected
+    instance._previous_values = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_values = (
+        models.EmployerReviewMVP.objects.filter(pk=instance.pk)
+        .values(*_TRACKED_REVIEW_FIELDS, "payslip")
+        .first()
+    )
+
+
+@receiver(pre_save, sender=models.EmployerReviewMVP)
+def link_review_company(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance._previous_values
+    company_changed = previous is not None and (
+        previous["company_name"] != instance.company_name
+        or previous["company_domain"] != instance.company_domain
+    )
+    if instance.company_id is None or company_changed:
+        instance.company = services.company_get_or_create(
+            name=instance.company_name, domain=instance.company_domain
+        )
+
+
+@receiver(pre_save, sender=models.EmployerReviewMVP)
+def set_payslip_digest(sender, instance, raw=False, **kwargs):
+    payslip = instance.payslip
+    if raw or not payslip or payslip._committed:
+        return
+    # A new payslip is being saved, uploads streamed by PayslipUploadHandler are hashed already
+    instance._payslip_changed = True
+    instance.payslip_sha256 = getattr(payslip.file, "sha256", None) or uploads.file_sha256(
+        payslip.file
+    )
+
+
+@receiver(post_save, sender=models.EmployerReviewMVP)
+def queue_payslip_verification(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, "_payslip_changed", False):
+        return
+    instance._payslip_changed = False
+    # Parsing the payslip is slow, so it is left to a worker once the review is committed
+    transaction.on_commit(
+        functools.partial(jobs.enqueue, "review_payslip_verify", review_id=instance.id)
+    )
+
+
+def _delete_payslip_on_commit(name: str) -> None:
+    # The name is a link to the payslip's blob, which collect_payslip_garbage removes once
+    # no name links to it. Deleted after the commit, as a rollback keeps the review
+    transaction.on_commit(functools.partial(models.get_payslip_storage().delete, name))
+
+
+@receiver(post_save, sender=models.EmployerReviewMVP)
+def delete_replaced_payslip(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, "_previous_values", None)
+    if raw or previous is None or not previous["payslip"]:
+        return
+    if previous["payslip"] != instance.payslip.name:
+        _delete_payslip_on_commit(previous["payslip"])
+
+
+@receiver(post_delete, sender=models.EmployerReviewMVP)
+def delete_payslip(sender, instance, **kwargs):
+    if instance.payslip:
+        _delete_payslip_on_commit(instance.payslip.name)
+
+
+@receiver(post_save, sender=models.Company)
+def clear_company_autocomplete_cache(sender, instance, created=False, **kwargs):
+    if created:
+        selectors.company_autocomplete_cache_clear()
+        # Like the pricing cache below, also cleared once the company is committed
+        transaction.on_commit(selectors.company_autocomplete_cache_clear)
+
+
+# The Stripe events which change what the pricing page shows
+_PRICING_WEBHOOK_EVENTS = (
+    "plan.created",
+    "plan.deleted",
+    "plan.updated",
+    "price.created",
+    "price.deleted",
+    "price.updated",
+    "product.created",
+    "product.deleted",
+    "product.updated",
+)
+
+
+@receiver([WEBHOOK_SIGNALS[event] for event in _PRICING_WEBHOOK_EVENTS])
+@receiver([post_save, post_delete], sender=djstripe_models.Product)
+@receiver([post_save, post_delete], sender=djstripe_models.Price)
+def clear_pricing_cache(sender, **kwargs):
+    selectors.pricing_cache_clear()
+    # A request running before the change is committed may have cached the old products
+    # again, so the cache is cleared once more after the commit
+    transaction.on_commit(selectors.pricing_cache_clear)
+
+
+@receiver(post_save, sender=models.EmployerReviewMVP)
+def update_review_statistics_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_values", None)
+    current = _tracked_values(instance)
+    services.company_rating_aggregate_update(previous=previous, current=current)
+    services.salary_sketch_update(previous=previous, current=current)
+
+
+@receiver(post_delete, sender=models.EmployerReviewMVP)
+def update_review_statistics_on_delete(sender, instance, **kwargs):
+    previous = _tracked_values(instance)
+    services.company_rating_aggregate_update(previous=previous, current=None)
+    services.salary_sketch_update(previous=previous, current=None)
+
+
+@receiver([post_save, post_delete], sender=UserObjectPermission)
+@receiver([post_save, post_delete], sender=GroupObjectPermission)
+@receiver([post_save, post_delete], sender=Permission)
+@receiver(post_delete, sender=Group)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions(sender, **kwargs):
+    permissions.invalidate()
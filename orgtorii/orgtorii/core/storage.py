@@ -0,0 +1,217 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+@dataclass
+class GarbageCollectionResult:
+    adopted: int = 0  # Files which were deduplicated into a blob
+    removed: int = 0  # Unreferenced blobs and abandoned uploads
+    freed_bytes: int = 0
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """A file system storage which stores identical files only once.
+
+    The contents of every file are stored once as a blob named after their SHA-256
+    digest, ``.blobs/<ab>/<cd>/<abcd...>``, and each saved name is a hard link to its
+    blob. Names keep resolving like in a plain ``FileSystemStorage`` while duplicates take
+    no extra space, and the file system keeps the reference count of each blob: its link
+    count minus one. Deleting a name only removes the link, unreferenced blobs are removed
+    by ``collect_garbage``.
+
+    Files streamed by ``uploads.PayslipUploadHandler`` are already hashed and linked into
+    place without reading them again.
+
+    The location may be shared with other storages, e.g. ``MEDIA_ROOT``: only the plain
+    files in ``adopt_directory`` are taken for files of this storage by ``collect_garbage``.
+
+    With ``private`` the files have no URL, ``url`` raises rather than pointing to a
+    location under ``MEDIA_URL``.
+    """
+
+    blob_directory = ".blobs"
+    incoming_directory = ".incoming"
+    # Uploads still in the incoming directory after this many seconds were abandoned
+    abandoned_upload_age = 24 * 60 * 60
+
+    def __init__(self, *args, adopt_directory: str = "", private: bool = False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.adopt_directory = adopt_directory
+        self.private = private
+
+    def url(self, name):
+        if self.private:
+            raise NotImplementedError("Private files aren't served from a URL.")
+        return super().url(name)
+
+    def blob_path(self, digest: str) -> str:
+        """Return the absolute path of the blob with a SHA-256 hex digest."""
+        return os.path.join(self.location, self.blob_directory, digest[:2], digest[2:4], digest)
+
+    def reference_count(self, digest: str) -> int:
+        """Return the number of names referencing the blob with a SHA-256 hex digest."""
+        try:
+            return os.stat(self.blob_path(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        self._makedirs(os.path.dirname(full_path))
+        staged_path, digest, staged_here = self._stage(content)
+        try:
+            while True:
+                blob_path = self._store_blob(staged_path, digest)
+                try:
+                    os.link(blob_path, full_path)
+                except FileExistsError:
+                    # A new name is needed if the file exists
+                    name = self.get_available_name(name)
+                    full_path = self.path(name)
+                except FileNotFoundError:
+                    # The blob was garbage collected in the meantime, store it again
+                    continue
+                else:
+                    break
+        finally:
+            if staged_here:
+                os.unlink(staged_path)
+
+        # Ensure the saved path is always relative to the storage root
+        name = os.path.relpath(full_path, self.location)
+        return str(name).replace("\\", "/")
+
+    def _stage(self, content: File) -> tuple[str, str, bool]:
+        # Uploads streamed by PayslipUploadHandler are hashed and inside the storage already
+        digest = getattr(content, "sha256", None)
+        if digest and hasattr(content, "temporary_file_path"):
+            return content.temporary_file_path(), digest, False
+
+        incoming = os.path.join(self.location, self.incoming_directory)
+        self._makedirs(incoming)
+        sha256 = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(suffix=".upload", dir=incoming, delete=False) as file:
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                sha256.update(chunk)
+                file.write(chunk)
+        return file.name, sha256.hexdigest(), True
+
+    def _store_blob(self, path: str, digest: str) -> str:
+        blob_path = self.blob_path(digest)
+        self._makedirs(os.path.dirname(blob_path))
+        try:
+            os.link(path, blob_path)
+        except FileExistsError:
+            # Stored before, the new copy is discarded
+            pass
+        else:
+            if self.file_permissions_mode is not None:
+                os.chmod(blob_path, self.file_permissions_mode)
+        return blob_path
+
+    def _makedirs(self, directory: str) -> None:
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # os.makedirs() doesn't apply the mode to intermediate directories without the umask
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _scan(self, directory: str, exclude: str | None = None) -> Iterator[os.DirEntry]:
+        # Walk the tree depth first without listing it all in memory
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.path == exclude:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._scan(entry.path, exclude)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def adopt(self, name: str) -> bool:
+        """Replace a file saved before this storage was used with a link to its blob.
+
+        Args:
+            name (str): the name of the file
+
+        Returns:
+            bool: whether the file was replaced, False if it was a link to a blob already
+        """
+        full_path = self.path(name)
+        if os.stat(full_path).st_nlink > 1:
+            return False
+        with open(full_path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        blob_path = self._store_blob(full_path, digest)
+        if os.path.samefile(blob_path, full_path):
+            return True
+        # Swap the file for a link to the existing blob in a single rename
+        link_path = f"{full_path}.{digest[:8]}.link"
+        os.link(blob_path, link_path)
+        os.replace(link_path, full_path)
+        return True
+
+    def collect_garbage(self, *, dry_run: bool = False) -> GarbageCollectionResult:
+        """Deduplicate plain files into blobs and remove blobs nothing references anymore.
+
+        Files saved in ``adopt_directory`` before this storage was used are adopted first
+        (see ``adopt``) so their blobs are referenced. Uploads abandoned in the incoming
+        directory are removed as well.
+
+        Args:
+            dry_run (bool): only count what would be adopted and removed
+
+        Returns:
+            GarbageCollectionResult: the number of adopted and removed files
+        """
+        result = GarbageCollectionResult()
+        blobs = os.path.join(self.location, self.blob_directory)
+        incoming = os.path.join(self.location, self.incoming_directory)
+        abandoned_before = time.time() - self.abandoned_upload_age
+
+        for entry in self._scan(incoming):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                # Removed while scanning
+                continue
+            if stat.st_mtime < abandoned_before:
+                result.removed += 1
+                result.freed_bytes += stat.st_size
+                if not dry_run:
+                    os.unlink(entry.path)
+
+        for entry in self._scan(self.path(self.adopt_directory), exclude=blobs):
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_nlink == 1 and os.path.dirname(entry.path) != incoming:
+                result.adopted += 1
+                if not dry_run:
+                    self.adopt(os.path.relpath(entry.path, self.location))
+
+        for entry in self._scan(blobs):
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_nlink == 1:
+                result.removed += 1
+                result.freed_bytes += stat.st_size
+                if not dry_run:
+                    os.unlink(entry.path)
+        return result
@@ -0,0 +1,6 @@
+from orgtorii import jobs, services
+
+
+@jobs.register("review_payslip_verify", max_retries=3, retry_delay=30)
+def review_payslip_verify(*, review_id: int) -> None:
+    services.review_payslip_verify(review_id=review_id)
@@ -1,9 +1,60 @@
+import uuid
+
 from django import template
 from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 
 register = template.Library()
 
+# Cached fragments are keyed by the process, so markup changed by a deploy (which
+# restarts the processes) is never served from the cache
+_PROCESS_ID = uuid.uuid4().hex
+
 
 @register.simple_tag
 def project_display_name():
     return getattr(settings, "PROJECT_DISPLAY_NAME", "")
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.key = make_template_fragment_key(fragment_name, [_PROCESS_ID])
+
+    def render(self, context):
+        timeout = settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT
+        if not timeout:
+            return self.nodelist.render(context)
+        if self.vary_on:
+            vary_on = [_PROCESS_ID, *(variable.resolve(context) for variable in self.vary_on)]
+            key = make_template_fragment_key(self.fragment_name, vary_on)
+        else:
+            key = self.key
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, timeout)
+        return value
+
+
+@register.tag
+def fragmentcache(parser, token):
+    """Cache the rendered contents of a block shared by many pages.
+
+    Like Django's ``{% cache %}`` tag, the fragment is identified by its name and the
+    values of the variables it varies on. The timeout is
+    ``settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT``, ``0`` renders the block every time::
+
+        {% fragmentcache footer request.LANGUAGE_CODE %}
+            ...
+        {% endfragmentcache %}
+    """
+    nodelist = parser.parse(("endfragmentcache",))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    return FragmentCacheNode(nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]])
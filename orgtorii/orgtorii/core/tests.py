@@ -1,20 +1,53 @@
+import csv
+import functools
+import gzip
+import hashlib
+import json
+import os
+import smtplib
+import tempfile
+import time
 import uuid
+from concurrent.futures import Future
+from io import StringIO
+from pathlib import Path
 from sqlite3 import IntegrityError
+from unittest import mock
 
+import factory
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.forms import ValidationError
-from django.test import TestCase
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.html import escape
 from factory.django import DjangoModelFactory
 from factory.faker import Faker
 
+from orgtorii import jobs, mailing, newsletter, selectors, services
+
 from . import models as core_models
-from .forms import NewsletterSignupForm
+from .forms import EmployerReviewMVPForm, NewsletterSignupForm
+from .storage import ContentAddressedStorage
+from .uploads import PayslipUploadedFile
 
 
 class NewsletterTestCase(TestCase):
     email = f"{uuid.uuid4()}@example.com"
 
+    def setUp(self):
+        # Start every test with an empty signup buffer
+        patcher = mock.patch("orgtorii.newsletter._buffer", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_newsletter_signup_uses_correct_template(self):
         response = self.client.get(reverse("newsletter:signup"))
         self.assertEqual(response.status_code, 200)
@@ -32,6 +65,16 @@ class NewsletterTestCase(TestCase):
         self.client.post(reverse("newsletter:signup"), {"email": self.email})
         self.assertTrue(core_models.NewsletterSignup.objects.filter(email=self.email).exists())
 
+    @override_settings(NEWSLETTER_SIGNUP_WRITE_TIMEOUT=0)
+    def test_newsletter_signup_succeeds_when_write_is_slow(self):
+        with (
+            mock.patch.object(newsletter.NewsletterSignupBuffer, "add", return_value=Future()),
+            self.assertLogs("orgtorii.services", "WARNING"),
+        ):
+            response = self.client.post(reverse("newsletter:signup"), {"email": self.email})
+
+        self.assertRedirects(response, reverse("newsletter:signup_success"))
+
     def test_newsletter_signup_does_not_create_duplicate_signup(self):
         different_email = f"{uuid.uuid4()}@example.com"
         core_models.NewsletterSignup.objects.create(email=different_email)
@@ -71,6 +114,33 @@ class ComingSoonTestCase(TestCase):
         self.assertContains(response, 'id="newsletter-form"')
 
 
+@override_settings(TEMPLATE_FRAGMENT_CACHE_TIMEOUT=60)
+class FragmentCacheTestCase(TestCase):
+    def render(self, source, **context):
+        return Template("{% load core %}" + source).render(Context(context))
+
+    def test_fragment_is_rendered_once(self):
+        source = "{% fragmentcache " + uuid.uuid4().hex + " %}{{ value }}{% endfragmentcache %}"
+
+        self.assertEqual(self.render(source, value="a"), "a")
+        self.assertEqual(self.render(source, value="b"), "a")
+
+    def test_fragment_varies_on_variables(self):
+        name = uuid.uuid4().hex
+        source = "{% fragmentcache " + name + " language %}{{ value }}{% endfragmentcache %}"
+
+        self.assertEqual(self.render(source, language="en", value="a"), "a")
+        self.assertEqual(self.render(source, language="ja", value="b"), "b")
+        self.assertEqual(self.render(source, language="en", value="c"), "a")
+
+    @override_settings(TEMPLATE_FRAGMENT_CACHE_TIMEOUT=0)
+    def test_fragment_cache_can_be_disabled(self):
+        source = "{% fragmentcache uncached %}{{ value }}{% endfragmentcache %}"
+
+        self.assertEqual(self.render(source, value="a"), "a")
+        self.assertEqual(self.render(source, value="b"), "b")
+
+
 class EmployerReviewMVPTestCase(TestCase):
     class Factory(DjangoModelFactory):
         class Meta:
@@ -183,3 +253,1099 @@ class EmployerReviewMVPTestCase(TestCase):
         with self.assertRaises(IntegrityError) as cm:
             review.full_clean()
         print(cm.exception)
+
+
+class CompanyRatingAggregateTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+    ratings = {
+        "culture_rating": 5,
+        "work_life_balance_rating": 4,
+        "leadership_rating": 3,
+        "opportunities_rating": 2,
+        "compensation_rating": 1,
+    }
+
+    def aggregate(self, verified_only=False):
+        return selectors.company_rating_aggregate_get(
+            company_name="Acme", verified_only=verified_only
+        )
+
+    def test_review_is_added_to_aggregate(self):
+        self.Factory(company_name="Acme", verified=False, **self.ratings)
+        self.Factory(company_name="Acme", verified=False, **{**self.ratings, "culture_rating": 4})
+
+        aggregate = self.aggregate()
+        self.assertEqual(aggregate.review_count, 2)
+        self.assertEqual(aggregate.average("culture_rating"), 4.5)
+        self.assertEqual(aggregate.histogram("culture_rating"), [0, 0, 0, 1, 1])
+        self.assertEqual(aggregate.histogram("compensation_rating"), [2, 0, 0, 0, 0])
+        self.assertIsNone(self.aggregate(verified_only=True))
+
+    def test_submitted_review_is_added_to_aggregate(self):
+        fields = factory.build(dict, FACTORY_CLASS=self.Factory)
+        fields.update(company_name="Acme", verified=False, **self.ratings)
+
+        review = services.review_create(fields=fields)
+
+        self.assertEqual(review.company.name, "Acme")
+        self.assertEqual(self.aggregate().review_count, 1)
+
+    def test_deleted_review_is_removed_from_aggregate(self):
+        review = self.Factory(company_name="Acme", verified=True, **self.ratings)
+        review.delete()
+
+        for verified_only in (False, True):
+            aggregate = self.aggregate(verified_only=verified_only)
+            self.assertEqual(aggregate.review_count, 0)
+            self.assertIsNone(aggregate.average("culture_rating"))
+            self.assertEqual(aggregate.histogram("culture_rating"), [0, 0, 0, 0, 0])
+
+    def test_verified_review_is_added_to_verified_aggregate(self):
+        review = self.Factory(company_name="Acme", verified=False, **self.ratings)
+        services.review_verify(review=review)
+
+        self.assertEqual(self.aggregate().review_count, 1)
+        self.assertEqual(self.aggregate(verified_only=True).review_count, 1)
+        self.assertEqual(self.aggregate(verified_only=True).culture_rating_5, 1)
+
+    def test_changed_rating_moves_between_stars(self):
+        review = self.Factory(company_name="Acme", verified=False, **self.ratings)
+        review.culture_rating = 1
+        review.save()
+
+        aggregate = self.aggregate()
+        self.assertEqual(aggregate.review_count, 1)
+        self.assertEqual(aggregate.culture_rating_sum, 1)
+        self.assertEqual(aggregate.histogram("culture_rating"), [1, 0, 0, 0, 0])
+
+    def test_rebuild_matches_incremental_updates(self):
+        for _ in range(5):
+            self.Factory(company_name="Acme")
+        self.Factory(company_name="Other Co")
+        expected = {
+            (aggregate.company_name, aggregate.verified_only): aggregate
+            for aggregate in core_models.CompanyRatingAggregate.objects.all()
+        }
+
+        call_command("rebuild_rating_aggregates", batch_size=1, stdout=StringIO())
+
+        rebuilt = core_models.CompanyRatingAggregate.objects.all()
+        self.assertEqual(len(rebuilt), len(expected))
+        for aggregate in rebuilt:
+            previous = expected[(aggregate.company_name, aggregate.verified_only)]
+            self.assertEqual(aggregate.review_count, previous.review_count)
+            for field in core_models.RATING_FIELDS:
+                self.assertEqual(aggregate.histogram(field), previous.histogram(field))
+                self.assertEqual(
+                    getattr(aggregate, f"{field}_sum"), getattr(previous, f"{field}_sum")
+                )
+
+
+class SalaryStatisticsTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+
+    def create_reviews(self, salaries, **kwargs):
+        return [
+            self.Factory(
+                company_name="Acme",
+                job_title="Engineer",
+                currency="EUR",
+                base_annual_salary=salary,
+                additional_annual_compensation=1_000,
+                **kwargs,
+            )
+            for salary in salaries
+        ]
+
+    def test_new_reviews_update_percentiles(self):
+        self.create_reviews([40_000, 50_000, 60_000])
+
+        statistics = selectors.salary_statistics_get(
+            company_name="Acme", job_title="Engineer", currency="EUR"
+        )
+        self.assertEqual(statistics.count, 3)
+        self.assertEqual(statistics.median, 50_000)
+        total = selectors.salary_statistics_get(
+            company_name="Acme", currency="EUR", total_compensation=True
+        )
+        self.assertEqual(total.median, 51_000)
+
+    def test_salaries_are_split_by_currency(self):
+        self.create_reviews([40_000, 50_000, 60_000])
+
+        self.assertIsNone(selectors.salary_statistics_get(company_name="Acme", currency="USD"))
+
+    def test_job_titles_are_merged_for_company(self):
+        self.create_reviews([40_000, 50_000])
+        self.Factory(
+            company_name="Acme", job_title="Manager", currency="EUR", base_annual_salary=90_000
+        )
+
+        statistics = selectors.salary_statistics_get(company_name="Acme", currency="EUR")
+        self.assertEqual(statistics.count, 3)
+        self.assertEqual(statistics.median, 50_000)
+
+    def test_deleted_review_is_removed_from_percentiles(self):
+        reviews = self.create_reviews([40_000, 50_000, 60_000])
+        reviews[-1].delete()
+
+        statistics = selectors.salary_statistics_get(company_name="Acme", currency="EUR")
+        self.assertEqual(statistics.count, 2)
+        self.assertEqual(statistics.median, 45_000)
+
+    def test_reviews_without_salary_are_ignored(self):
+        self.create_reviews([None])
+
+        self.assertFalse(core_models.SalarySketch.objects.exists())
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.create_reviews(range(10_000, 110_000, 5_000))
+        expected = selectors.salary_statistics_get(company_name="Acme", currency="EUR")
+
+        call_command("rebuild_salary_sketches", chunk_size=3, batch_size=1, stdout=StringIO())
+
+        self.assertEqual(core_models.SalarySketch.objects.count(), 1)
+        self.assertEqual(
+            selectors.salary_statistics_get(company_name="Acme", currency="EUR"), expected
+        )
+
+
+class ReviewSearchTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+
+    def search(self, query, **kwargs):
+        return selectors.review_search(query=query, **kwargs)
+
+    def test_search_matches_review_text(self):
+        review = self.Factory(review="The onboarding was zorbtastic. " * 10)
+        self.Factory(review="Nothing to see here. " * 10)
+
+        self.assertEqual(self.search("zorbtastic").reviews, [review])
+
+    def test_search_matches_pros_and_cons(self):
+        review = self.Factory(pros=["Flexiblest hours"], cons=["Tiny café"])
+
+        self.assertEqual(self.search("flexiblest").reviews, [review])
+        self.assertEqual(self.search("cafe").reviews, [review])
+
+    def test_search_ranks_company_name_above_review_text(self):
+        mention = self.Factory(
+            company_name="Other Co", review="I moved here from Zentrix. " + "It was fine. " * 15
+        )
+        company = self.Factory(company_name="Zentrix")
+
+        self.assertEqual(self.search("zentrix").reviews, [company, mention])
+
+    def test_search_matches_prefix_of_last_term(self):
+        review = self.Factory(job_title="Xylophonist Engineer")
+
+        self.assertEqual(self.search("xylophonist eng").reviews, [review])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        review = self.Factory(job_title="Xylophonist")
+        review.job_title = "Zitherist"
+        review.save()
+
+        self.assertEqual(self.search("xylophonist").reviews, [])
+        self.assertEqual(self.search("zitherist").reviews, [review])
+        review.delete()
+        self.assertEqual(self.search("zitherist").reviews, [])
+
+    def test_search_is_paginated(self):
+        for _ in range(3):
+            self.Factory(job_title="Xylophonist")
+
+        first = self.search("xylophonist", page_size=2)
+        second = self.search("xylophonist", page=2, page_size=2)
+
+        self.assertEqual(len(first.reviews), 2)
+        self.assertTrue(first.has_next)
+        self.assertEqual(len(second.reviews), 1)
+        self.assertFalse(second.has_next)
+
+    def test_search_ignores_query_syntax(self):
+        review = self.Factory(job_title="Xylophonist")
+
+        self.assertEqual(self.search('"xylophonist*" (').reviews, [review])
+        self.assertEqual(self.search('"*(').reviews, [])
+
+    def test_rebuild_search_index(self):
+        review = self.Factory(job_title="Xylophonist")
+
+        call_command("search_index", "rebuild", stdout=StringIO())
+        call_command("search_index", "optimize", stdout=StringIO())
+
+        self.assertEqual(self.search("xylophonist").reviews, [review])
+
+
+class CompanyTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+
+    def setUp(self):
+        selectors.company_autocomplete_cache_clear()
+
+    def test_company_names_are_normalized(self):
+        for name in ("Acme Inc", "ACME, Inc.", "acme", "  Acme  LLC "):
+            self.assertEqual(core_models.normalize_company_name(name), "acme")
+        self.assertEqual(core_models.normalize_company_name("Inc"), "inc")
+
+    def test_reviews_of_same_company_are_linked(self):
+        first = self.Factory(company_name="Acme Inc", company_domain="")
+        second = self.Factory(company_name="ACME, Inc.", company_domain="acme.com")
+        third = self.Factory(company_name="acme", company_domain="www.acme.com")
+
+        self.assertEqual(core_models.Company.objects.count(), 1)
+        self.assertEqual(first.company, second.company)
+        self.assertEqual(second.company, third.company)
+        self.assertEqual(first.company.name, "Acme Inc")
+        self.assertEqual(third.company.domain, "acme.com")
+
+    def test_same_name_with_different_domains_are_different_companies(self):
+        first = self.Factory(company_name="Acme", company_domain="acme.com")
+        second = self.Factory(company_name="Acme", company_domain="acme.org")
+
+        self.assertNotEqual(first.company, second.company)
+
+    def test_changed_company_name_relinks_review(self):
+        review = self.Factory(company_name="Acme", company_domain="")
+        review.company_name = "Globex"
+        review.save()
+
+        self.assertEqual(review.company.normalized_name, "globex")
+
+    def test_autocomplete_matches_prefix_then_substring(self):
+        self.Factory(company_name="Globex Corporation", company_domain="")
+        self.Factory(company_name="Globe Trotters", company_domain="")
+        self.Factory(company_name="Big Globe Ltd", company_domain="")
+        self.Factory(company_name="Initech", company_domain="")
+
+        suggestions = selectors.company_autocomplete(query="Glob")
+
+        self.assertEqual(
+            [suggestion.name for suggestion in suggestions],
+            ["Globe Trotters", "Globex Corporation", "Big Globe Ltd"],
+        )
+
+    def test_autocomplete_caches_hot_prefixes(self):
+        self.Factory(company_name="Globex", company_domain="")
+        selectors.company_autocomplete(query="glo")
+
+        with self.assertNumQueries(0):
+            suggestions = selectors.company_autocomplete(query="GLO")
+        self.assertEqual(len(suggestions), 1)
+
+    def test_autocomplete_cache_is_cleared_by_new_company(self):
+        self.Factory(company_name="Globex", company_domain="")
+        selectors.company_autocomplete(query="glo")
+        self.Factory(company_name="Globe Trotters", company_domain="")
+
+        self.assertEqual(len(selectors.company_autocomplete(query="glo")), 2)
+
+    def test_autocomplete_cache_is_cleared_by_another_process(self):
+        self.Factory(company_name="Globex", company_domain="")
+        selectors.company_autocomplete(query="glo")
+        # Added without signals, as if by another process
+        core_models.Company.objects.bulk_create(
+            [core_models.Company(name="Globe Trotters", normalized_name="globe trotters")]
+        )
+        self.assertEqual(len(selectors.company_autocomplete(query="glo")), 1)
+
+        # What company_autocomplete_cache_clear does in the other process
+        cache.delete(selectors.COMPANY_AUTOCOMPLETE_GENERATION_KEY)
+
+        self.assertEqual(len(selectors.company_autocomplete(query="glo")), 2)
+
+    def test_autocomplete_view_returns_htmx_fragment(self):
+        self.Factory(company_name="Globex", company_domain="globex.com")
+
+        response = self.client.get(
+            reverse("core:company_autocomplete"), {"company_name": "glo"}, HTTP_HX_REQUEST="true"
+        )
+
+        self.assertTemplateUsed(response, "core/fragments/company_autocomplete.html")
+        self.assertContains(response, 'value="Globex"')
+
+    def test_autocomplete_view_returns_json(self):
+        review = self.Factory(company_name="Globex", company_domain="globex.com")
+
+        response = self.client.get(reverse("core:company_autocomplete"), {"company_name": "glo"})
+
+        self.assertEqual(
+            response.json(),
+            {"results": [{"id": review.company_id, "name": "Globex", "domain": "globex.com"}]},
+        )
+
+    def test_link_review_companies_command(self):
+        self.Factory(company_name="Acme Inc", company_domain="")
+        self.Factory(company_name="acme", company_domain="")
+        self.Factory(company_name="Globex", company_domain="")
+        core_models.EmployerReviewMVP.objects.update(company=None)
+        core_models.Company.objects.all().delete()
+
+        call_command("link_review_companies", batch_size=2, stdout=StringIO())
+
+        self.assertFalse(core_models.EmployerReviewMVP.objects.filter(company=None).exists())
+        self.assertEqual(core_models.Company.objects.count(), 2)
+
+
+class LeaderboardTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+
+    def setUp(self):
+        # One great review, many good ones and many poor ones
+        review = functools.partial(self.Factory.create_batch, company_domain="")
+        review(1, company_name="Acme", location="Berlin", work_life_balance_rating=5)
+        review(5, company_name="Globex", location="Paris", work_life_balance_rating=4)
+        review(5, company_name="Initech", location=" berlin ", work_life_balance_rating=2)
+
+    def names(self, **kwargs):
+        entries = selectors.leaderboard_list(rating_field="work_life_balance_rating", **kwargs)
+        return [entry.company_name for entry in entries]
+
+    def test_few_reviews_are_pulled_towards_the_average(self):
+        services.leaderboard_rebuild()
+
+        self.assertEqual(self.names(), ["Globex", "Acme", "Initech"])
+        acme = selectors.leaderboard_list(rating_field="work_life_balance_rating", limit=2)[1]
+        self.assertEqual(acme.average, 5)
+        self.assertLess(acme.score, 4)
+
+    def test_leaderboards_per_location(self):
+        services.leaderboard_rebuild()
+
+        self.assertEqual(self.names(location="BERLIN"), ["Acme", "Initech"])
+        self.assertEqual(self.names(location="Paris"), ["Globex"])
+        self.assertEqual(self.names(location="Paris", offset=1), [])
+
+    def test_rebuild_replaces_leaderboards(self):
+        services.leaderboard_rebuild()
+        core_models.EmployerReviewMVP.objects.filter(company_name="Globex").delete()
+
+        call_command("rebuild_leaderboards", size=1, stdout=StringIO())
+
+        self.assertEqual(self.names(), ["Acme"])
+        self.assertEqual(self.names(location="Paris"), [])
+
+    def test_leaderboards_are_replaced_one_at_a_time(self):
+        services.leaderboard_rebuild()
+        core_models.EmployerReviewMVP.objects.filter(company_name="Globex").delete()
+
+        with mock.patch.object(
+            services, "_leaderboard_replace", wraps=services._leaderboard_replace
+        ) as replace:
+            services.leaderboard_rebuild()
+
+        # Every rating everywhere and in Berlin, then the leaderboards of Paris are deleted
+        self.assertEqual(replace.call_count, 3 * len(core_models.RATING_FIELDS))
+        boards = {
+            (call.kwargs["rating_field"], call.kwargs["location"]) for call in replace.mock_calls
+        }
+        self.assertEqual({location for _, location in boards}, {"", "berlin", "paris"})
+        self.assertFalse(core_models.LeaderboardEntry.objects.filter(location="paris").exists())
+
+    def test_pages_are_read_from_covering_index(self):
+        services.leaderboard_rebuild()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.names(location="berlin", offset=1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("COVERING INDEX leaderboard_covering_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_view_returns_json(self):
+        services.leaderboard_rebuild()
+
+        response = self.client.get(
+            reverse("core:company_leaderboard"),
+            {"rating": "work_life_balance", "location": "Paris"},
+        )
+
+        [result] = response.json()["results"]
+        self.assertEqual(result["company_name"], "Globex")
+        self.assertEqual(result["rank"], 1)
+        self.assertEqual(result["review_count"], 5)
+
+    def test_view_returns_htmx_fragment(self):
+        services.leaderboard_rebuild()
+
+        response = self.client.get(
+            reverse("core:company_leaderboard"),
+            {"rating": "work_life_balance", "limit": 1},
+            HTTP_HX_REQUEST="true",
+        )
+
+        self.assertTemplateUsed(response, "core/fragments/leaderboard.html")
+        self.assertContains(response, "Globex")
+        self.assertNotContains(response, "Acme")
+
+    def test_view_rejects_unknown_rating(self):
+        for params in ({"rating": "salary"}, {"rating": "culture", "limit": 1000}):
+            with self.subTest(**params):
+                response = self.client.get(reverse("core:company_leaderboard"), params)
+                self.assertEqual(response.status_code, 400)
+
+
+class ReviewListTestCase(TestCase):
+    Factory = EmployerReviewMVPTestCase.Factory
+
+    def test_pages_follow_each_other(self):
+        reviews = [self.Factory() for _ in range(5)]
+        # Reviews created at the same time are ordered by id
+        core_models.EmployerReviewMVP.objects.filter(id__in=[r.id for r in reviews[1:4]]).update(
+            created_at=reviews[2].created_at
+        )
+
+        seen = []
+        cursor = None
+        for _ in range(3):
+            page = selectors.review_list(cursor=cursor, page_size=2)
+            seen.extend(review.id for review in page.reviews)
+            cursor = page.next_cursor
+
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, [review.id for review in reversed(reviews)])
+
+    def test_filters(self):
+        company_review = self.Factory(company_name="Acme", verified=True, current_employee=True)
+        self.Factory(company_name="Acme", verified=False, current_employee=True)
+        self.Factory(company_name="Globex", verified=True, current_employee=False)
+
+        page = selectors.review_list(
+            company_id=company_review.company_id, verified=True, current_employee=True
+        )
+
+        self.assertEqual(page.reviews, [company_review])
+        self.assertIsNone(page.next_cursor)
+
+    def test_invalid_cursor_raises_error(self):
+        with self.assertRaises(ValueError):
+            selectors.review_list(cursor="not-a-cursor")
+
+    def test_only_card_columns_are_loaded(self):
+        self.Factory()
+
+        review = selectors.review_list().reviews[0]
+
+        self.assertIn("review", review.get_deferred_fields())
+        self.assertNotIn("review_title", review.get_deferred_fields())
+
+    def test_filtered_pages_are_not_sorted(self):
+        review = self.Factory()
+        page = selectors.review_list(page_size=1)
+        filters = [
+            {},
+            {"company_id": review.company_id},
+            {"company_id": review.company_id, "verified": True},
+            {"company_id": review.company_id, "current_employee": True},
+            {"verified": False},
+            {"current_employee": False},
+            {"verified": True, "current_employee": False},
+        ]
+        for kwargs in filters:
+            with self.subTest(**kwargs), CaptureQueriesContext(connection) as queries:
+                selectors.review_list(cursor=page.next_cursor or None, **kwargs)
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+                plan = " ".join(row[-1] for row in cursor.fetchall())
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_view_renders_page(self):
+        self.Factory(review_title="A review worth reading")
+
+        response = self.client.get(reverse("core:review_list"))
+
+        self.assertTemplateUsed(response, "core/pages/reviews/list.html")
+        self.assertContains(response, "A review worth reading")
+
+    def test_view_returns_next_page_fragment_to_htmx(self):
+        for _ in range(21):
+            self.Factory(verified=False)
+
+        response = self.client.get(reverse("core:review_list"), {"verified": "false"})
+        next_url = response.context["next_query"]
+        response = self.client.get(
+            f"{reverse('core:review_list')}?{next_url}", HTTP_HX_REQUEST="true"
+        )
+
+        self.assertIn("verified=false", next_url)
+        self.assertTemplateUsed(response, "core/fragments/reviews/list.html")
+        self.assertTemplateNotUsed(response, "orgtorii/base.html")
+        self.assertEqual(len(response.context["reviews"]), 1)
+
+    def test_view_rejects_invalid_filters(self):
+        response = self.client.get(reverse("core:review_list"), {"verified": "maybe"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportReviewsTestCase(TestCase):
+    row = {
+        "company_name": "Acme Inc",
+        "company_domain": "acme.com",
+        "job_title": "Engineer",
+        "location": "Berlin",
+        "estimated_review_date": "2024-01-31",
+        "tenure_months": "24",
+        "current_employee": "true",
+        "review_title": "A decent place to work",
+        "review": "The work is interesting and the people are kind. " * 5,
+        "culture_rating": "4",
+        "work_life_balance_rating": "5",
+        "leadership_rating": "3",
+        "opportunities_rating": "2",
+        "compensation_rating": "4",
+        "pros": '["Remote work"]',
+        "cons": "[]",
+        "currency": "EUR",
+        "base_annual_salary": "60000",
+        "additional_annual_compensation": "",
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_csv(self, rows):
+        path = self.directory / "reviews.csv"
+        with path.open("w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.row))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def import_reviews(self, path, **options):
+        call_command("import_reviews", str(path), stdout=StringIO(), **options)
+
+    def test_imports_csv(self):
+        path = self.write_csv([self.row, {**self.row, "company_name": "ACME, Inc."}])
+
+        self.import_reviews(path, chunk_size=1)
+
+        reviews = core_models.EmployerReviewMVP.objects.all()
+        self.assertEqual(reviews.count(), 2)
+        review = reviews.first()
+        self.assertEqual(review.pros, ["Remote work"])
+        self.assertTrue(review.current_employee)
+        self.assertIsNone(review.additional_annual_compensation)
+        self.assertEqual(core_models.Company.objects.count(), 1)
+        self.assertEqual(review.company.domain, "acme.com")
+
+    def test_imports_jsonl(self):
+        path = self.directory / "reviews.jsonl"
+        row = {**self.row, "pros": ["Remote work"], "tenure_months": 24, "current_employee": False}
+        del row["currency"]
+        path.write_text(json.dumps(row) + "\n")
+
+        self.import_reviews(path)
+
+        review = core_models.EmployerReviewMVP.objects.get()
+        self.assertEqual(review.currency, "USD")
+        self.assertEqual(review.tenure_months, 24)
+
+    def test_imports_rows_without_domain(self):
+        path = self.directory / "reviews.jsonl"
+        without_domain = {**self.row}
+        del without_domain["company_domain"]
+        null_domain = {**self.row, "company_domain": None}
+        path.write_text(json.dumps(without_domain) + "\n" + json.dumps(null_domain) + "\n")
+
+        self.import_reviews(path)
+
+        reviews = core_models.EmployerReviewMVP.objects.all()
+        self.assertEqual(reviews.count(), 2)
+        self.assertEqual({review.company_domain for review in reviews}, {""})
+
+    def test_invalid_rows_are_rejected_to_side_file(self):
+        invalid = {
+            **self.row,
+            "company_domain": "not a domain",
+            "culture_rating": "6",
+            "estimated_review_date": "2999-01-01",
+            "review": "Too short",
+        }
+        path = self.write_csv([self.row, invalid])
+
+        self.import_reviews(path)
+
+        self.assertEqual(core_models.EmployerReviewMVP.objects.count(), 1)
+        rejected = [
+            json.loads(line)
+            for line in (self.directory / "reviews.csv.rejected.jsonl").read_text().splitlines()
+        ]
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0]["row"], 2)
+        self.assertEqual(
+            set(rejected[0]["errors"]),
+            {"company_domain", "culture_rating", "estimated_review_date", "review"},
+        )
+
+    def test_import_resumes_from_checkpoint(self):
+        path = self.write_csv([self.row] * 5)
+        core_models.ImportCheckpoint.objects.create(name="partner", position=3)
+
+        self.import_reviews(path, checkpoint="partner", chunk_size=1)
+        self.import_reviews(path, checkpoint="partner")
+
+        self.assertEqual(core_models.EmployerReviewMVP.objects.count(), 2)
+        self.assertEqual(core_models.ImportCheckpoint.objects.get(name="partner").position, 5)
+
+    def test_import_rebuilds_statistics(self):
+        path = self.write_csv([self.row, self.row])
+
+        self.import_reviews(path)
+
+        aggregate = selectors.company_rating_aggregate_get(company_name="Acme Inc")
+        self.assertEqual(aggregate.review_count, 2)
+        statistics = selectors.salary_statistics_get(company_name="Acme Inc", currency="EUR")
+        self.assertEqual(statistics.median, 60_000)
+
+
+class NewsletterImportExportTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_export_streams_signups(self):
+        for email in ("jane@example.com", "john@example.com"):
+            core_models.NewsletterSignup.objects.create(email=email)
+
+        path = self.directory / "list.jsonl.gz"
+        call_command("export_newsletter", str(path), chunk_size=1, stdout=StringIO())
+
+        with gzip.open(path, "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["email"] for row in rows], ["jane@example.com", "john@example.com"])
+
+    def test_export_and_import_round_trip(self):
+        core_models.NewsletterSignup.objects.create(email="jane@example.com")
+        path = self.directory / "list.csv"
+        call_command("export_newsletter", str(path), stdout=StringIO())
+        core_models.NewsletterSignup.objects.all().delete()
+
+        call_command("import_newsletter", str(path), stdout=StringIO())
+
+        self.assertEqual(
+            list(core_models.NewsletterSignup.objects.values_list("email", flat=True)),
+            ["jane@example.com"],
+        )
+
+    def test_import_cleans_and_deduplicates_emails(self):
+        core_models.NewsletterSignup.objects.create(email="jane@example.com")
+        emails = [" zoe@example.com", "jane@example.com", "zoe@example.com", "not an email"]
+        emails += ["adam@example.com", "zoe@example.com "]
+        path = self.directory / "list.csv"
+        path.write_text("email\n" + "\n".join(emails) + "\n")
+
+        stdout = StringIO()
+        call_command("import_newsletter", str(path), run_size=2, stdout=stdout)
+
+        self.assertEqual(
+            sorted(core_models.NewsletterSignup.objects.values_list("email", flat=True)),
+            ["adam@example.com", "jane@example.com", "zoe@example.com"],
+        )
+        self.assertIn("Imported 2 emails, skipped 3 duplicates and rejected 1", stdout.getvalue())
+        rejected = (self.directory / "list.csv.rejected.jsonl").read_text().splitlines()
+        self.assertEqual(json.loads(rejected[0])["row"], 4)
+
+    def test_import_only_counts_its_own_signups(self):
+        insert = services._newsletter_signups_insert
+
+        def insert_with_concurrent_signup(emails):
+            # Someone signs up through the form while the import runs
+            core_models.NewsletterSignup.objects.create(email="visitor@example.com")
+            return insert(emails)
+
+        with mock.patch.object(
+            services, "_newsletter_signups_insert", side_effect=insert_with_concurrent_signup
+        ):
+            result = services.newsletter_signup_import(
+                emails=["jane@example.com", "john@example.com", "jane@example.com"],
+                rejected=StringIO(),
+            )
+
+        self.assertEqual((result.imported, result.duplicates, result.rejected), (2, 1, 0))
+        self.assertEqual(core_models.NewsletterSignup.objects.count(), 3)
+
+    def test_import_closes_runs_when_reading_fails(self):
+        def emails():
+            yield "jane@example.com"
+            raise OSError("Connection reset")
+
+        runs = []
+        temporary_file = tempfile.TemporaryFile
+
+        def open_run(*args, **kwargs):
+            runs.append(temporary_file(*args, **kwargs))
+            return runs[-1]
+
+        with (
+            mock.patch.object(tempfile, "TemporaryFile", side_effect=open_run),
+            self.assertRaises(OSError),
+        ):
+            services.newsletter_signup_import(emails=emails(), rejected=StringIO(), run_size=1)
+
+        self.assertEqual(len(runs), 1)
+        self.assertTrue(runs[0].closed)
+
+
+class NewsletterCampaignTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        campaign = Path(directory.name) / "core/emails/newsletter/launch"
+        campaign.mkdir(parents=True)
+        (campaign / "subject.txt").write_text("We're live\n")
+        (campaign / "body.txt").write_text(
+            '{% extends "core/emails/newsletter/base.txt" %}'
+            "{% block content %}Reviews & salaries{% endblock %}"
+        )
+        (campaign / "body.html").write_text(
+            '{% extends "core/emails/newsletter/base.html" %}'
+            "{% block content %}<p>Reviews &amp; salaries</p>{% endblock %}"
+        )
+        templates = [{**settings.TEMPLATES[0], "DIRS": [directory.name]}]
+        override = override_settings(TEMPLATES=templates)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.signups = [
+            core_models.NewsletterSignup.objects.create(email=f"{name}@example.com")
+            for name in ("adam", "jane", "john")
+        ]
+        self.pool = mailing.EmailConnectionPool(size=2)
+        self.addCleanup(self.pool.close)
+
+    def send(self, **kwargs):
+        return services.newsletter_campaign_send(
+            campaign="launch", pool=self.pool, rate=1000, threads=2, **kwargs
+        )
+
+    def test_sends_campaign_to_every_subscriber(self):
+        result = self.send()
+
+        self.assertEqual(result, services.NewsletterCampaignResult(sent=3))
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["adam@example.com", "jane@example.com", "john@example.com"],
+        )
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, "We're live")
+        self.assertTrue(message.body.startswith("Reviews & salaries"))
+        self.assertIn("<p>Reviews &amp; salaries</p>", message.alternatives[0][0])
+
+    def test_resumes_after_checkpoint(self):
+        core_models.ImportCheckpoint.objects.create(
+            name="newsletter-campaign:launch", position=self.signups[1].pk
+        )
+
+        result = self.send()
+
+        self.assertEqual(result, services.NewsletterCampaignResult(sent=1, skipped=2))
+        self.assertEqual([message.to for message in mail.outbox], [["john@example.com"]])
+
+    def test_failure_stops_campaign_before_unsent_subscriber(self):
+        def send(message):
+            if message.to == ["jane@example.com"]:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+        with (
+            mock.patch.object(self.pool, "send", side_effect=send),
+            self.assertRaises(smtplib.SMTPServerDisconnected),
+        ):
+            self.send()
+        checkpoint = core_models.ImportCheckpoint.objects.get(name="newsletter-campaign:launch")
+        self.assertEqual(checkpoint.position, self.signups[0].pk)
+
+        result = self.send()
+
+        self.assertEqual(result, services.NewsletterCampaignResult(sent=2, skipped=1))
+
+    def test_refused_recipients_are_skipped(self):
+        def send(message):
+            if message.to == ["jane@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({"jane@example.com": (550, b"No such user")})
+
+        with mock.patch.object(self.pool, "send", side_effect=send):
+            result = self.send()
+
+        self.assertEqual(result, services.NewsletterCampaignResult(sent=2, refused=1))
+        checkpoint = core_models.ImportCheckpoint.objects.get(name="newsletter-campaign:launch")
+        self.assertEqual(checkpoint.position, self.signups[2].pk)
+
+
+class PayslipUploadTestCase(TestCase):
+    PAYSLIP = b"%PDF-1.7\n" + b"payslip contents " * 10_000
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = Path(media_root.name)
+
+    def upload(self, content: bytes, name: str = "payslip.pdf"):
+        request = RequestFactory().post("/", {"payslip": SimpleUploadedFile(name, content)})
+        return request.FILES["payslip"]
+
+    def test_upload_is_hashed_while_streaming(self):
+        payslip = self.upload(self.PAYSLIP)
+        self.assertIsInstance(payslip, PayslipUploadedFile)
+        self.assertEqual(payslip.sha256, hashlib.sha256(self.PAYSLIP).hexdigest())
+        self.assertEqual(payslip.size, len(self.PAYSLIP))
+        # Streamed next to the stored payslips rather than buffered in memory
+        self.assertEqual(Path(payslip.temporary_file_path()).parent, self.media_root / ".incoming")
+
+    def test_upload_is_moved_into_place_with_its_digest(self):
+        payslip = self.upload(self.PAYSLIP)
+        temporary_path = payslip.temporary_file_path()
+        review = EmployerReviewMVPTestCase.Factory(payslip=payslip)
+        payslip.close()
+
+        self.assertFalse(os.path.exists(temporary_path))
+        self.assertEqual(review.payslip.read(), self.PAYSLIP)
+        review.refresh_from_db()
+        self.assertEqual(review.payslip_sha256, hashlib.sha256(self.PAYSLIP).hexdigest())
+        self.assertTrue(selectors.payslip_duplicate_exists(sha256=review.payslip_sha256))
+        self.assertFalse(
+            selectors.payslip_duplicate_exists(
+                sha256=review.payslip_sha256, exclude_review_id=review.id
+            )
+        )
+
+    def test_duplicate_payslips_are_stored_once(self):
+        uploads = [self.upload(self.PAYSLIP), self.upload(self.PAYSLIP)]
+        first = EmployerReviewMVPTestCase.Factory(payslip=uploads[0])
+        second = EmployerReviewMVPTestCase.Factory(payslip=uploads[1])
+        # Django closes the uploads once the request is finished
+        for upload in uploads:
+            upload.close()
+
+        self.assertNotEqual(first.payslip.name, second.payslip.name)
+        self.assertTrue(os.path.samefile(first.payslip.path, second.payslip.path))
+        storage = core_models.get_payslip_storage()
+        self.assertEqual(storage.reference_count(first.payslip_sha256), 2)
+
+    def test_payslips_uploaded_otherwise_are_hashed_on_save(self):
+        review = EmployerReviewMVPTestCase.Factory(
+            payslip=SimpleUploadedFile("payslip.pdf", self.PAYSLIP)
+        )
+        self.assertEqual(review.payslip_sha256, hashlib.sha256(self.PAYSLIP).hexdigest())
+
+    def test_non_pdf_upload_is_rejected(self):
+        payslip = self.upload(b"GIF89a" + b"\x00" * 1024, name="payslip.pdf")
+        self.assertEqual(payslip.upload_error, "The payslip must be a PDF file.")
+        self.assertEqual(list((self.media_root / ".incoming").iterdir()), [])
+
+        form = EmployerReviewMVPForm(data={}, files={"payslip": payslip})
+        self.assertIn("The payslip must be a PDF file.", form.errors["payslip"])
+
+    @override_settings(PAYSLIP_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_is_rejected(self):
+        payslip = self.upload(self.PAYSLIP)
+        self.assertTrue(payslip.upload_error.startswith("The payslip must be smaller than"))
+        self.assertEqual(list((self.media_root / ".incoming").iterdir()), [])
+
+    def test_other_uploads_use_the_default_handlers(self):
+        request = RequestFactory().post(
+            "/", {"avatar": SimpleUploadedFile("avatar.gif", b"GIF89a")}
+        )
+        self.assertIsInstance(request.FILES["avatar"], InMemoryUploadedFile)
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.location = Path(location.name)
+        self.storage = ContentAddressedStorage(location=location.name)
+
+    def test_identical_files_are_stored_once(self):
+        first = self.storage.save("a/payslip.pdf", ContentFile(b"%PDF-same"))
+        second = self.storage.save("b/payslip.pdf", ContentFile(b"%PDF-same"))
+        other = self.storage.save("c/payslip.pdf", ContentFile(b"%PDF-other"))
+
+        self.assertTrue(os.path.samefile(self.storage.path(first), self.storage.path(second)))
+        self.assertFalse(os.path.samefile(self.storage.path(first), self.storage.path(other)))
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b"%PDF-same")
+        self.assertEqual(self.storage.reference_count(hashlib.sha256(b"%PDF-same").hexdigest()), 2)
+        self.assertEqual(len(list((self.location / ".blobs").glob("*/*/*"))), 2)
+        self.assertEqual(list((self.location / ".incoming").iterdir()), [])
+
+    def test_existing_names_get_a_new_name(self):
+        first = self.storage.save("payslip.pdf", ContentFile(b"%PDF-same"))
+        second = self.storage.save("payslip.pdf", ContentFile(b"%PDF-same"))
+        self.assertNotEqual(first, second)
+
+    def test_private_files_have_no_url(self):
+        name = self.storage.save("payslip.pdf", ContentFile(b"%PDF-same"))
+        self.assertTrue(self.storage.url(name).endswith("payslip.pdf"))
+
+        private = ContentAddressedStorage(location=self.location, private=True)
+        with self.assertRaises(NotImplementedError):
+            private.url(name)
+        with self.assertRaises(NotImplementedError):
+            core_models.get_payslip_storage().url(name)
+
+    def test_unreferenced_blobs_are_collected(self):
+        digest = hashlib.sha256(b"%PDF-same").hexdigest()
+        first = self.storage.save("a/payslip.pdf", ContentFile(b"%PDF-same"))
+        second = self.storage.save("b/payslip.pdf", ContentFile(b"%PDF-same"))
+
+        self.storage.delete(first)
+        self.assertEqual(self.storage.collect_garbage().removed, 0)
+        self.assertEqual(self.storage.reference_count(digest), 1)
+
+        self.storage.delete(second)
+        self.assertEqual(self.storage.collect_garbage(dry_run=True).removed, 1)
+        self.assertTrue(os.path.exists(self.storage.blob_path(digest)))
+        result = self.storage.collect_garbage()
+        self.assertEqual((result.removed, result.freed_bytes), (1, len(b"%PDF-same")))
+        self.assertFalse(os.path.exists(self.storage.blob_path(digest)))
+
+    def test_existing_files_are_deduplicated(self):
+        for name in ("a/payslip.pdf", "b/payslip.pdf"):
+            path = self.location / name
+            path.parent.mkdir()
+            path.write_bytes(b"%PDF-same")
+
+        self.assertEqual(self.storage.collect_garbage().adopted, 2)
+        self.assertTrue(
+            os.path.samefile(self.location / "a/payslip.pdf", self.location / "b/payslip.pdf")
+        )
+        self.assertEqual((self.location / "b/payslip.pdf").read_bytes(), b"%PDF-same")
+        self.assertEqual(self.storage.reference_count(hashlib.sha256(b"%PDF-same").hexdigest()), 2)
+        self.assertEqual(self.storage.collect_garbage().adopted, 0)
+
+    def test_abandoned_uploads_are_collected(self):
+        incoming = self.location / ".incoming"
+        incoming.mkdir()
+        (incoming / "fresh.upload").write_bytes(b"%PDF-")
+        abandoned = incoming / "abandoned.upload"
+        abandoned.write_bytes(b"%PDF-")
+        two_days_ago = time.time() - 2 * 24 * 60 * 60
+        os.utime(abandoned, (two_days_ago, two_days_ago))
+
+        self.assertEqual(self.storage.collect_garbage().removed, 1)
+        self.assertEqual([path.name for path in incoming.iterdir()], ["fresh.upload"])
+
+    def test_only_files_in_adopt_directory_are_deduplicated(self):
+        storage = ContentAddressedStorage(location=self.location, adopt_directory="payslips")
+        (self.location / "payslips").mkdir()
+        (self.location / "payslips/payslip.pdf").write_bytes(b"%PDF-")
+        (self.location / "avatar.png").write_bytes(b"PNG")
+
+        self.assertEqual(storage.collect_garbage().adopted, 1)
+        self.assertEqual(os.stat(self.location / "avatar.png").st_nlink, 1)
+
+    def test_collect_payslip_garbage_command(self):
+        with override_settings(MEDIA_ROOT=str(self.location)):
+            payslips = self.location / "employer_reviews/payslips/1"
+            payslips.mkdir(parents=True)
+            (payslips / "payslip.pdf").write_bytes(b"%PDF-")
+            (self.location / "other.pdf").write_bytes(b"%PDF-")
+            out = StringIO()
+            call_command("collect_payslip_garbage", stdout=out)
+        self.assertIn("deduplicated 1 payslips", out.getvalue())
+
+
+class PayslipVerificationTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Drain jobs queued by other tests
+        self.broker = jobs.get_broker()
+        while self.broker.dequeue(timeout=0) is not None:
+            pass
+
+    def payslip(self, text: str) -> SimpleUploadedFile:
+        content = f"BT /F1 10 Tf 72 720 Td ({text}) Tj ET".encode()
+        return SimpleUploadedFile(
+            "payslip.pdf",
+            b"%PDF-1.4\n1 0 obj\n<< /Length "
+            + str(len(content)).encode()
+            + b" >>\nstream\n"
+            + content
+            + b"\nendstream\nendobj\n%%EOF\n",
+        )
+
+    def create_review(self, payslip_text: str, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = EmployerReviewMVPTestCase.Factory(
+                company_name="Zorblax Widgets Ltd",
+                company_domain="zorblax.example",
+                verified=False,
+                payslip=self.payslip(payslip_text),
+                **kwargs,
+            )
+        job = self.broker.dequeue(timeout=0)
+        self.assertEqual(job.kwargs, {"review_id": review.id})
+        self.assertTrue(jobs.Worker(self.broker).process(job))
+        review.refresh_from_db()
+        return review
+
+    def test_match_confidence(self):
+        def confidence(text):
+            return services.payslip_match_confidence(
+                text=text, company_name="Zorblax Widgets Ltd", company_domain="zorblax.example"
+            )
+
+        self.assertEqual(confidence("Questions? payroll@zorblax.example"), 1.0)
+        self.assertEqual(confidence("Employer: ZORBLAX WIDGETS LIMITED\nNet pay"), 0.95)
+        self.assertGreater(confidence("Employer: Zorblax Widgts\nNet pay"), 0.8)
+        self.assertLess(confidence("Employer: Quuxcorp Holdings\nNet pay"), 0.5)
+        self.assertLess(confidence("notzorblax.example"), 0.8)
+        self.assertEqual(confidence(""), 0.0)
+
+    def test_matching_payslip_verifies_review(self):
+        review = self.create_review("Employer: Zorblax Widgets Ltd")
+        self.assertTrue(review.verified)
+        self.assertEqual(review.verification_confidence, 0.95)
+
+    def test_other_payslip_does_not_verify_review(self):
+        review = self.create_review("Employer: Quuxcorp Holdings")
+        self.assertFalse(review.verified)
+        self.assertLess(review.verification_confidence, 0.5)
+
+    def test_duplicate_payslip_does_not_verify_review(self):
+        self.create_review("Employer: Zorblax Widgets Ltd")
+        review = self.create_review("Employer: Zorblax Widgets Ltd")
+        self.assertFalse(review.verified)
+        self.assertEqual(review.verification_confidence, 0.95)
+
+    def test_saving_without_a_new_payslip_queues_nothing(self):
+        review = self.create_review("Employer: Zorblax Widgets Ltd")
+        with self.captureOnCommitCallbacks(execute=True):
+            review.review_title = "An updated review title"
+            review.save()
+        self.assertIsNone(self.broker.dequeue(timeout=0))
+
+    def test_replaced_payslip_is_deleted(self):
+        review = self.create_review("Employer: Zorblax Widgets Ltd")
+        storage = core_models.get_payslip_storage()
+        previous = review.payslip.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.payslip = self.payslip("Employer: Zorblax Widgets Ltd, March")
+            review.save()
+
+        self.assertFalse(storage.exists(previous))
+        self.assertTrue(storage.exists(review.payslip.name))
+
+    def test_payslip_of_deleted_review_is_deleted(self):
+        review = self.create_review("Employer: Zorblax Widgets Ltd")
+        name = review.payslip.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+
+        self.assertFalse(core_models.get_payslip_storage().exists(name))
+        self.assertEqual(core_models.get_payslip_storage().collect_garbage().removed, 1)
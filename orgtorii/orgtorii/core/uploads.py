@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.template.defaultfilters import filesizeformat
+
+from . import models
+from .storage import ContentAddressedStorage
+
+PDF_MAGIC_BYTES = b"%PDF-"
+
+
+def file_sha256(file: File) -> str:
+    """Return the SHA-256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class PayslipUploadedFile(UploadedFile):
+    """A payslip streamed to a temporary file inside the payslip storage directory.
+
+    Keeping the temporary file next to its final location means saving it is a link
+    or rename rather than a copy. The SHA-256 digest of the contents is computed while
+    streaming.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None, *, directory):
+        os.makedirs(directory, exist_ok=True)
+        # Closed by close(), once the upload is saved or discarded
+        file = tempfile.NamedTemporaryFile(suffix=".upload", dir=directory)  # noqa: SIM115
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # The file was moved to its final location when it was saved
+            pass
+
+
+class RejectedPayslipUpload(UploadedFile):
+    """A payslip upload which was discarded while streaming, see ``upload_error``."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None, *, error):
+        super().__init__(BytesIO(), name, content_type, size, charset, content_type_extra)
+        self.upload_error = error
+
+
+class PayslipUploadHandler(FileUploadHandler):
+    """Stream payslip uploads to the payslip storage, hashing them while they are written.
+
+    Uploads which don't start with the PDF magic bytes or grow larger than
+    ``settings.PAYSLIP_MAX_UPLOAD_SIZE`` stop being written as soon as that is known and
+    are returned as a ``RejectedPayslipUpload`` so the form can show the error.
+    Files uploaded to other fields are left to the next upload handlers.
+    """
+
+    payslip_field_name = "payslip"
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+        self.active = field_name == self.payslip_field_name
+        if not self.active:
+            return
+        self.max_size = settings.PAYSLIP_MAX_UPLOAD_SIZE
+        self.error = None
+        self.digest = hashlib.sha256()
+        self.file = PayslipUploadedFile(
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+            directory=os.path.join(
+                models.get_payslip_storage().location, ContentAddressedStorage.incoming_directory
+            ),
+        )
+        if content_length is not None and content_length > self.max_size:
+            self._reject(self._size_error())
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error is not None:
+            return None
+        if start == 0 and not raw_data.startswith(PDF_MAGIC_BYTES):
+            self._reject("The payslip must be a PDF file.")
+        elif start + len(raw_data) > self.max_size:
+            self._reject(self._size_error())
+        else:
+            self.digest.update(raw_data)
+            self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.error is not None:
+            return RejectedPayslipUpload(
+                self.file_name,
+                self.content_type,
+                file_size,
+                self.charset,
+                self.content_type_extra,
+                error=self.error,
+            )
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, "active", False):
+            self.file.close()
+
+    def _reject(self, error: str) -> None:
+        self.error = error
+        self.file.close()
+
+    def _size_error(self) -> str:
+        return f"The payslip must be smaller than {filesizeformat(self.max_size)}."
@@ -1,9 +1,27 @@
+from dataclasses import asdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sites.models import SITE_CACHE, Site
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect, render
+from django.views.decorators.http import require_GET
 from meta.views import Meta
 
+from orgtorii import selectors, services
+from orgtorii.page_cache import cache_anonymous_page
+
 from .forms import NewsletterSignupForm
 
 
+async def _ameta(**kwargs) -> Meta:
+    # django-meta reads the current site while the template renders, load it into the
+    # sites cache first as the database can't be queried from the event loop
+    if settings.SITE_ID not in SITE_CACHE:
+        await sync_to_async(Site.objects.get_current)()
+    return Meta(**kwargs)
+
+
 def newsletter_signup(request):
     form = NewsletterSignupForm()
     meta = Meta(title="Newsletter Signup")
@@ -11,20 +29,111 @@ def newsletter_signup(request):
     if request.method == "POST":
         form = NewsletterSignupForm(request.POST)
         if form.is_valid():
-            form.save()
-            return redirect("newsletter:signup_success")
+            if services.newsletter_signup_create(email=form.cleaned_data["email"]):
+                return redirect("newsletter:signup_success")
+            form.add_error("email", form.ALREADY_SUBSCRIBED_ERROR)
     return render(request, "core/pages/newsletter/signup.html", {"form": form, "meta": meta})
 
 
-def newsletter_success(request):
-    meta = Meta(title="Thank you")
+@cache_anonymous_page
+async def newsletter_success(request):
+    meta = await _ameta(title="Thank you")
     return render(request, "core/pages/newsletter/success.html", {"meta": meta})
 
 
-def coming_soon(request):
-    meta = Meta(title="Org Torii - Coming Soon")
+@cache_anonymous_page
+async def coming_soon(request):
+    meta = await _ameta(title="Org Torii - Coming Soon")
     newsletter_form = NewsletterSignupForm()
 
     return render(
         request, "core/coming_soon.html", {"meta": meta, "newsletter_form": newsletter_form}
     )
+
+
+@require_GET
+def company_autocomplete(request):
+    suggestions = selectors.company_autocomplete(query=request.GET.get("company_name", ""))
+
+    if request.htmx:
+        return render(
+            request, "core/fragments/company_autocomplete.html", {"suggestions": suggestions}
+        )
+    return JsonResponse({"results": [asdict(suggestion) for suggestion in suggestions]})
+
+
+# The most companies returned by a leaderboard request
+_LEADERBOARD_MAX_LIMIT = 100
+
+
+@require_GET
+def company_leaderboard(request):
+    try:
+        # e.g. ?rating=work_life_balance&location=Berlin
+        rating_field = f"{request.GET.get('rating', '')}_rating"
+        limit = int(request.GET.get("limit") or 10)
+        offset = int(request.GET.get("offset") or 0)
+        if not 0 < limit <= _LEADERBOARD_MAX_LIMIT or offset < 0:
+            raise ValueError("Invalid page.")
+        entries = selectors.leaderboard_list(
+            rating_field=rating_field,
+            location=request.GET.get("location", ""),
+            limit=limit,
+            offset=offset,
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid leaderboard.")
+
+    if request.htmx:
+        return render(request, "core/fragments/leaderboard.html", {"entries": entries})
+    return JsonResponse(
+        {
+            "results": [
+                {
+                    "rank": entry.rank,
+                    "company_id": entry.company_id,
+                    "company_name": entry.company_name,
+                    "score": round(entry.score, 2),
+                    "average": round(entry.average, 2),
+                    "review_count": entry.review_count,
+                }
+                for entry in entries
+            ]
+        }
+    )
+
+
+def _parse_bool(value: str | None) -> bool | None:
+    if value in (None, ""):
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean: {value}")
+
+
+@require_GET
+async def review_list(request):
+    try:
+        page = await selectors.areview_list(
+            cursor=request.GET.get("cursor") or None,
+            company_id=int(request.GET["company"]) if request.GET.get("company") else None,
+            verified=_parse_bool(request.GET.get("verified")),
+            current_employee=_parse_bool(request.GET.get("current_employee")),
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid filters.")
+
+    next_query = None
+    if page.next_cursor is not None:
+        params = request.GET.copy()
+        params["cursor"] = page.next_cursor
+        next_query = params.urlencode()
+    context = {"reviews": page.reviews, "next_query": next_query}
+
+    if request.htmx:
+        # The next page requested by the infinite scroll
+        return render(request, "core/fragments/reviews/list.html", context)
+    meta = await _ameta(title="Reviews")
+    return render(request, "core/pages/reviews/list.html", {**context, "meta": meta})
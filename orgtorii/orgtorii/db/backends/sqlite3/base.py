@@ -0,0 +1,140 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from django.db import OperationalError
+from django.utils.asyncio import async_unsafe
+from django_prometheus.db.backends.sqlite3 import base
+
+
+class DatabaseFeatures(base.DatabaseFeatures):
+    pass
+
+
+# Connections kept open between requests by database alias and file, shared by all threads
+_pools: dict[tuple[str, str], queue.LifoQueue[sqlite3.Connection]] = {}
+# Serialize the write transactions of the process per database file
+_write_locks: dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite with a pool of open connections and serialized write transactions.
+
+    Opening a connection runs the PRAGMAs of ``init_command`` and registers Django's
+    SQL functions. Under ASGI every request runs in a thread of its own, so
+    ``CONN_MAX_AGE`` would leak connections: closed connections are kept in a pool
+    shared by all threads instead, and checked before being reused.
+
+    Extra ``OPTIONS``, next to Django's:
+
+    - ``pool_size``: the number of idle connections kept open, 0 disables the pool
+    - ``query_only``: reject writes, for the aliases serving reads (see
+      ``orgtorii.db.routers.ReadWriteRouter``)
+    - ``write_lock_timeout``: seconds a write transaction waits for the other write
+      transactions of the process, instead of SQLite's busy handler polling for the
+      write lock until ``busy_timeout``. Only ``IMMEDIATE`` transactions wait.
+
+    A transaction holds the write lock while its thread waits for the GIL between
+    statements, which takes long in a process busy with reads: see
+    ``benchmarks/sqlite_concurrency.py --writer-process`` for the difference it makes.
+    """
+
+    features_class = DatabaseFeatures
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pool_size = params.pop("pool_size", 0)
+        self.query_only = params.pop("query_only", False)
+        self.write_lock_timeout = params.pop("write_lock_timeout", None)
+        if self.query_only:
+            self.init_commands.append("PRAGMA query_only = ON")
+        return params
+
+    def _pool(self) -> queue.LifoQueue | None:
+        if not self.pool_size or self.is_in_memory_db():
+            return None
+        key = (self.alias, str(self.settings_dict["NAME"]))
+        with _lock:
+            return _pools.setdefault(key, queue.LifoQueue(self.pool_size))
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self._pool()
+        while pool is not None:
+            try:
+                connection = pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.execute("SELECT 1").fetchone()
+            except sqlite3.Error:
+                connection.close()
+                continue
+            return connection
+        return super().get_new_connection(conn_params)
+
+    def _close(self):
+        self._release_write_lock()
+        pool = self._pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            try:
+                pool.put_nowait(self.connection)
+            except queue.Full:
+                self.connection.close()
+
+    def is_usable(self):
+        # Checked by CONN_HEALTH_CHECKS
+        try:
+            self.connection.execute("SELECT 1")
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _write_lock(self):
+        if (
+            self.write_lock_timeout is None
+            or self.transaction_mode != "IMMEDIATE"
+            or self.is_in_memory_db()
+        ):
+            return None
+        with _lock:
+            return _write_locks.setdefault(str(self.settings_dict["NAME"]), threading.Lock())
+
+    def _start_transaction_under_autocommit(self):
+        write_lock = self._write_lock()
+        if write_lock is not None:
+            started = time.monotonic()
+            if not write_lock.acquire(timeout=self.write_lock_timeout):
+                raise OperationalError(
+                    f"Waited {time.monotonic() - started:.1f}s for a write transaction"
+                )
+            self._holds_write_lock = write_lock
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_write_lock()
+            raise
+
+    def _release_write_lock(self) -> None:
+        write_lock = getattr(self, "_holds_write_lock", None)
+        if write_lock is not None:
+            self._holds_write_lock = None
+            write_lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
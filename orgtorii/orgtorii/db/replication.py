@@ -0,0 +1,493 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import BinaryIO, Literal
+
+logger = logging.getLogger(__name__)
+
+_WAL_HEADER_SIZE = 32
+_FRAME_HEADER_SIZE = 24
+_WAL_MAGIC = (0x377F0682, 0x377F0683)  # Checksums of little, big endian words
+_SNAPSHOT_STEP_PAGES = 1024
+_GENERATION_FORMAT = "%Y%m%dT%H%M%S%fZ"
+
+
+def _checksum(data: bytes, s1: int, s2: int, big_endian: bool) -> tuple[int, int]:
+    # https://www.sqlite.org/fileformat.html#checksum_algorithm
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for x0, x1 in zip(words[::2], words[1::2], strict=True):
+        s1 = (s1 + x0 + s2) & 0xFFFFFFFF
+        s2 = (s2 + x1 + s1) & 0xFFFFFFFF
+    return s1, s2
+
+
+@dataclass(frozen=True)
+class WALPosition:
+    """The end of the last transaction shipped from a WAL file.
+
+    ``salt`` identifies the WAL since it was last restarted, ``checksum`` is the
+    cumulative checksum of the frames up to ``offset``, so shipping can continue from
+    it after the replicator restarts.
+    """
+
+    salt: tuple[int, int]
+    offset: int
+    checksum: tuple[int, int]
+
+
+@dataclass(frozen=True)
+class _WALHeader:
+    page_size: int
+    big_endian: bool
+    salt: tuple[int, int]
+    checksum: tuple[int, int]
+
+    @property
+    def start(self) -> WALPosition:
+        return WALPosition(self.salt, _WAL_HEADER_SIZE, self.checksum)
+
+
+def _read_wal_header(wal: BinaryIO) -> _WALHeader | None:
+    wal.seek(0)
+    data = wal.read(_WAL_HEADER_SIZE)
+    if len(data) < _WAL_HEADER_SIZE:
+        return None
+    magic, _, page_size, _, salt1, salt2, checksum1, checksum2 = struct.unpack(">8I", data)
+    if magic not in _WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if _checksum(data[:24], 0, 0, big_endian) != (checksum1, checksum2):
+        return None
+    return _WALHeader(page_size, big_endian, (salt1, salt2), (checksum1, checksum2))
+
+
+def _read_committed_frames(
+    wal: BinaryIO, header: _WALHeader, position: WALPosition, max_size: int
+) -> tuple[bytes, WALPosition]:
+    """Read the frames of the transactions committed after ``position``.
+
+    Frames are read up to the first one which isn't valid, e.g. as it is being written
+    or was left from before the WAL restarted, and up to ``max_size`` bytes unless a
+    single transaction is larger.
+
+    Returns:
+        tuple[bytes, WALPosition]: the frames and the position after them
+    """
+    frame_size = _FRAME_HEADER_SIZE + header.page_size
+    wal.seek(position.offset)
+    frames = bytearray()
+    committed, committed_size = position, 0
+    s1, s2 = position.checksum
+    while committed_size < max_size:
+        frame = wal.read(frame_size)
+        if len(frame) < frame_size:
+            break
+        _, commit, salt1, salt2, checksum1, checksum2 = struct.unpack(">6I", frame[:24])
+        if (salt1, salt2) != header.salt:
+            break
+        s1, s2 = _checksum(frame[:8], s1, s2, header.big_endian)
+        s1, s2 = _checksum(frame[24:], s1, s2, header.big_endian)
+        if (s1, s2) != (checksum1, checksum2):
+            break
+        frames += frame
+        if commit:
+            committed_size = len(frames)
+            committed = WALPosition(header.salt, position.offset + committed_size, (s1, s2))
+    return bytes(frames[:committed_size]), committed
+
+
+def _write_json(path: Path, data: dict) -> None:
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def _segment_timestamp(segment: Path) -> datetime:
+    milliseconds = int(segment.name.split(".")[0].split("-")[1])
+    return datetime.fromtimestamp(milliseconds / 1000, UTC)
+
+
+class WALReplicator:
+    """Continuously back up a SQLite database in WAL mode by shipping its WAL frames.
+
+    Like litestream, a backup is a series of generations in ``directory``, each made of
+    a snapshot of the database and the frames committed after it::
+
+        <generation>/snapshot.db.gz
+        <generation>/wal/<index>-<milliseconds>.wal.gz
+        <generation>/state.json
+
+    ``sync`` copies the frames committed since the last call. The replicator always
+    keeps a read transaction open which starts before the frames it hasn't shipped
+    yet, so no checkpoint can copy them to the database and restart the WAL before
+    they are shipped. The checkpoints are run by ``checkpoint``: the connections of
+    the application should not checkpoint themselves, see ``DATABASE_REPLICATION``.
+
+    A snapshot is copied with SQLite's online backup, pausing ``snapshot_throttle``
+    seconds every 1024 pages to leave disk bandwidth to the application, without
+    blocking writes. A new generation starts when the frames can't be shipped
+    continuously, e.g. the WAL was restarted while the replicator wasn't running, and
+    every ``snapshot_interval`` seconds so that restores don't replay too much WAL.
+    """
+
+    def __init__(
+        self,
+        *,
+        database: Path,
+        directory: Path,
+        max_wal_size: int = 64 * 1024 * 1024,
+        checkpoint_pages: int = 1000,
+        restart_timeout: float = 0.1,
+        segment_size: int = 16 * 1024 * 1024,
+        snapshot_interval: float = 24 * 60 * 60,
+        snapshot_throttle: float = 0,
+        retain: int = 2,
+    ) -> None:
+        self.database = Path(database)
+        self.wal = self.database.with_name(f"{self.database.name}-wal")
+        self.directory = Path(directory)
+        self.max_wal_size = max_wal_size
+        self.checkpoint_pages = checkpoint_pages
+        self.restart_timeout = restart_timeout
+        self.segment_size = segment_size
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_throttle = snapshot_throttle
+        self.retain = retain
+        # Read transactions alternate between two connections, a new one starts before
+        # the previous one ends so the unshipped frames are never left unprotected
+        self._readers = [self._connect(), self._connect()]
+        self._checkpointer = self._connect()
+        self._generation: Path | None = None
+        self._position: WALPosition | None = None
+        self._segment = 0
+        self._created_at = 0.0
+        self._since_checkpoint = 0  # Frames shipped since the last checkpoint
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.database, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA busy_timeout = 5000")
+        return connection
+
+    def close(self) -> None:
+        for connection in (*self._readers, self._checkpointer):
+            connection.close()
+
+    def _begin_read(self) -> None:
+        reader = self._readers[1]
+        reader.execute("BEGIN")
+        reader.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        self._end_read()
+        self._readers.reverse()
+
+    def _end_read(self) -> None:
+        if self._readers[0].in_transaction:
+            self._readers[0].execute("COMMIT")
+
+    def _frames(self, position: WALPosition, page_size: int) -> int:
+        return (position.offset - _WAL_HEADER_SIZE) // (_FRAME_HEADER_SIZE + page_size)
+
+    def _page_size(self) -> int:
+        return self._readers[0].execute("PRAGMA page_size").fetchone()[0]
+
+    def _save_state(self) -> None:
+        _write_json(
+            self._generation / "state.json",
+            {
+                "position": asdict(self._position),
+                "segment": self._segment,
+                "page_size": self._page_size(),
+                "created_at": self._created_at,
+            },
+        )
+
+    def _resume(self) -> bool:
+        # Continue the latest generation if the WAL still holds the last shipped frame
+        generations = sorted(path for path in self.directory.glob("*/state.json"))
+        if not generations:
+            return False
+        state = json.loads(generations[-1].read_text())
+        position = WALPosition(
+            tuple(state["position"]["salt"]),
+            state["position"]["offset"],
+            tuple(state["position"]["checksum"]),
+        )
+        self._begin_read()
+        try:
+            wal = self.wal.open("rb")
+        except FileNotFoundError:
+            return False
+        with wal:
+            header = _read_wal_header(wal)
+            if header is None or header.salt != position.salt:
+                return False
+            if position.offset == _WAL_HEADER_SIZE:
+                valid = header.checksum == position.checksum
+            else:
+                wal.seek(position.offset - header.page_size - 8)
+                valid = struct.unpack(">2I", wal.read(8)) == position.checksum
+        if not valid:
+            return False
+        self._generation = generations[-1].parent
+        self._position = position
+        self._segment = state["segment"]
+        self._created_at = state["created_at"]
+        return True
+
+    def _wal_end(self, position: WALPosition | None) -> WALPosition | None:
+        try:
+            wal = self.wal.open("rb")
+        except FileNotFoundError:
+            return None
+        with wal:
+            header = _read_wal_header(wal)
+            if header is None:
+                return None
+            if position is None or position.salt != header.salt:
+                position = header.start
+            while True:
+                frames, position = _read_committed_frames(wal, header, position, self.segment_size)
+                if not frames:
+                    return position
+
+    def snapshot(self) -> Path:
+        """Start a new generation with a snapshot of the database.
+
+        Returns:
+            Path: the directory of the generation
+        """
+        created_at = time.time()
+        generation = self.directory / datetime.fromtimestamp(created_at, UTC).strftime(
+            _GENERATION_FORMAT
+        )
+        (generation / "wal").mkdir(parents=True)
+
+        # Writes are blocked while the end of the WAL is found and the read transaction
+        # the snapshot is copied from starts, so the frames after it are the ones to ship
+        position = self._wal_end(None)
+        self._checkpointer.execute("BEGIN IMMEDIATE")
+        try:
+            position = self._wal_end(position)
+            self._begin_read()
+        finally:
+            self._checkpointer.execute("ROLLBACK")
+
+        copy = generation / "snapshot.db"
+        target = sqlite3.connect(copy)
+        try:
+            self._readers[0].backup(
+                target,
+                pages=_SNAPSHOT_STEP_PAGES,
+                progress=lambda *args: time.sleep(self.snapshot_throttle),
+            )
+        finally:
+            target.close()
+        with copy.open("rb") as source, gzip.open(f"{copy}.gz", "wb") as destination:
+            shutil.copyfileobj(source, destination)
+        copy.unlink()
+
+        self._generation = generation
+        # Without a WAL the frames to ship start in the WAL created by the next write
+        self._position = position or WALPosition((0, 0), _WAL_HEADER_SIZE, (0, 0))
+        self._segment = 0
+        self._created_at = created_at
+        self._save_state()
+        logger.info("Started generation %s", generation.name)
+
+        generations = sorted(path.parent for path in self.directory.glob("*/state.json"))
+        for old in generations[: -self.retain]:
+            shutil.rmtree(old)
+        return generation
+
+    def sync(self) -> int:
+        """Ship the frames committed since the last call.
+
+        Returns:
+            int: the number of frames shipped
+        """
+        if (self._generation is None and not self._resume()) or (
+            time.time() - self._created_at >= self.snapshot_interval
+        ):
+            self.snapshot()
+        self._begin_read()
+        try:
+            wal = self.wal.open("rb")
+        except FileNotFoundError:
+            return 0
+        shipped = 0
+        with wal:
+            header = _read_wal_header(wal)
+            if header is None:
+                return 0
+            if header.salt != self._position.salt:
+                # The WAL restarted after all its frames were shipped and checkpointed
+                self._position = header.start
+            while True:
+                frames, position = _read_committed_frames(
+                    wal, header, self._position, self.segment_size
+                )
+                if not frames:
+                    break
+                segment = (
+                    self._generation
+                    / "wal"
+                    / f"{self._segment:010d}-{int(time.time() * 1000)}.wal.gz"
+                )
+                with gzip.open(segment.with_suffix(".tmp"), "wb") as f:
+                    f.write(frames)
+                os.replace(segment.with_suffix(".tmp"), segment)
+                self._position = position
+                self._segment += 1
+                self._save_state()
+                shipped += len(frames) // (_FRAME_HEADER_SIZE + header.page_size)
+        self._since_checkpoint += shipped
+        return shipped
+
+    def checkpoint(
+        self, mode: Literal["PASSIVE", "RESTART"] | None = None
+    ) -> Literal["PASSIVE", "RESTART"] | None:
+        """Copy the shipped frames to the database, if enough are waiting.
+
+        A ``PASSIVE`` checkpoint never waits for the application, but can't copy frames
+        which are still read. When the WAL outgrows ``max_wal_size`` (SQLite's
+        ``journal_size_limit``), a ``RESTART`` checkpoint waits up to ``restart_timeout``
+        seconds for readers to finish, blocking writes meanwhile, so that the next write
+        restarts the WAL and truncates it to ``journal_size_limit``.
+
+        Args:
+            mode (str | None): the checkpoint to run, chosen as described by default
+
+        Returns:
+            str | None: the checkpoint run, None if none was needed
+        """
+        if mode is None:
+            if self.wal.exists() and self.wal.stat().st_size > self.max_wal_size:
+                mode = "RESTART"
+            elif self._since_checkpoint >= self.checkpoint_pages:
+                mode = "PASSIVE"
+            else:
+                return None
+
+        self.sync()
+        if mode == "PASSIVE":
+            # Up to the start of the read transaction, every frame before it is shipped
+            self._checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            self._since_checkpoint = 0
+            return mode
+
+        shipped = self._position
+        self._end_read()
+        self._checkpointer.execute(f"PRAGMA busy_timeout = {int(self.restart_timeout * 1000)}")
+        try:
+            busy, frames, _ = self._checkpointer.execute(
+                "PRAGMA wal_checkpoint(RESTART)"
+            ).fetchone()
+        finally:
+            self._checkpointer.execute("PRAGMA busy_timeout = 5000")
+        self._begin_read()
+        if not busy:
+            self._since_checkpoint = 0
+        if frames > self._frames(shipped, self._page_size()):
+            # Transactions committed since the sync were copied to the database and the
+            # next write may restart the WAL before they are shipped: the generation
+            # ends with the shipped ones
+            logger.info("Transactions were checkpointed before being shipped")
+            self.snapshot()
+        return mode
+
+    def run(self, *, interval: float = 1, stop: threading.Event | None = None) -> None:
+        """Ship frames and checkpoint every ``interval`` seconds, until ``stop`` is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.sync()
+                self.checkpoint()
+            except (OSError, sqlite3.Error):
+                logger.exception("Replicating %s failed", self.database)
+            stop.wait(interval)
+
+
+@dataclass
+class RestoreResult:
+    generation: str
+    segments: int
+    restored_to: datetime
+
+
+def restore(
+    *, directory: Path, target: Path, generation: str | None = None, until: datetime | None = None
+) -> RestoreResult:
+    """Restore a database from the snapshot and WAL segments of a generation.
+
+    The database is written next to ``target`` and moved over it once complete, with
+    the WAL and shared memory files of ``target`` removed. The application must not
+    be running.
+
+    Args:
+        directory (Path): the backup directory of ``WALReplicator``
+        target (Path): the database file to restore
+        generation (str | None): the generation to restore, the latest by default
+        until (datetime | None): restore the transactions shipped until then, the
+            latest generation started before it by default
+
+    Returns:
+        RestoreResult: the generation restored, the number of segments replayed and
+        the time of the last one
+    """
+    directory, target = Path(directory), Path(target)
+    generations = sorted(path.parent.name for path in directory.glob("*/state.json"))
+    if until is not None:
+        generations = [
+            name
+            for name in generations
+            if datetime.strptime(name, _GENERATION_FORMAT).replace(tzinfo=UTC) <= until
+        ]
+    if generation is None:
+        if not generations:
+            raise FileNotFoundError(f"No generation to restore in {directory}")
+        generation = generations[-1]
+    path = directory / generation
+    state = json.loads((path / "state.json").read_text())
+    page_size = state["page_size"]
+    frame_size = _FRAME_HEADER_SIZE + page_size
+
+    restoring = target.with_name(f"{target.name}.restoring")
+    with gzip.open(path / "snapshot.db.gz", "rb") as source, restoring.open("wb") as database:
+        shutil.copyfileobj(source, database)
+    restored_to = datetime.fromtimestamp(state["created_at"], UTC)
+    segments = 0
+    with restoring.open("r+b") as database:
+        for segment in sorted((path / "wal").glob("*.wal.gz")):
+            timestamp = _segment_timestamp(segment)
+            if until is not None and timestamp > until:
+                break
+            with gzip.open(segment, "rb") as f:
+                while frame := f.read(frame_size):
+                    page_number, commit = struct.unpack(">2I", frame[:8])
+                    database.seek((page_number - 1) * page_size)
+                    database.write(frame[_FRAME_HEADER_SIZE:])
+                    if commit:
+                        # The size of the database in pages after the transaction
+                        database.truncate(commit * page_size)
+            segments += 1
+            restored_to = timestamp
+
+    connection = sqlite3.connect(restoring)
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        connection.close()
+    if result != "ok":
+        raise sqlite3.DatabaseError(f"The restored database is corrupt: {result}")
+    for suffix in ("-wal", "-shm"):
+        target.with_name(f"{target.name}{suffix}").unlink(missing_ok=True)
+    os.replace(restoring, target)
+    return RestoreResult(generation=generation, segments=segments, restored_to=restored_to)
@@ -0,0 +1,55 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class ReadWriteRouter:
+    """Send queries outside of transactions to the read-only ``read`` database alias.
+
+    The ``read`` alias opens the same SQLite file with ``query_only`` connections which
+    start ``DEFERRED`` transactions, so reads never wait for the ``IMMEDIATE`` write
+    transactions of the ``default`` alias. Reads inside a transaction on ``default`` stay
+    on it, to see its uncommitted writes.
+    """
+
+    read_alias = "read"
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class EphemeralRouter:
+    """Keep short-lived state in the ``ephemeral`` database alias.
+
+    Sessions and the database cache are written on every login and rate limited
+    request, a separate SQLite file keeps them from queueing behind the writes of the
+    business data. Other models are left to the next routers.
+    """
+
+    ephemeral_alias = "ephemeral"
+    # The sessions and the tables of DatabaseCache
+    app_labels = {"sessions", "django_cache"}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in self.app_labels:
+            return self.ephemeral_alias
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label in self.app_labels:
+            return db == self.ephemeral_alias
+        if db == self.ephemeral_alias:
+            return False
+        return None
@@ -0,0 +1,19 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from django.db import close_old_connections
+
+
+@contextmanager
+def background_work() -> Iterator[None]:
+    """Wrap a unit of work run outside of a request, on a thread of its own.
+
+    At the end of every request Django closes the connections of its thread which broke
+    or are older than ``CONN_MAX_AGE``. Threads which don't serve requests, such as the
+    writer and worker threads, wrap each unit of work in this to do the same, rather than
+    keeping broken or expired connections around.
+    """
+    try:
+        yield
+    finally:
+        close_old_connections()
@@ -0,0 +1,230 @@
+import fcntl
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, TextIO
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from prometheus_client import Gauge, Histogram
+
+from .threads import background_work
+
+logger = logging.getLogger(__name__)
+
+_LOCKED_RETRY_DELAY = 0.05
+
+write_queue_depth = Gauge("write_queue_depth", "Writes waiting for the writer thread")
+write_queue_wait_seconds = Histogram(
+    "write_queue_wait_seconds", "Time from submitting a write until its transaction committed"
+)
+write_queue_batch_size = Histogram(
+    "write_queue_batch_size",
+    "Writes committed in a single transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+
+def _is_locked(error: OperationalError) -> bool:
+    """Whether SQLite failed with ``database is locked``, waiting on another writer."""
+    cause = error.__cause__
+    if isinstance(cause, sqlite3.Error) and cause.sqlite_errorcode is not None:
+        # The extended codes, like SQLITE_BUSY_SNAPSHOT, keep SQLITE_BUSY in their low byte
+        return cause.sqlite_errorcode & 0xFF == sqlite3.SQLITE_BUSY
+    return "database is locked" in str(error)
+
+
+@dataclass
+class _Write:
+    function: Callable[..., Any]
+    args: tuple
+    kwargs: dict[str, Any]
+    future: Future = field(default_factory=Future)
+    submitted_at: float = field(default_factory=time.perf_counter)
+
+
+class WriteQueue:
+    """Run the database writes of the process on a single thread, committed in groups.
+
+    SQLite has a single writer lock: request threads writing on their own queue for it,
+    and past ``busy_timeout`` fail with ``database is locked``. Writes submitted here are
+    run by one writer thread instead, which takes every write waiting when it is free,
+    up to ``batch_size``, and runs them in a single transaction. Each write runs in a
+    savepoint, so a write which fails only fails its own future.
+
+    The writer threads of the worker processes take turns with an exclusive ``flock``
+    on ``<database>.write-lock``, so they don't poll for SQLite's write lock. Other
+    writes can still hold it past ``busy_timeout``: starting a transaction is then
+    retried for ``lock_timeout`` seconds.
+
+    The futures resolve with the result of their function once the transaction
+    committed, or with the error which prevented the commit. Callbacks registered with
+    ``transaction.on_commit`` run on the writer thread. Without ``background`` every
+    write runs in its own transaction in the submitting thread.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 100,
+        background: bool = True,
+        lock_timeout: float = 5,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> None:
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.background = background
+        self.using = using
+        self._queue: queue.SimpleQueue[_Write] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._writer: threading.Thread | None = None
+        self._lock_file: TextIO | None = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, function: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """Schedule a function writing to the database.
+
+        Args:
+            function (Callable): the function doing the writes, it must not start
+                threads or wait for other writes
+            *args: the arguments of the function
+            **kwargs: the keyword arguments of the function
+
+        Returns:
+            Future: resolved with the result of the function once its writes committed
+        """
+        write = _Write(function, args, kwargs)
+        if not self.background:
+            self._write([write])
+            return write.future
+        self._start_writer()
+        write_queue_depth.inc()
+        self._queue.put(write)
+        return write.future
+
+    def run(
+        self, function: Callable[..., Any], /, *args: Any, timeout: float | None = None, **kwargs
+    ) -> Any:
+        """Run a function writing to the database and wait until its writes committed.
+
+        Inside a transaction, or on the writer thread, the function runs right away:
+        the writer thread couldn't see the uncommitted rows of the caller and would wait
+        for its transaction to end.
+
+        Args:
+            function (Callable): the function doing the writes
+            *args: the arguments of the function
+            timeout (float | None): seconds to wait for the commit
+            **kwargs: the keyword arguments of the function
+
+        Returns:
+            Any: the result of the function
+        """
+        if threading.current_thread() is self._writer or connections[self.using].in_atomic_block:
+            with transaction.atomic(using=self.using):
+                return function(*args, **kwargs)
+        return self.submit(function, *args, **kwargs).result(timeout=timeout)
+
+    @contextmanager
+    def _process_lock(self):
+        connection = connections[self.using]
+        if connection.is_in_memory_db():
+            yield
+            return
+        if self._lock_file is None:
+            name = f"{connection.settings_dict['NAME']}.write-lock"
+            # Kept open, closing it would release the lock
+            self._lock_file = open(name, "a")  # noqa: SIM115
+        # Blocks in the kernel, unlike SQLite's busy handler sleeping between attempts
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _transaction(self, batch: list[_Write], outcomes: list) -> None:
+        with self._process_lock(), transaction.atomic(using=self.using):
+            for write in batch:
+                try:
+                    with transaction.atomic(using=self.using):
+                        result = write.function(*write.args, **write.kwargs)
+                    outcomes.append((result, None))
+                except Exception as e:
+                    outcomes.append((None, e))
+
+    def _write(self, batch: list[_Write]) -> None:
+        batch = [write for write in batch if write.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            outcomes: list[tuple[Any, Exception | None]] = []
+            try:
+                self._transaction(batch, outcomes)
+                break
+            except OperationalError as e:
+                # Starting the transaction failed as other processes kept SQLite's write
+                # lock past busy_timeout: none of the writes ran yet, try again
+                if not outcomes and _is_locked(e) and time.monotonic() < deadline:
+                    time.sleep(_LOCKED_RETRY_DELAY)
+                    continue
+                error = e
+            except BaseException as e:
+                error = e
+            for write in batch:
+                write.future.set_exception(error)
+            if not isinstance(error, Exception):
+                raise error
+            logger.exception("Committing %d writes failed", len(batch), exc_info=error)
+            return
+
+        write_queue_batch_size.observe(len(batch))
+        committed_at = time.perf_counter()
+        for write, (result, error) in zip(batch, outcomes, strict=True):
+            write_queue_wait_seconds.observe(committed_at - write.submitted_at)
+            if error is None:
+                write.future.set_result(result)
+            else:
+                write.future.set_exception(error)
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            write_queue_depth.dec(len(batch))
+            with background_work():
+                self._write(batch)
+
+
+_write_queue: WriteQueue | None = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteQueue:
+    """Return the write queue configured by the ``WRITE_QUEUE_*`` settings."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue(
+                batch_size=settings.WRITE_QUEUE_BATCH_SIZE,
+                background=settings.WRITE_QUEUE_BACKGROUND,
+            )
+        return _write_queue
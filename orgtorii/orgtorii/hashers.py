@@ -1,9 +1,165 @@
-from django.contrib.auth.hashers import Argon2PasswordHasher
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import Argon2PasswordHasher, make_password
+from django.core.cache import cache
+from prometheus_client import Gauge, Histogram
+
+from orgtorii.db.threads import background_work
+
+password_hashing_queue_depth = Gauge(
+    "password_hashing_queue_depth", "Password hashes waiting for a hashing thread"
+)
+password_hashing_in_progress = Gauge(
+    "password_hashing_in_progress", "Password hashes being computed"
+)
+password_hashing_seconds = Histogram(
+    "password_hashing_seconds",
+    "Time spent computing password hashes, excluding the wait for a hashing thread",
+    ["operation"],
+)
+password_hashing_wait_seconds = Histogram(
+    "password_hashing_wait_seconds", "Time password hashes waited for a hashing thread"
+)
+
+_UPGRADED_SESSION_HASH_KEY = "users:{}:upgraded-session-auth-hash"
+
+
+class HashingExecutor:
+    """Compute password hashes on a bounded pool of threads.
+
+    argon2 releases the GIL while hashing, so hashes are computed in parallel, but each
+    one needs ``memory_cost`` KiB of memory. Bounding the number of threads bounds the
+    memory a burst of logins can take, further hashes queue for a thread.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix="password-hashing")
+        self._local = threading.local()
+
+    def submit(self, operation: str, function: Callable[..., Any], *args: Any) -> Future:
+        """Schedule a hashing function, returning a future for its result.
+
+        Args:
+            operation (str): what the function does, e.g. encode or verify, for the metrics
+            function (Callable): the function computing the hash
+            *args: the arguments of the function
+        """
+        queued_at = time.perf_counter()
+        password_hashing_queue_depth.inc()
+
+        def run():
+            password_hashing_queue_depth.dec()
+            password_hashing_wait_seconds.observe(time.perf_counter() - queued_at)
+            self._local.in_pool = True
+            with (
+                password_hashing_in_progress.track_inprogress(),
+                password_hashing_seconds.labels(operation).time(),
+            ):
+                return function(*args)
+
+        return self._pool.submit(run)
+
+    def run(self, operation: str, function: Callable[..., Any], *args: Any) -> Any:
+        """Run a hashing function on the pool and wait for its result."""
+        if getattr(self._local, "in_pool", False):
+            # Already on a hashing thread, waiting for another one could deadlock
+            return function(*args)
+        return self.submit(operation, function, *args).result()
+
+
+_executor: HashingExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor() -> HashingExecutor:
+    """Return the executor sized by ``settings.PASSWORD_HASHING_THREADS``."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = HashingExecutor(settings.PASSWORD_HASHING_THREADS)
+        return _executor
 
 
 class SecureArgon2PasswordHasher(Argon2PasswordHasher):
-    # Recommended values from OWASP
+    # Recommended values from OWASP, tune them for the host with the
+    # calibrate_password_hasher command
     # https://cheatsheetseries.owasp.org/cheatsheets/Password_Storage_Cheat_Sheet.html
-    time_cost = 2  # 2 iterations
-    memory_cost = 20 * 1024  # 20MB
     parallelism = 1  # 1 parallel
+
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    def encode(self, password, salt):
+        return get_hashing_executor().run("encode", super().encode, password, salt)
+
+    def verify(self, password, encoded):
+        return get_hashing_executor().run("verify", super().verify, password, encoded)
+
+
+def _password_upgrade(*, user_id: int, encoded: str, raw_password: str) -> bool:
+    user_model = get_user_model()
+    user = user_model(pk=user_id, password=encoded)
+    upgraded = make_password(raw_password)
+    key = _UPGRADED_SESSION_HASH_KEY.format(user_id)
+    # Sessions started with the outdated hash remain valid while the password is the
+    # upgraded one, see OrgToriiUser.get_session_auth_fallback_hash. Cached before the
+    # update so no request sees the upgraded password without it
+    cache.set(key, (upgraded, user.get_session_auth_hash()), settings.SESSION_COOKIE_AGE)
+    # Unless the password was changed in the meantime
+    if user_model.objects.filter(pk=user_id, password=encoded).update(password=upgraded):
+        return True
+    cache.delete(key)
+    return False
+
+
+def password_upgrade_in_background(*, user_id: int, encoded: str, raw_password: str) -> Future:
+    """Rehash a password with the preferred hasher and parameters on a hashing thread.
+
+    The password is only kept in memory: it is never written to the job queue.
+
+    Args:
+        user_id (int): the id of the user
+        encoded (str): the outdated password hash of the user
+        raw_password (str): the password, just checked against ``encoded``
+
+    Returns:
+        Future: whether the password was upgraded
+    """
+
+    def upgrade():
+        with background_work():
+            return _password_upgrade(user_id=user_id, encoded=encoded, raw_password=raw_password)
+
+    return get_hashing_executor().submit("upgrade", upgrade)
+
+
+def upgraded_session_auth_hash(*, user_id: int, password: str) -> str | None:
+    """Return the session auth hash of a user from before their password hash was upgraded.
+
+    Args:
+        user_id (int): the id of the user
+        password (str): the current password hash of the user
+
+    Returns:
+        str | None: the session auth hash, if ``password`` is still the upgraded hash
+    """
+    upgraded = cache.get(_UPGRADED_SESSION_HASH_KEY.format(user_id))
+    if upgraded is None or upgraded[0] != password:
+        return None
+    return upgraded[1]
+
+
+def upgraded_session_auth_hash_delete(*, user_id: int) -> None:
+    """Stop accepting the sessions started before a user's password hash was upgraded."""
+    cache.delete(_UPGRADED_SESSION_HASH_KEY.format(user_id))
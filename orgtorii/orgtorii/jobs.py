@@ -0,0 +1,309 @@
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Protocol
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from orgtorii.db.threads import background_work
+
+logger = logging.getLogger(__name__)
+
+_registry: dict[str, "JobFunction"] = {}
+
+
+@dataclass
+class JobFunction:
+    function: Callable[..., Any]
+    max_retries: int
+    retry_delay: float  # seconds before the first retry, doubled for every retry
+
+
+@dataclass
+class Job:
+    name: str
+    kwargs: dict[str, Any] = field(default_factory=dict)
+    attempt: int = 0
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, payload: str | bytes) -> "Job":
+        return cls(**json.loads(payload))
+
+
+class Broker(Protocol):
+    def enqueue(self, job: Job, delay: float = 0) -> None: ...
+
+    def dequeue(self, timeout: float) -> Job | None: ...
+
+    def ack(self, job: Job) -> None: ...
+
+
+class InMemoryBroker:
+    """A broker keeping jobs in the memory of the current process, for tests and development."""
+
+    def __init__(self) -> None:
+        self._ready: queue.Queue[Job] = queue.Queue()
+        self._delayed: list[tuple[float, int, Job]] = []
+        self._lock = threading.Lock()
+        self._counter = 0  # Keeps jobs due at the same time in order
+
+    def __len__(self) -> int:
+        return self._ready.qsize() + len(self._delayed)
+
+    def enqueue(self, job: Job, delay: float = 0) -> None:
+        if delay <= 0:
+            self._ready.put(job)
+            return
+        with self._lock:
+            self._counter += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._counter, job))
+
+    def dequeue(self, timeout: float) -> Job | None:
+        with self._lock:
+            while self._delayed and self._delayed[0][0] <= time.monotonic():
+                self._ready.put(heapq.heappop(self._delayed)[2])
+        try:
+            return self._ready.get(timeout=timeout) if timeout > 0 else self._ready.get_nowait()
+        except queue.Empty:
+            return None
+
+    def ack(self, job: Job) -> None:
+        # Jobs in memory are lost with the process anyway
+        pass
+
+
+class ValkeyBroker:
+    """A broker storing jobs in Valkey (or Redis) lists, shared by all processes.
+
+    Jobs to retry later wait in a sorted set scored by when they are due and are moved
+    to the list by whichever worker dequeues next.
+
+    A dequeued job is moved to the processing list of its worker in the same command
+    (``BLMOVE``) and only removed from it once acknowledged. Every worker records a
+    heartbeat: the jobs of a worker without one for ``dead_after`` seconds, e.g. a
+    crashed one, are moved back to be run again by the next worker dequeueing.
+    """
+
+    heartbeat_interval = 10
+    dead_after = 60
+
+    def __init__(self, url: str, name: str = "jobs") -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("The Valkey job broker requires the redis package.") from e
+        self._client = redis.Redis.from_url(url)
+        self._ready = f"{name}:ready"
+        self._delayed = f"{name}:delayed"
+        self._workers = f"{name}:workers"
+        self._processing_prefix = f"{name}:processing:"
+        self._worker_id = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heartbeat: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def _processing(self) -> str:
+        return self._processing_prefix + self._worker_id
+
+    def enqueue(self, job: Job, delay: float = 0) -> None:
+        if delay <= 0:
+            self._client.lpush(self._ready, job.dumps())
+        else:
+            self._client.zadd(self._delayed, {job.dumps(): time.time() + delay})
+
+    def dequeue(self, timeout: float) -> Job | None:
+        self._start_heartbeat()
+        self._requeue_dead_workers()
+        for payload in self._client.zrangebyscore(self._delayed, "-inf", time.time(), 0, 100):
+            # Only the worker which removes a due job moves it
+            if self._client.zrem(self._delayed, payload):
+                self._client.lpush(self._ready, payload)
+        if timeout > 0:
+            payload = self._client.blmove(
+                self._ready, self._processing, max(1, round(timeout)), "RIGHT", "LEFT"
+            )
+        else:
+            payload = self._client.lmove(self._ready, self._processing, "RIGHT", "LEFT")
+        if payload is None:
+            return None
+        job = Job.loads(payload)
+        job._payload = payload  # Removed from the processing list as is by ack()
+        return job
+
+    def ack(self, job: Job) -> None:
+        self._client.lrem(self._processing, 1, getattr(job, "_payload", None) or job.dumps())
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is None:
+                self._client.zadd(self._workers, {self._worker_id: time.time()})
+                self._heartbeat = threading.Thread(
+                    target=self._beat, name="job-broker-heartbeat", daemon=True
+                )
+                self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self._client.zadd(self._workers, {self._worker_id: time.time()})
+            except Exception:
+                logger.warning("Recording the heartbeat of the job worker failed", exc_info=True)
+
+    def _requeue_dead_workers(self) -> None:
+        dead = self._client.zrangebyscore(self._workers, "-inf", time.time() - self.dead_after)
+        for worker_id in dead:
+            # Only the worker which removes a dead worker requeues its jobs
+            if not self._client.zrem(self._workers, worker_id):
+                continue
+            processing = self._processing_prefix + worker_id.decode()
+            while self._client.lmove(processing, self._ready, "RIGHT", "RIGHT") is not None:
+                pass
+            logger.warning("Requeued the jobs of the unresponsive job worker %s", worker_id)
+
+
+_broker: Broker | None = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> Broker:
+    """Return the broker configured by ``settings.JOBS_BROKER_URL``.
+
+    ``memory://`` keeps jobs in the current process, ``redis://`` URLs point to Valkey.
+    A separate ``run_worker`` process can't see jobs kept in memory, so they are only
+    allowed in development, where a worker thread of the process runs them, and tests.
+
+    Raises:
+        ImproperlyConfigured: if the URL is unsupported, or ``memory://`` in production
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            url = settings.JOBS_BROKER_URL
+            if url.startswith("memory://"):
+                if not (settings.DEBUG or settings.TESTING):
+                    raise ImproperlyConfigured(
+                        "JOBS_BROKER_URL must point to Valkey outside of development, jobs "
+                        "kept in memory are never seen by run_worker"
+                    )
+                _broker = InMemoryBroker()
+                if not settings.TESTING:
+                    worker = Worker(_broker, concurrency=1)
+                    threading.Thread(target=worker.run, name="job-worker", daemon=True).start()
+            elif url.startswith(("redis://", "rediss://", "unix://")):
+                _broker = ValkeyBroker(url)
+            else:
+                raise ImproperlyConfigured(f"Unsupported job broker URL: {url}")
+        return _broker
+
+
+def register(
+    name: str, *, max_retries: int = 3, retry_delay: float = 30
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register a function to be run as a background job.
+
+    >>> @register("send_welcome_email")
+    ... def send_welcome_email(*, user_id): ...
+
+    Args:
+        name (str): the name jobs are enqueued with
+        max_retries (int): how many times a failed job is retried
+        retry_delay (float): seconds before the first retry, doubled for every retry
+    """
+
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        _registry[name] = JobFunction(function, max_retries=max_retries, retry_delay=retry_delay)
+        return function
+
+    return decorator
+
+
+def enqueue(name: str, **kwargs: Any) -> None:
+    """Queue a registered job to be run by a worker.
+
+    Args:
+        name (str): the name of the job
+        **kwargs: JSON-serializable keyword arguments for the job function
+    """
+    if name not in _registry:
+        raise ValueError(f"Unknown job: {name}")
+    get_broker().enqueue(Job(name=name, kwargs=kwargs))
+
+
+class Worker:
+    """Run queued jobs on a bounded pool of threads.
+
+    At most ``concurrency`` jobs run at once; no more jobs are taken from the broker
+    while all threads are busy, so the remaining jobs stay available to other workers.
+    Failed jobs are retried with an exponential backoff.
+    """
+
+    def __init__(self, broker: Broker | None = None, concurrency: int = 4) -> None:
+        self.broker = broker if broker is not None else get_broker()
+        self.concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._stopping = threading.Event()
+
+    def process(self, job: Job) -> bool:
+        """Run a job in the current thread, queueing a retry if it fails.
+
+        Returns:
+            bool: whether the job succeeded
+        """
+        job_function = _registry.get(job.name)
+        if job_function is None:
+            logger.error("Dropping unknown job %s", job.name)
+            return False
+        try:
+            job_function.function(**job.kwargs)
+        except Exception:
+            if job.attempt >= job_function.max_retries:
+                logger.exception("Job %s failed after %d attempts", job.name, job.attempt + 1)
+                return False
+            delay = job_function.retry_delay * 2**job.attempt
+            logger.warning("Job %s failed, retrying in %.0fs", job.name, delay, exc_info=True)
+            self.broker.enqueue(Job(job.name, job.kwargs, job.attempt + 1), delay=delay)
+            return False
+        return True
+
+    def run(self, *, burst: bool = False, poll_interval: float = 5) -> None:
+        """Take jobs from the broker and run them until ``stop`` is called.
+
+        Args:
+            burst (bool): stop once the queue is empty
+            poll_interval (float): seconds to wait for a job before checking for due retries
+        """
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="job-worker") as pool:
+            while not self._stopping.is_set():
+                self._slots.acquire()
+                job = self.broker.dequeue(timeout=0 if burst else poll_interval)
+                if job is None:
+                    self._slots.release()
+                    if burst:
+                        break
+                    continue
+                pool.submit(self._run_in_slot, job)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _run_in_slot(self, job: Job) -> None:
+        try:
+            with background_work():
+                self.process(job)
+                # A failed job is queued again as a retry by process()
+                self.broker.ack(job)
+        finally:
+            self._slots.release()
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+_missing = object()
+
+
+class LRUCache:
+    """A bounded, thread-safe, in-process least recently used cache.
+
+    Entries optionally expire after ``ttl`` seconds so values cached by one process
+    eventually pick up changes made by other processes.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set("a", 1)
+    >>> cache.set("b", 2)
+    >>> cache.get("a")
+    1
+    >>> cache.set("c", 3)  # evicts "b", the least recently used
+    >>> cache.get("b") is None
+    True
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float | None, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for a key, or ``default`` if missing or expired."""
+        with self._lock:
+            expires_at, value = self._entries.get(key, (None, _missing))
+            if value is not _missing and expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                value = _missing
+            if value is _missing:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """Cache a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): the cache key
+            value (Any): the value to cache
+            ttl (float | None): seconds until the entry expires, defaults to the cache ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove a key from the cache, returning whether it was cached."""
+        with self._lock:
+            return self._entries.pop(key, _missing) is not _missing
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
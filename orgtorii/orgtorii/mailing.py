@@ -0,0 +1,200 @@
+import queue
+import smtplib
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+class TokenBucket:
+    """Limit how often something happens, e.g. how many emails are sent per second.
+
+    The bucket holds up to ``capacity`` tokens and is refilled with ``rate`` tokens per
+    second. Taking a token blocks until one is available, so bursts of up to ``capacity``
+    are allowed while the average rate stays below ``rate``.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Take tokens from the bucket, waiting until enough are available.
+
+        Args:
+            tokens (float): the number of tokens to take
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmailConnectionPool:
+    """Share open email backend connections (e.g. SMTP sessions) between threads.
+
+    Opening an SMTP connection takes a TCP and TLS handshake and a login, so connections
+    are reused for up to ``max_messages`` messages, after which they are closed as mail
+    servers limit the messages per session. At most ``size`` connections are open.
+
+    The connections are created with ``get_connection(backend, **options)``, the
+    ``EMAIL_*`` settings by default.
+    """
+
+    def __init__(
+        self, *, size: int, max_messages: int = 100, backend: str | None = None, **options: Any
+    ) -> None:
+        self.max_messages = max_messages
+        self._backend = backend
+        self._options = options
+        self._idle: queue.LifoQueue[tuple[BaseEmailBackend, int]] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """Borrow an open connection, opening one if none is idle."""
+        with self._slots:
+            try:
+                connection, sent = self._idle.get_nowait()
+            except queue.Empty:
+                connection = get_connection(self._backend, fail_silently=False, **self._options)
+                connection.open()
+                sent = 0
+            try:
+                yield connection
+            except BaseException:
+                # The connection may be in the middle of a command
+                connection.close()
+                raise
+            sent += 1
+            if sent >= self.max_messages:
+                connection.close()
+            else:
+                self._idle.put((connection, sent))
+
+    def send(self, message: EmailMessage) -> None:
+        """Send a message on a pooled connection, reconnecting once if it was closed.
+
+        Args:
+            message (EmailMessage): the message to send
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as connection:
+                    connection.send_messages([message])
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Idle connections are closed by the server after a while
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        """Close the idle connections."""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        server: LocalSMTPServer = self.server
+        if server.connect_latency:
+            time.sleep(server.connect_latency)
+        self.reply("220 localhost ESMTP")
+        recipients: list[str] = []
+        while line := self.rfile.readline():
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.partition(":")[2].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while (line := self.rfile.readline()) not in (b".\r\n", b""):
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.lock:
+                    server.messages.append((recipients, b"".join(data)))
+                self.reply("250 OK")
+            elif verb == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """A minimal SMTP server keeping the messages it receives in memory.
+
+    A stand-in for a mail server in tests and benchmarks, not for production. Like a
+    remote server, connections take ``connect_latency`` seconds to be greeted and every
+    message ``latency`` seconds to be accepted.
+
+    >>> with LocalSMTPServer() as server:
+    ...     server.start()
+    ...     send_mail(..., connection=get_connection(host="127.0.0.1", port=server.port))
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *, latency: float = 0, connect_latency: float = 0, port: int = 0) -> None:
+        super().__init__(("127.0.0.1", port), _SMTPHandler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.messages: list[tuple[list[str], bytes]] = []
+        self.lock = threading.Lock()
+        self.connections = 0
+        self._serving = False
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def start(self) -> None:
+        """Serve connections on a background thread until ``shutdown`` is called."""
+        threading.Thread(target=self.serve_forever, name="local-smtp", daemon=True).start()
+        self._serving = True
+
+    def __exit__(self, *args: Any) -> None:
+        if self._serving:
+            self.shutdown()
+        super().__exit__(*args)
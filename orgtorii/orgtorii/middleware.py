@@ -0,0 +1,121 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, security
+from django_prometheus import middleware as prometheus
+from whitenoise import middleware as whitenoise
+
+
+def _inline(hook):
+    async def inline_hook(*args):
+        return hook(*args)
+
+    return inline_hook
+
+
+class InlineHooksMixin:
+    """Call the hooks of a ``MiddlewareMixin`` middleware directly on the event loop.
+
+    Under ASGI Django runs every synchronous hook in the single thread reserved for sync
+    code, a round trip which costs more than the hooks themselves and serializes all
+    requests. Only use this for middleware whose hooks never block, i.e. don't touch the
+    database, cache or files, nor read the request body: ``CsrfViewMiddleware`` reads
+    ``request.POST``, which parses multipart uploads, so it stays on Django's sync path.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.async_mode:
+            # Django looks these hooks up on the instance and only runs sync ones in a thread
+            for name in ("process_view", "process_template_response"):
+                if hasattr(self, name):
+                    setattr(self, name, _inline(getattr(self, name)))
+
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, "process_request"):
+            response = self.process_request(request)
+        response = response or await self.get_response(request)
+        if hasattr(self, "process_response"):
+            response = self.process_response(request, response)
+        return response
+
+
+class SecurityMiddleware(InlineHooksMixin, security.SecurityMiddleware):
+    pass
+
+
+class CommonMiddleware(InlineHooksMixin, common.CommonMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(InlineHooksMixin, auth.AuthenticationMiddleware):
+    # Only sets up the lazy request.user and request.auser
+    pass
+
+
+class XFrameOptionsMiddleware(InlineHooksMixin, clickjacking.XFrameOptionsMiddleware):
+    pass
+
+
+class PrometheusBeforeMiddleware(InlineHooksMixin, prometheus.PrometheusBeforeMiddleware):
+    pass
+
+
+class PrometheusAfterMiddleware(InlineHooksMixin, prometheus.PrometheusAfterMiddleware):
+    pass
+
+
+class SessionMiddleware(sessions.SessionMiddleware):
+    async def __acall__(self, request):
+        self.process_request(request)
+        response = await self.get_response(request)
+        if request.session.modified or settings.SESSION_SAVE_EVERY_REQUEST:
+            # Saving the session writes to the session store
+            return await sync_to_async(self.process_response)(request, response)
+        return self.process_response(request, response)
+
+
+class MessageMiddleware(messages.MessageMiddleware):
+    async def __acall__(self, request):
+        self.process_request(request)
+        response = await self.get_response(request)
+        storage = request._messages
+        if storage.used or storage.added_new:
+            # Storing messages may read the session from the session store
+            return await sync_to_async(self.process_response)(request, response)
+        return self.process_response(request, response)
+
+
+class WhiteNoiseMiddleware(whitenoise.WhiteNoiseMiddleware):
+    """WhiteNoise's middleware, able to run in an async middleware chain.
+
+    The upstream middleware is synchronous only, so under ASGI Django would run every
+    request after it, views included, through a thread pool. Static files are looked up
+    in memory (unless autorefresh is on), so they can be served from the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
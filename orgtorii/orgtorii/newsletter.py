@@ -0,0 +1,212 @@
+import atexit
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+
+from orgtorii.core import models as core_models
+from orgtorii.db.threads import background_work
+from orgtorii.db.writer import get_write_queue
+from orgtorii.sketches import BloomFilter
+
+logger = logging.getLogger(__name__)
+
+# Seconds the writer waits before retrying a batch which couldn't be written
+_RETRY_DELAY = 1
+# Subscribed emails added to the Bloom filter at a time while refreshing it
+_REFRESH_CHUNK_SIZE = 2000
+
+
+class NewsletterSignupBuffer:
+    """Accept newsletter signups in memory and write them to the database in batches.
+
+    Every signup otherwise takes a SELECT for the unique check and a write transaction of
+    its own, which queue behind SQLite's single writer lock during signup spikes.
+
+    Duplicates are detected with a Bloom filter of the subscribed emails, so only emails
+    which may already be subscribed are looked up in the database. Emails subscribed by
+    other processes are added to the filter every ``refresh_interval`` seconds; a
+    duplicate signed up in between is still accepted and ignored by the database.
+
+    The database is never queried holding the lock shared by the signups, so a slow
+    query only delays its own signup. A single thread refreshes the filter at a time,
+    the others go on with the emails it already has.
+
+    A writer thread inserts the accepted emails with ``INSERT OR IGNORE``, handed to
+    ``orgtorii.db.writer.WriteQueue``, the emails accepted while it writes form its next
+    batch. A batch which fails, or isn't committed in time, is retried until written,
+    so an accepted signup is written at least once as long as the process keeps running.
+    Without ``background`` every signup is written before ``add`` returns.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 500,
+        background: bool = True,
+        refresh_interval: float = 5,
+        capacity: int = 100_000,
+    ) -> None:
+        self.batch_size = batch_size
+        self.background = background
+        self.refresh_interval = refresh_interval
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # A single thread refreshes the filter
+        self._flush_lock = threading.Lock()  # A single batch is written at a time
+        self._known: BloomFilter | None = None
+        self._max_pk = 0
+        self._refreshed_at = float("-inf")
+        self._pending: dict[str, Future] = {}  # Ordered by signup
+        self._wakeup = threading.Event()
+        self._writer: threading.Thread | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, email: str) -> Future | None:
+        """Accept a signup unless the email is already subscribed.
+
+        Args:
+            email (str): the email to subscribe
+
+        Returns:
+            Future | None: resolved once the signup is written, None if already subscribed
+        """
+        self._refresh()
+        with self._lock:
+            if email in self._pending:
+                return None
+            maybe_subscribed = email in self._known
+        if maybe_subscribed and core_models.NewsletterSignup.objects.filter(email=email).exists():
+            return None
+        with self._lock:
+            if email in self._pending:  # Accepted by another thread meanwhile
+                return None
+            future = Future()
+            self._pending[email] = future
+            self._known.add(email)
+
+        if self.background:
+            self._start_writer()
+            self._wakeup.set()
+        else:
+            self.flush()
+        return future
+
+    def flush(self) -> int:
+        """Write the waiting signups to the database in the current thread.
+
+        A batch which fails is put back in front of the waiting signups.
+
+        Returns:
+            int: the number of signups written
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                # In the same transaction as the other writes of the process
+                get_write_queue().run(
+                    core_models.NewsletterSignup.objects.bulk_create,
+                    [core_models.NewsletterSignup(email=email) for email in batch],
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True,
+                    timeout=settings.WRITE_QUEUE_TIMEOUT,
+                )
+            except BaseException:
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                raise
+            for future in batch.values():
+                future.set_result(True)
+            return len(batch)
+
+    def _refresh(self) -> None:
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        # Only the first signups wait for the filter to be loaded
+        if not self._refresh_lock.acquire(blocking=self._known is None):
+            return
+        try:
+            if time.monotonic() - self._refreshed_at < self.refresh_interval:
+                return
+            known, max_pk = self._known, self._max_pk
+            if known is None or len(known) > known.capacity:
+                # A full filter gives too many false positives, start over with a larger
+                # one, used once loaded
+                known = BloomFilter(max(self.capacity, 2 * len(known or ())))
+                max_pk = 0
+            rows = (
+                core_models.NewsletterSignup.objects.filter(pk__gt=max_pk)
+                .order_by("pk")
+                .values_list("pk", "email")
+                .iterator(chunk_size=_REFRESH_CHUNK_SIZE)
+            )
+            while chunk := list(itertools.islice(rows, _REFRESH_CHUNK_SIZE)):
+                with self._lock:
+                    for _, email in chunk:
+                        known.add(email)
+                max_pk = chunk[-1][0]
+            with self._lock:
+                if known is not self._known:
+                    # Of the emails accepted meanwhile, the written ones are loaded by the
+                    # next refresh
+                    for email in self._pending:
+                        known.add(email)
+                    self._known = known
+                self._max_pk = max_pk
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(
+                target=self._run, name="newsletter-signup-writer", daemon=True
+            )
+            self._writer.start()
+        # Don't lose the waiting signups when the server shuts down gracefully
+        atexit.register(self._flush_at_exit)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with background_work():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Writing %d newsletter signups failed, retrying", len(self))
+                    time.sleep(_RETRY_DELAY)
+                    self._wakeup.set()
+
+    def _flush_at_exit(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Lost %d newsletter signups", len(self))
+
+
+_buffer: NewsletterSignupBuffer | None = None
+_buffer_lock = threading.Lock()
+
+
+def get_signup_buffer() -> NewsletterSignupBuffer:
+    """Return the buffer configured by the ``NEWSLETTER_SIGNUP_*`` settings."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = NewsletterSignupBuffer(
+                batch_size=settings.NEWSLETTER_SIGNUP_BATCH_SIZE,
+                background=settings.NEWSLETTER_SIGNUP_BACKGROUND_WRITES,
+                refresh_interval=settings.NEWSLETTER_SIGNUP_REFRESH_INTERVAL,
+            )
+        return _buffer
@@ -0,0 +1,179 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.regex_helper import _lazy_re_compile
+
+_accepts_gzip_re = _lazy_re_compile(r"\bgzip\b")
+# Headers which are set again for every response served from the cache
+_UNCACHED_HEADERS = {"content-length", "content-encoding", "date", "etag", "last-modified"}
+# Seconds a worker waiting for another one to render a page checks the cache again
+_POLL_INTERVAL = 0.05
+
+
+@dataclass(frozen=True, slots=True)
+class PageCacheEntry:
+    body: bytes  # gzip compressed
+    headers: tuple[tuple[str, str], ...]
+    etag: str
+    last_modified: int
+    fresh_until: float
+
+
+def cache_anonymous_page(view):
+    """Mark a view whose pages are cached for anonymous visitors by ``PageCacheMiddleware``.
+
+    The page must be the same for every anonymous visitor, so it can't contain a CSRF
+    token: the ``csrf.js`` script loaded by the base template adds one to its forms.
+    """
+    view.cache_anonymous_page = True
+    return view
+
+
+def _page_key(request) -> str:
+    uri = request.build_absolute_uri().encode()
+    return f"page:{hashlib.md5(uri, usedforsecurity=False).hexdigest()}"
+
+
+class PageCacheMiddleware:
+    """Serve the pages of views marked with ``cache_anonymous_page`` from the cache.
+
+    Only GET requests without a session (or messages) cookie are cached, for
+    ``settings.PAGE_CACHE_TIMEOUT`` seconds. Pages are stored gzip compressed with an
+    ETag and Last-Modified date, so revalidation requests get a 304 response.
+
+    Once a page expires, a single worker renders it again: the others keep serving the
+    expired page for up to ``settings.PAGE_CACHE_STALE_TIMEOUT`` seconds meanwhile, or
+    wait for the page if there is none.
+
+    Under ASGI the cache reads and writes, and the compression of the pages, run in
+    threads rather than on the event loop. The cache is thread safe, so they don't queue
+    for the thread Django reserves for sync code.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = self._key(request)
+        if key is None:
+            return self.get_response(request)
+        deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_TIMEOUT
+        while (result := self._lookup(key)) is None and time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+        entry, locked = result or (None, False)
+        if entry is not None:
+            return self._respond(request, entry)
+        try:
+            return self._store(request, key, self.get_response(request))
+        finally:
+            if locked:
+                cache.touch(f"{key}:lock", 0)
+
+    async def __acall__(self, request):
+        key = self._key(request)
+        if key is None:
+            return await self.get_response(request)
+        lookup = sync_to_async(self._lookup, thread_sensitive=False)
+        deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_TIMEOUT
+        while (result := await lookup(key)) is None and time.monotonic() < deadline:
+            await asyncio.sleep(_POLL_INTERVAL)
+        entry, locked = result or (None, False)
+        if entry is not None:
+            return await sync_to_async(self._respond, thread_sensitive=False)(request, entry)
+        try:
+            response = await self.get_response(request)
+            return await sync_to_async(self._store, thread_sensitive=False)(request, key, response)
+        finally:
+            if locked:
+                await sync_to_async(cache.touch, thread_sensitive=False)(f"{key}:lock", 0)
+
+    def _key(self, request) -> str | None:
+        if not settings.PAGE_CACHE_TIMEOUT or request.method != "GET":
+            return None
+        if "HX-Request" in request.headers:
+            return None
+        cookies = (settings.SESSION_COOKIE_NAME, CookieStorage.cookie_name)
+        if any(cookie in request.COOKIES for cookie in cookies):
+            return None
+        try:
+            match = resolve(request.path_info, getattr(request, "urlconf", None))
+        except Resolver404:
+            return None
+        if not getattr(match.func, "cache_anonymous_page", False):
+            return None
+        return _page_key(request)
+
+    def _lookup(self, key: str) -> tuple[PageCacheEntry | None, bool] | None:
+        """Return the page to serve or whether to render it holding the lock.
+
+        ``None`` means another worker is rendering a page which isn't cached yet.
+        """
+        entry = cache.get(key)
+        if entry is not None and entry.fresh_until > time.time():
+            return entry, False
+        if cache.add(f"{key}:lock", True, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            return None, True
+        if entry is not None:
+            return entry, False
+        return None
+
+    def _store(self, request, key: str, response):
+        if (
+            response.status_code != 200
+            or response.streaming
+            or response.cookies
+            or response.has_header("Content-Encoding")
+            or "private" in response.get("Cache-Control", "")
+            or "no-store" in response.get("Cache-Control", "")
+        ):
+            return response
+        now = time.time()
+        entry = PageCacheEntry(
+            body=gzip.compress(response.content, mtime=0),
+            headers=tuple(
+                (name, value)
+                for name, value in response.items()
+                if name.lower() not in _UNCACHED_HEADERS
+            ),
+            etag=f'W/"{hashlib.md5(response.content, usedforsecurity=False).hexdigest()}"',
+            last_modified=int(now),
+            fresh_until=now + settings.PAGE_CACHE_TIMEOUT,
+        )
+        timeout = settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT
+        cache.set(key, entry, timeout)
+        return self._respond(request, entry)
+
+    def _respond(self, request, entry: PageCacheEntry):
+        response = get_conditional_response(
+            request, etag=entry.etag, last_modified=entry.last_modified
+        )
+        if response is None:
+            if _accepts_gzip_re.search(request.headers.get("Accept-Encoding", "")):
+                response = HttpResponse(entry.body, headers=entry.headers)
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(gzip.decompress(entry.body), headers=entry.headers)
+            response["Content-Length"] = str(len(response.content))
+        response["ETag"] = entry.etag
+        response["Last-Modified"] = http_date(entry.last_modified)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
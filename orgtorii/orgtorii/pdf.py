@@ -0,0 +1,114 @@
+import re
+import zlib
+
+# The dictionary of a stream object and the start of its data
+_stream_re = re.compile(rb"obj\s*(<<.*?>>)\s*stream\r?\n", re.DOTALL)
+# Literal strings (one level of nested parentheses), hex strings, arrays, operators and operands
+_token_re = re.compile(
+    rb"\((?:\\.|[^\\()]|\((?:\\.|[^\\()])*\))*\)|<[0-9A-Fa-f\s]*>|\[|\]|[^\s\[\]()<>/]+|/[^\s\[\]()<>/]*",
+    re.DOTALL,
+)
+_escape_re = re.compile(rb"\\([0-7]{1,3}|\r\n|.)", re.DOTALL)
+_escapes = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+# Operators which show text, see section 9.4.3 of the PDF specification
+_show_text_operators = {b"Tj", b"TJ", b"'", b'"'}
+# Operators which move to a new line or end a block of text
+_line_break_operators = {b"Td", b"TD", b"T*", b"Tm", b"ET", b"'", b'"'}
+_typed_stream_keys = (b"/Type", b"/Subtype", b"/Length1")
+
+
+def _decode_literal(token: bytes) -> bytes:
+    def unescape(match: re.Match) -> bytes:
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        if escaped in (b"\n", b"\r", b"\r\n"):
+            return b""  # A line continuation
+        return _escapes.get(escaped, escaped)
+
+    return _escape_re.sub(unescape, token[1:-1])
+
+
+def _decode_string(token: bytes) -> str:
+    if token.startswith(b"("):
+        raw = _decode_literal(token)
+    else:
+        hex_digits = re.sub(rb"\s", b"", token[1:-1])
+        raw = bytes.fromhex((hex_digits + b"0" * (len(hex_digits) % 2)).decode())
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", "replace")
+    return raw.decode("latin-1")
+
+
+def _content_text(content: bytes) -> str:
+    lines: list[str] = []
+    line: list[str] = []
+    operands: list[bytes] = []
+    in_array = False
+    for token in _token_re.findall(content):
+        if token == b"[":
+            in_array = True
+        elif token == b"]":
+            in_array = False
+        elif token[:1] in b"(<" or in_array:
+            operands.append(token)
+        elif token[:1] == b"/" or token[:1].isdigit() or token[:1] in b"+-.":
+            continue
+        else:
+            if token in _line_break_operators and line:
+                lines.append("".join(line))
+                line = []
+            if token in _show_text_operators:
+                for operand in operands:
+                    if operand[:1] in b"(<":
+                        line.append(_decode_string(operand))
+                    # A large negative kerning adjustment in a TJ array is a word gap
+                    elif (
+                        operand.lstrip(b"+-").replace(b".", b"", 1).isdigit()
+                        and float(operand) < -200
+                    ):
+                        line.append(" ")
+            operands = []
+    if line:
+        lines.append("".join(line))
+    return "\n".join(lines)
+
+
+def extract_text(data: bytes) -> str:
+    """Extract the text shown on the pages of a PDF document.
+
+    This is deliberately minimal: it reads the text operators of uncompressed and
+    Flate compressed content streams, which covers PDFs generated by payroll software
+    using standard fonts. Text in images (scans) or in fonts with custom encodings is not
+    extracted.
+
+    Args:
+        data (bytes): the contents of the PDF file
+
+    Returns:
+        str: the extracted text, one line per line of text in the document
+    """
+    texts = []
+    for match in _stream_re.finditer(data):
+        dictionary = match.group(1)
+        # Page content streams are the only streams without a type, images, fonts and
+        # cross-reference streams all have one
+        if any(key in dictionary for key in _typed_stream_keys):
+            continue
+        end = data.find(b"endstream", match.end())
+        if end == -1:
+            break
+        stream = data[match.end() : end]
+        if b"/FlateDecode" in dictionary:
+            decompressor = zlib.decompressobj()
+            try:
+                stream = decompressor.decompress(stream)
+            except zlib.error:
+                continue
+        elif b"/Filter" in dictionary:
+            # Other filters are used for images and fonts rather than text
+            continue
+        text = _content_text(stream)
+        if text:
+            texts.append(text)
+    return "\n".join(texts)
@@ -0,0 +1,210 @@
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import BigIntegerField, CharField, F, IntegerField, Model, Q, QuerySet, Value
+from django.db.models.functions import Cast, Concat
+from guardian.backends import check_user_support
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+# Bumped whenever a permission is granted or revoked, see ``invalidate``
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def invalidate() -> None:
+    """Forget the permissions memoized by every ``PermissionResolver`` of the process.
+
+    Called by signal receivers when permissions, groups or object permissions are saved
+    or deleted. Changes which send no signals, such as guardian's ``assign_perm`` on a
+    queryset which uses ``bulk_create``, must call it themselves.
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def _object_key(obj: Model) -> tuple[int, str]:
+    return ContentType.objects.get_for_model(obj).id, str(obj.pk)
+
+
+class PermissionResolver:
+    """Check the global and object permissions of a user, memoizing them.
+
+    ``user.has_perm`` asks ``ModelBackend`` and guardian's ``ObjectPermissionBackend``
+    in turn, which query the permissions of every object on its own. The resolver loads
+    the global permissions and the object permissions of a set of objects in a single
+    query instead, see ``preload``, and answers later checks from memory.
+
+    A resolver is kept on the user object, which lives for a request, by
+    ``get_resolver``. It forgets what it loaded when ``invalidate`` is called.
+
+    Unlike ``user.has_perm(permission, obj)``, a global permission grants the permission
+    on every object, like guardian's ``get_objects_for_user`` does.
+    """
+
+    def __init__(self, user) -> None:
+        self.user = user
+        self._generation: int | None = None
+        self._identity = None
+        self._global: frozenset[str] | None = None
+        self._objects: dict[tuple[int, str], set[str]] = {}
+
+    def _refresh(self) -> None:
+        if self._generation != _generation:
+            self._generation = _generation
+            self._global = None
+            self._objects = {}
+
+    def _get_identity(self):
+        # Anonymous users have the object permissions of guardian's anonymous user
+        if self._identity is None:
+            supported, identity = check_user_support(self.user)
+            self._identity = identity if supported and identity.is_active else False
+        return self._identity
+
+    def _load(self, objects: Iterable[Model]) -> None:
+        identity = self._get_identity()
+        keys = {_object_key(obj) for obj in objects} - self._objects.keys()
+        if not identity or (self._global is not None and not keys):
+            return
+
+        pks_by_content_type = defaultdict(list)
+        for content_type_id, pk in keys:
+            pks_by_content_type[content_type_id].append(pk)
+        objects_filter = Q()
+        for content_type_id, pks in pks_by_content_type.items():
+            objects_filter |= Q(content_type_id=content_type_id, object_pk__in=pks)
+
+        # Annotations only, the model fields would be selected before them
+        columns = ("permission_name", "object_content_type_id", "object_id")
+        querysets = []
+        # Only the authenticated users have global permissions, like with ModelBackend
+        if self._global is None and self.user.is_authenticated:
+            no_object = {
+                "permission_name": Concat("content_type__app_label", Value("."), "codename"),
+                "object_content_type_id": Value(None, output_field=IntegerField()),
+                "object_id": Value(None, output_field=CharField()),
+            }
+            for permissions in (
+                Permission.objects.filter(user=identity),
+                Permission.objects.filter(group__user=identity),
+            ):
+                querysets.append(permissions.annotate(**no_object).values_list(*columns))
+        if keys:
+            of_object = {
+                "permission_name": Concat(
+                    "permission__content_type__app_label", Value("."), "permission__codename"
+                ),
+                "object_content_type_id": F("content_type_id"),
+                "object_id": F("object_pk"),
+            }
+            querysets.append(
+                UserObjectPermission.objects.filter(objects_filter, user=identity)
+                .annotate(**of_object)
+                .values_list(*columns)
+            )
+            querysets.append(
+                GroupObjectPermission.objects.filter(objects_filter, group__user=identity)
+                .annotate(**of_object)
+                .values_list(*columns)
+            )
+
+        # A compound statement can't order its subqueries
+        querysets = [queryset.order_by() for queryset in querysets]
+        global_permissions = set()
+        for key in keys:
+            self._objects[key] = set()
+        rows = querysets[0].union(*querysets[1:], all=True) if querysets else []
+        for name, content_type_id, pk in rows:
+            if pk is None:
+                global_permissions.add(name)
+            else:
+                self._objects[content_type_id, pk].add(name)
+        if self._global is None:
+            self._global = frozenset(global_permissions)
+
+    def preload(self, objects: Iterable[Model]) -> None:
+        """Load the permissions of the user on some objects, e.g. the rows of a list page.
+
+        Args:
+            objects (Iterable[Model]): the objects whose permissions will be checked
+        """
+        self._refresh()
+        self._load(objects)
+
+    def has_perm(self, permission: str, obj: Model | None = None) -> bool:
+        """Return whether the user has a permission, globally or on an object.
+
+        Args:
+            permission (str): the permission, as "<app_label>.<codename>"
+            obj (Model | None): the object to check the permission on
+
+        Returns:
+            bool: whether the user has the permission
+        """
+        if self.user.is_active and self.user.is_superuser:
+            return True
+        self._refresh()
+        self._load([] if obj is None else [obj])
+        if permission in (self._global or ()):
+            return True
+        return obj is not None and permission in self._objects.get(_object_key(obj), ())
+
+    def filter(self, permission: str, queryset: QuerySet) -> QuerySet:
+        """Return the objects of a queryset the user has a permission on.
+
+        Args:
+            permission (str): the permission, as "<app_label>.<codename>"
+            queryset (QuerySet): the objects to filter
+
+        Returns:
+            QuerySet: the objects the user has the permission on
+        """
+        if self.has_perm(permission):
+            return queryset
+        app_label, _, codename = permission.partition(".")
+        identity = self._get_identity()
+        if not identity or app_label != queryset.model._meta.app_label:
+            return queryset.none()
+
+        pk = queryset.model._meta.pk
+        pk = pk.target_field if pk.is_relation else pk
+        object_pk = F("object_pk")
+        if isinstance(pk, IntegerField):
+            # guardian stores the primary keys as text, compare them as integers so the
+            # primary key index of the queryset can be used
+            object_pk = Cast("object_pk", output_field=BigIntegerField())
+        granted = {
+            "content_type": ContentType.objects.get_for_model(queryset.model),
+            "permission__codename": codename,
+        }
+        user_objects = (
+            UserObjectPermission.objects.filter(user=identity, **granted)
+            .annotate(object_id=object_pk)
+            .values("object_id")
+        )
+        group_objects = (
+            GroupObjectPermission.objects.filter(group__user=identity, **granted)
+            .annotate(object_id=object_pk)
+            .values("object_id")
+        )
+        return queryset.filter(Q(pk__in=user_objects) | Q(pk__in=group_objects))
+
+
+def get_resolver(user) -> PermissionResolver:
+    """Return the permission resolver of a user object, creating it on first use.
+
+    Args:
+        user (OrgToriiUser | AnonymousUser): the user, e.g. ``request.user``
+
+    Returns:
+        PermissionResolver: the resolver kept on the user object
+    """
+    try:
+        return user._permission_resolver
+    except AttributeError:
+        user._permission_resolver = PermissionResolver(user)
+        return user._permission_resolver
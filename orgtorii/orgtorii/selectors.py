@@ -1,28 +1,538 @@
+import re
+import uuid
 from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
 
-from djstripe.enums import ProductType
-from djstripe.models import Product
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Model, Prefetch, Q, QuerySet
+from djstripe.enums import PriceType, ProductType
+from djstripe.models import Price, Product
 
+from orgtorii import permissions
+from orgtorii.core import models as core_models
+from orgtorii.lru import LRUCache
+from orgtorii.sketches import TDigest
 from orgtorii.users import models as user_models
 
 
-def product_list() -> Iterable[Product]:
-    """Return a list of Stripe products.
+@dataclass(frozen=True)
+class SalaryStatistics:
+    count: int
+    p25: float
+    median: float
+    p75: float
+
+
+@dataclass(frozen=True)
+class ReviewSearchResults:
+    reviews: list[core_models.EmployerReviewMVP]
+    page: int
+    has_next: bool
+
+
+@dataclass(frozen=True)
+class ReviewPage:
+    reviews: list[core_models.EmployerReviewMVP]
+    next_cursor: str | None
+
+
+# The currencies Stripe has no smaller unit of, https://docs.stripe.com/currencies
+_ZERO_DECIMAL_CURRENCIES = frozenset(
+    ("bif", "clp", "djf", "gnf", "jpy", "kmf", "krw", "mga", "pyg", "rwf", "ugx", "vnd", "vuv")
+    + ("xaf", "xof", "xpf")
+)
+
+
+@dataclass(frozen=True, slots=True)
+class PlanPrice:
+    nickname: str
+    unit_amount: int | None  # in the smallest currency unit, e.g. cents
+    currency: str
+    interval: str  # the billing interval, e.g. month or year
+
+    @property
+    def amount(self) -> Decimal | None:
+        """The price in the main currency unit, e.g. dollars."""
+        if self.unit_amount is None:
+            return None
+        if self.currency.lower() in _ZERO_DECIMAL_CURRENCIES:
+            return Decimal(self.unit_amount)
+        return Decimal(self.unit_amount) / 100
+
+
+@dataclass(frozen=True, slots=True)
+class PricingPlan:
+    name: str
+    description: str
+    prices: tuple[PlanPrice, ...]
+
+
+@dataclass(frozen=True)
+class CompanySuggestion:
+    id: int
+    name: str
+    domain: str
+
+
+# Autocomplete results of hot prefixes, kept in-process under a generation shared through
+# the cache, which company_autocomplete_cache_clear replaces when a company is added
+COMPANY_AUTOCOMPLETE_CACHE = LRUCache(maxsize=4096, ttl=60)
+COMPANY_AUTOCOMPLETE_GENERATION_KEY = "company_autocomplete:generation"
+
+# The review columns rendered by a review card in listings
+REVIEW_CARD_FIELDS = (
+    "id",
+    "company_id",
+    "company_name",
+    "job_title",
+    "location",
+    "review_title",
+    *core_models.RATING_FIELDS,
+    "current_employee",
+    "verified",
+    "created_at",
+)
+_REVIEW_CURSOR_SALT = "orgtorii.selectors.review_list"
+
+# The relative bm25 weights of the review_title, review, company_name, job_title, pros and
+# cons columns of the search index
+_REVIEW_SEARCH_WEIGHTS = (5.0, 1.0, 10.0, 3.0, 2.0, 2.0)
+
+# The pricing table is cached until Stripe tells us (through a webhook) that a product or
+# price changed, the timeout only bounds how long a missed webhook leaves it stale
+PRICING_TABLE_CACHE_KEY = "pricing:table"
+PRICING_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def product_list() -> QuerySet[Product]:
+    """Return the Stripe products offered on the pricing page.
 
     Returns:
-        Iterable[Product]: The list of products
+        QuerySet[Product]: The list of products
     """
     return Product.objects.filter(type=ProductType.service)
 
 
-def user_has_permission(*, user: user_models.OrgToriiUser, permission: str) -> bool:
-    """Check if a user has a specific permission.
+def pricing_plan_list() -> list[PricingPlan]:
+    """Return the plans shown on the pricing page with their active recurring prices.
+
+    Only the columns shown are loaded, in one query for the products and one for their
+    prices, rather than the full Stripe objects with their metadata. The pricing page
+    caches the table rendered from them, see ``PRICING_TABLE_CACHE_KEY``.
+
+    Returns:
+        list[PricingPlan]: The list of plans
+    """
+    prices = Price.objects.filter(active=True, type=PriceType.recurring).only(
+        "id", "product_id", "nickname", "unit_amount", "currency", "recurring"
+    )
+    products = (
+        Product.objects.filter(type=ProductType.service)
+        .only("id", "name", "description")
+        .prefetch_related(Prefetch("prices", queryset=prices, to_attr="recurring_prices"))
+    )
+    return [
+        PricingPlan(
+            name=product.name,
+            description=product.description or "",
+            prices=tuple(
+                PlanPrice(
+                    nickname=price.nickname,
+                    unit_amount=price.unit_amount,
+                    currency=price.currency,
+                    interval=(price.recurring or {}).get("interval", ""),
+                )
+                for price in product.recurring_prices
+            ),
+        )
+        for product in products
+    ]
+
+
+def pricing_cache_clear() -> None:
+    """Forget the cached pricing table, e.g. after a product or price changed."""
+    cache.delete(PRICING_TABLE_CACHE_KEY)
+
+
+def user_has_permission(
+    *, user: user_models.OrgToriiUser, permission: str, obj: Model | None = None
+) -> bool:
+    """Check if a user has a specific permission, globally or on an object.
+
+    The permissions are memoized for the request, so checking every row of a list
+    after ``object_permissions_preload`` doesn't query the database again.
 
     Args:
         user (user_models.User): an instance of the User model
         permission (str): the permission to check for
+        obj (Model | None): the object to check the permission on, which a global
+            permission also grants
 
     Returns:
         bool: whether the user has the permission
     """
-    return user.has_perm(permission)
+    return permissions.get_resolver(user).has_perm(permission, obj)
+
+
+def object_permissions_preload(*, user: user_models.OrgToriiUser, objects: Iterable[Model]) -> None:
+    """Load the permissions of a user on some objects in a single query.
+
+    Args:
+        user (user_models.User): an instance of the User model
+        objects (Iterable[Model]): the objects ``user_has_permission`` will be asked about
+    """
+    permissions.get_resolver(user).preload(objects)
+
+
+def filter_objects_with_permission(
+    *, user: user_models.OrgToriiUser, permission: str, queryset: QuerySet
+) -> QuerySet:
+    """Return the objects of a queryset a user has a permission on.
+
+    Args:
+        user (user_models.User): an instance of the User model
+        permission (str): the permission, as "<app_label>.<codename>"
+        queryset (QuerySet): the objects to filter
+
+    Returns:
+        QuerySet: all the objects with the global permission, otherwise the objects the
+        user or one of their groups has the object permission on
+    """
+    return permissions.get_resolver(user).filter(permission, queryset)
+
+
+def company_rating_aggregate_get(
+    *, company_name: str, verified_only: bool = False
+) -> core_models.CompanyRatingAggregate | None:
+    """Return the precomputed rating totals for a company.
+
+    Args:
+        company_name (str): the name of the company
+        verified_only (bool): only include verified reviews
+
+    Returns:
+        core_models.CompanyRatingAggregate | None: the aggregate, if the company has reviews
+    """
+    return core_models.CompanyRatingAggregate.objects.filter(
+        company_name=company_name, verified_only=verified_only
+    ).first()
+
+
+def leaderboard_list(
+    *, rating_field: str, location: str = "", limit: int = 10, offset: int = 0
+) -> list[core_models.LeaderboardEntry]:
+    """Return a page of a company leaderboard, best companies first.
+
+    The leaderboards are precomputed by ``services.leaderboard_rebuild``. A page is a
+    range of ranks read from the covering index of the entries, so it takes the same time
+    whatever the number of companies or the offset.
+
+    Args:
+        rating_field (str): the rating the companies are ranked by, e.g.
+            "work_life_balance_rating"
+        location (str): only rank the reviews written in this location, all locations if
+            empty
+        limit (int): the number of companies to return
+        offset (int): the number of companies to skip
+
+    Raises:
+        ValueError: if the rating doesn't exist
+
+    Returns:
+        list[core_models.LeaderboardEntry]: the entries of the page, in order of rank
+    """
+    if rating_field not in core_models.RATING_FIELDS:
+        raise ValueError(f"Unknown rating: {rating_field}")
+    return list(
+        core_models.LeaderboardEntry.objects.filter(
+            rating_field=rating_field,
+            location=core_models.normalize_location(location),
+            rank__gt=offset,
+            rank__lte=offset + limit,
+        ).order_by("rank")
+    )
+
+
+def salary_statistics_get(
+    *,
+    company_name: str,
+    currency: str,
+    job_title: str | None = None,
+    total_compensation: bool = False,
+) -> SalaryStatistics | None:
+    """Return salary percentiles for a company from the precomputed sketches.
+
+    Without a job title the sketches of every job title at the company are merged.
+
+    Args:
+        company_name (str): the name of the company
+        currency (str): the currency code of the salaries, e.g. "USD"
+        job_title (str | None): only include salaries for this job title
+        total_compensation (bool): use base salary + additional compensation
+            instead of the base salary
+
+    Returns:
+        SalaryStatistics | None: the percentiles, if any salaries were reported
+    """
+    sketches = core_models.SalarySketch.objects.filter(company_name=company_name, currency=currency)
+    if job_title is not None:
+        sketches = sketches.filter(job_title=job_title)
+    field = "total_compensation_digest" if total_compensation else "base_salary_digest"
+
+    digest = TDigest()
+    for data in sketches.values_list(field, flat=True):
+        digest.merge(TDigest.from_dict(data))
+    if not digest.count:
+        return None
+    return SalaryStatistics(
+        count=digest.count,
+        p25=digest.quantile(0.25),
+        median=digest.quantile(0.5),
+        p75=digest.quantile(0.75),
+    )
+
+
+def _review_search_match(query: str) -> str:
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    # Quote every term so user input is never parsed as FTS5 query syntax and match the
+    # last term as a prefix as it may still be being typed
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+
+def review_search(*, query: str, page: int = 1, page_size: int = 20) -> ReviewSearchResults:
+    """Search the reviews, best matches first.
+
+    Matches are ranked by bm25 using the full-text search index, with matches on the
+    company name and review title ranked above matches in the review body.
+
+    Args:
+        query (str): the text to search for
+        page (int): the page of results to return, starting at 1
+        page_size (int): the number of reviews per page
+
+    Returns:
+        ReviewSearchResults: the reviews on the page and whether there are more pages
+    """
+    match = _review_search_match(query)
+    if not match:
+        return ReviewSearchResults(reviews=[], page=page, has_next=False)
+
+    table = core_models.REVIEW_SEARCH_TABLE
+    weights = ", ".join(str(weight) for weight in _REVIEW_SEARCH_WEIGHTS)
+    with connection.cursor() as cursor:
+        # Fetch one extra row to know if there is a next page without counting all matches
+        cursor.execute(
+            f"""
+            SELECT rowid FROM {table} WHERE {table} MATCH %s
+            ORDER BY bm25({table}, {weights}) LIMIT %s OFFSET %s
+            """,
+            [match, page_size + 1, (page - 1) * page_size],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    reviews = core_models.EmployerReviewMVP.objects.in_bulk(ids[:page_size])
+    return ReviewSearchResults(
+        reviews=[reviews[review_id] for review_id in ids[:page_size] if review_id in reviews],
+        page=page,
+        has_next=len(ids) > page_size,
+    )
+
+
+def _company_autocomplete(prefix: str, limit: int) -> list[CompanySuggestion]:
+    fields = ("id", "name", "domain")
+    # A range over the unique (normalized_name, domain) index rather than LIKE, which
+    # SQLite can't serve from a case sensitive index
+    rows = list(
+        core_models.Company.objects.filter(
+            normalized_name__gte=prefix, normalized_name__lt=prefix + "\U0010ffff"
+        )
+        .order_by("normalized_name", "domain")
+        .values_list(*fields)[:limit]
+    )
+
+    # Fill up with names containing the query, the trigram index needs 3 characters
+    if len(rows) < limit and len(prefix) >= 3:
+        seen = {row[0] for row in rows}
+        table = core_models.COMPANY_TRIGRAM_TABLE
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {table} WHERE {table} MATCH %s ORDER BY rank LIMIT %s",
+                ['"' + prefix.replace('"', '""') + '"', limit + len(rows)],
+            )
+            ids = [row[0] for row in cursor.fetchall() if row[0] not in seen]
+        ids = ids[: limit - len(rows)]
+        by_id = {
+            row[0]: row
+            for row in core_models.Company.objects.filter(id__in=ids).values_list(*fields)
+        }
+        rows.extend(by_id[company_id] for company_id in ids if company_id in by_id)
+
+    return [CompanySuggestion(*row) for row in rows]
+
+
+def company_autocomplete(*, query: str, limit: int = 10) -> list[CompanySuggestion]:
+    """Suggest companies for a partially typed company name.
+
+    Companies whose normalized name starts with the query come first, followed by
+    companies whose name contains it. Results are cached in-process per query, until
+    ``company_autocomplete_cache_clear`` is called in any process.
+
+    Args:
+        query (str): the text typed so far
+        limit (int): the maximum number of suggestions
+
+    Returns:
+        list[CompanySuggestion]: the suggested companies
+    """
+    prefix = core_models.normalize_company_name(query)
+    if not prefix:
+        return []
+    key = (_company_autocomplete_generation(), prefix, limit)
+    suggestions = COMPANY_AUTOCOMPLETE_CACHE.get(key)
+    if suggestions is None:
+        suggestions = _company_autocomplete(prefix, limit)
+        COMPANY_AUTOCOMPLETE_CACHE.set(key, suggestions)
+    return suggestions
+
+
+def _company_autocomplete_generation() -> str:
+    generation = cache.get(COMPANY_AUTOCOMPLETE_GENERATION_KEY)
+    if generation is None:
+        # The first process to miss it starts the next generation
+        cache.add(COMPANY_AUTOCOMPLETE_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(COMPANY_AUTOCOMPLETE_GENERATION_KEY, "")
+    return generation
+
+
+def company_autocomplete_cache_clear() -> None:
+    """Forget the autocomplete results cached by every process, e.g. after a company was added.
+
+    The shared generation is deleted, which the other processes notice within the
+    ``GENERATION_CHECK_INTERVAL`` of the default cache.
+    """
+    COMPANY_AUTOCOMPLETE_CACHE.clear()
+    cache.delete(COMPANY_AUTOCOMPLETE_GENERATION_KEY)
+
+
+def _review_cursor_encode(review: core_models.EmployerReviewMVP) -> str:
+    return signing.dumps([review.created_at.isoformat(), review.id], salt=_REVIEW_CURSOR_SALT)
+
+
+def _review_cursor_decode(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, review_id = signing.loads(cursor, salt=_REVIEW_CURSOR_SALT)
+        return datetime.fromisoformat(created_at), int(review_id)
+    except (signing.BadSignature, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def _review_list_queryset(
+    *,
+    cursor: str | None,
+    page_size: int,
+    company_id: int | None,
+    verified: bool | None,
+    current_employee: bool | None,
+) -> QuerySet[core_models.EmployerReviewMVP]:
+    reviews = core_models.EmployerReviewMVP.objects.only(*REVIEW_CARD_FIELDS)
+    if company_id is not None:
+        reviews = reviews.filter(company_id=company_id)
+    if verified is not None:
+        reviews = reviews.filter(verified=verified)
+    if current_employee is not None:
+        reviews = reviews.filter(current_employee=current_employee)
+    if cursor is not None:
+        created_at, review_id = _review_cursor_decode(cursor)
+        # The inclusive range lets the index seek straight to the cursor position
+        reviews = reviews.filter(
+            Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=review_id))
+        )
+    # Fetch one extra review to know if there is a next page
+    return reviews.order_by("-created_at", "-id")[: page_size + 1]
+
+
+def _review_page(page: list[core_models.EmployerReviewMVP], page_size: int) -> ReviewPage:
+    next_cursor = _review_cursor_encode(page[page_size - 1]) if len(page) > page_size else None
+    return ReviewPage(reviews=page[:page_size], next_cursor=next_cursor)
+
+
+def review_list(
+    *,
+    cursor: str | None = None,
+    page_size: int = 20,
+    company_id: int | None = None,
+    verified: bool | None = None,
+    current_employee: bool | None = None,
+) -> ReviewPage:
+    """Return a page of reviews, newest first.
+
+    Pages are fetched by keyset pagination: the cursor holds the (created_at, id) of the
+    last review on the previous page and the next page continues from that position in
+    the index, so deep pages are as fast as the first one. Only the columns needed to
+    render a review card are loaded.
+
+    Args:
+        cursor (str | None): the opaque ``next_cursor`` of the previous page, None for the
+            first page
+        page_size (int): the number of reviews per page
+        company_id (int | None): only include reviews of this company
+        verified (bool | None): only include (un)verified reviews
+        current_employee (bool | None): only include reviews by (ex-)employees
+
+    Raises:
+        ValueError: if the cursor is invalid
+
+    Returns:
+        ReviewPage: the reviews and the cursor of the next page, if there is one
+    """
+    reviews = _review_list_queryset(
+        cursor=cursor,
+        page_size=page_size,
+        company_id=company_id,
+        verified=verified,
+        current_employee=current_employee,
+    )
+    return _review_page(list(reviews), page_size)
+
+
+async def areview_list(
+    *,
+    cursor: str | None = None,
+    page_size: int = 20,
+    company_id: int | None = None,
+    verified: bool | None = None,
+    current_employee: bool | None = None,
+) -> ReviewPage:
+    """Asynchronous version of ``review_list``, for async views."""
+    reviews = _review_list_queryset(
+        cursor=cursor,
+        page_size=page_size,
+        company_id=company_id,
+        verified=verified,
+        current_employee=current_employee,
+    )
+    return _review_page([review async for review in reviews], page_size)
+
+
+def payslip_duplicate_exists(*, sha256: str, exclude_review_id: int | None = None) -> bool:
+    """Return whether a payslip with the same contents was already submitted.
+
+    Args:
+        sha256 (str): the SHA-256 hex digest of the payslip
+        exclude_review_id (int | None): ignore the payslip of this review
+
+    Returns:
+        bool: whether another review has a payslip with the same digest
+    """
+    if not sha256:
+        return False
+    reviews = core_models.EmployerReviewMVP.objects.filter(payslip_sha256=sha256)
+    if exclude_review_id is not None:
+        reviews = reviews.exclude(id=exclude_review_id)
+    return reviews.exists()
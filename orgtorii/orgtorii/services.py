@@ -0,0 +1,1128 @@
+import contextlib
+import csv
+import difflib
+import heapq
+import itertools
+import json
+import logging
+import re
+import smtplib
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Any, Literal, TextIO
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMultiAlternatives
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q, QuerySet, Sum
+from django.db.models.functions import Now
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from orgtorii import mailing, newsletter, pdf, selectors
+from orgtorii.core import models as core_models
+from orgtorii.db import writer
+from orgtorii.lru import LRUCache
+from orgtorii.sketches import TDigest
+
+logger = logging.getLogger(__name__)
+
+# The review values the rating aggregates depend on
+RATING_AGGREGATE_REVIEW_FIELDS = ("company_name", "verified", *core_models.RATING_FIELDS)
+# The review fields accepted by the bulk import
+REVIEW_IMPORT_FIELDS = (
+    "company_name",
+    "company_domain",
+    "job_title",
+    "location",
+    "estimated_review_date",
+    "tenure_months",
+    "current_employee",
+    "review_title",
+    "review",
+    *core_models.RATING_FIELDS,
+    "pros",
+    "cons",
+    "currency",
+    "base_annual_salary",
+    "additional_annual_compensation",
+)
+# Fields with few distinct values, their validation results are cached during an import
+_REVIEW_IMPORT_CACHED_FIELDS = {
+    "company_domain",
+    "job_title",
+    "location",
+    "estimated_review_date",
+    "tenure_months",
+    "current_employee",
+    *core_models.RATING_FIELDS,
+    "currency",
+    "base_annual_salary",
+    "additional_annual_compensation",
+}
+_BOOLEAN_STRINGS = {
+    "1": True,
+    "true": True,
+    "yes": True,
+    "0": False,
+    "false": False,
+    "no": False,
+}
+# The number of companies kept per leaderboard
+LEADERBOARD_SIZE = 100
+# How many reviews at the average of a leaderboard every company starts with, so a few
+# reviews can't put a company at the top
+LEADERBOARD_PRIOR_REVIEWS = 10
+# The columns of the newsletter export
+NEWSLETTER_EXPORT_FIELDS = ("email", "created_at")
+# The review values the salary sketches depend on
+SALARY_SKETCH_REVIEW_FIELDS = (
+    "company_name",
+    "job_title",
+    "currency",
+    "base_annual_salary",
+    "additional_annual_compensation",
+)
+
+
+def _company_rating_aggregate_apply(*, review: Mapping[str, Any], sign: int) -> None:
+    variants = [False, True] if review["verified"] else [False]
+    if sign > 0:
+        core_models.CompanyRatingAggregate.objects.bulk_create(
+            [
+                core_models.CompanyRatingAggregate(
+                    company_name=review["company_name"], verified_only=verified_only
+                )
+                for verified_only in variants
+            ],
+            ignore_conflicts=True,
+        )
+
+    updates = {"review_count": F("review_count") + sign, "updated_at": Now()}
+    for field in core_models.RATING_FIELDS:
+        star = review[field]
+        updates[f"{field}_sum"] = F(f"{field}_sum") + sign * star
+        updates[f"{field}_{star}"] = F(f"{field}_{star}") + sign
+
+    core_models.CompanyRatingAggregate.objects.filter(
+        company_name=review["company_name"], verified_only__in=variants
+    ).update(**updates)
+
+
+def company_rating_aggregate_update(
+    *, previous: Mapping[str, Any] | None, current: Mapping[str, Any] | None
+) -> None:
+    """Move a review's contribution to the company rating aggregates.
+
+    Pass the review values before and after a change, keyed by
+    ``RATING_AGGREGATE_REVIEW_FIELDS``. Use None for ``previous`` when the review is
+    created and None for ``current`` when it is deleted.
+
+    Args:
+        previous (Mapping[str, Any] | None): the review values before the change
+        current (Mapping[str, Any] | None): the review values after the change
+    """
+    if (
+        previous is not None
+        and current is not None
+        and all(previous[field] == current[field] for field in RATING_AGGREGATE_REVIEW_FIELDS)
+    ):
+        return
+
+    with transaction.atomic():
+        if previous is not None:
+            _company_rating_aggregate_apply(review=previous, sign=-1)
+        if current is not None:
+            _company_rating_aggregate_apply(review=current, sign=1)
+
+
+def company_rating_aggregate_rebuild(*, batch_size: int = 500) -> int:
+    """Recompute all company rating aggregates from the review table.
+
+    The reviews are grouped in the database and streamed back ordered by company so
+    memory use does not grow with the number of companies.
+
+    Args:
+        batch_size (int): the number of aggregate rows to insert per query
+
+    Returns:
+        int: the number of aggregate rows written
+    """
+    annotations = {"review_count": Count("id")}
+    for field in core_models.RATING_FIELDS:
+        annotations[f"{field}_sum"] = Sum(field)
+        for star in core_models.RATING_STARS:
+            annotations[f"{field}_{star}"] = Count("id", filter=Q(**{field: star}))
+
+    groups = (
+        core_models.EmployerReviewMVP.objects.values("company_name", "verified")
+        .annotate(**annotations)
+        .order_by("company_name", "verified")
+    )
+
+    written = 0
+    with transaction.atomic():
+        core_models.CompanyRatingAggregate.objects.all().delete()
+        batch = []
+        for company_name, rows in itertools.groupby(
+            groups.iterator(chunk_size=batch_size), key=lambda row: row["company_name"]
+        ):
+            totals = dict.fromkeys(annotations, 0)
+            for row in rows:
+                for name in annotations:
+                    totals[name] += row[name]
+                if row["verified"]:
+                    batch.append(
+                        core_models.CompanyRatingAggregate(
+                            company_name=company_name,
+                            verified_only=True,
+                            **{name: row[name] for name in annotations},
+                        )
+                    )
+            batch.append(
+                core_models.CompanyRatingAggregate(
+                    company_name=company_name, verified_only=False, **totals
+                )
+            )
+            if len(batch) >= batch_size:
+                core_models.CompanyRatingAggregate.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        core_models.CompanyRatingAggregate.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def _salary_sketch_key(review: Mapping[str, Any]) -> tuple[str, str, str] | None:
+    if review["base_annual_salary"] is None:
+        return None
+    return review["company_name"], review["job_title"], review["currency"]
+
+
+def _salary_sketches_build(
+    reviews: QuerySet[core_models.EmployerReviewMVP], *, chunk_size: int
+) -> Iterator[core_models.SalarySketch]:
+    rows = (
+        reviews.filter(base_annual_salary__isnull=False)
+        .values_list(
+            "company_name",
+            "job_title",
+            "currency",
+            "base_annual_salary",
+            "additional_annual_compensation",
+        )
+        .order_by("company_name", "job_title", "currency")
+        .iterator(chunk_size=chunk_size)
+    )
+    for (company_name, job_title, currency), group in itertools.groupby(
+        rows, key=lambda row: row[:3]
+    ):
+        base_salary, total_compensation = TDigest(), TDigest()
+        for *_, base, additional in group:
+            base_salary.add(base)
+            total_compensation.add(base + (additional or 0))
+        yield core_models.SalarySketch(
+            company_name=company_name,
+            job_title=job_title,
+            currency=currency,
+            review_count=base_salary.count,
+            base_salary_digest=base_salary.to_dict(),
+            total_compensation_digest=total_compensation.to_dict(),
+        )
+
+
+def _salary_sketch_rebuild_key(key: tuple[str, str, str]) -> None:
+    company_name, job_title, currency = key
+    with transaction.atomic():
+        core_models.SalarySketch.objects.filter(
+            company_name=company_name, job_title=job_title, currency=currency
+        ).delete()
+        reviews = core_models.EmployerReviewMVP.objects.filter(
+            company_name=company_name, job_title=job_title, currency=currency
+        )
+        core_models.SalarySketch.objects.bulk_create(
+            _salary_sketches_build(reviews, chunk_size=2000)
+        )
+
+
+def salary_sketch_update(
+    *, previous: Mapping[str, Any] | None, current: Mapping[str, Any] | None
+) -> None:
+    """Update the salary sketches after a review changed.
+
+    New reviews are added to their sketch in constant time. Digests cannot forget
+    values, so when a salary is edited or deleted the affected sketches are rebuilt
+    from the reviews with the same company, job title and currency.
+
+    Args:
+        previous (Mapping[str, Any] | None): the review values before the change, keyed by
+            ``SALARY_SKETCH_REVIEW_FIELDS``, or None for a new review
+        current (Mapping[str, Any] | None): the review values after the change, or None for
+            a deleted review
+    """
+    if previous is None:
+        key = _salary_sketch_key(current)
+        if key is None:
+            return
+        company_name, job_title, currency = key
+        base = current["base_annual_salary"]
+        # The IMMEDIATE transaction holds the write lock so concurrent reviews can't
+        # overwrite each other's digest
+        with transaction.atomic():
+            sketch, _ = core_models.SalarySketch.objects.get_or_create(
+                company_name=company_name, job_title=job_title, currency=currency
+            )
+            base_salary = TDigest.from_dict(sketch.base_salary_digest)
+            total_compensation = TDigest.from_dict(sketch.total_compensation_digest)
+            base_salary.add(base)
+            total_compensation.add(base + (current["additional_annual_compensation"] or 0))
+            sketch.review_count = base_salary.count
+            sketch.base_salary_digest = base_salary.to_dict()
+            sketch.total_compensation_digest = total_compensation.to_dict()
+            sketch.save()
+        return
+
+    if current is not None and all(
+        previous[field] == current[field] for field in SALARY_SKETCH_REVIEW_FIELDS
+    ):
+        return
+    keys = {_salary_sketch_key(previous)}
+    if current is not None:
+        keys.add(_salary_sketch_key(current))
+    for key in keys - {None}:
+        _salary_sketch_rebuild_key(key)
+
+
+def salary_sketch_rebuild(*, chunk_size: int = 2000, batch_size: int = 500) -> int:
+    """Recompute all salary sketches from the review table.
+
+    Reviews are streamed from the database in chunks, ordered by sketch key, so only
+    one sketch is held in memory at a time.
+
+    Args:
+        chunk_size (int): the number of reviews to fetch from the database at a time
+        batch_size (int): the number of sketches to insert per query
+
+    Returns:
+        int: the number of sketches written
+    """
+    written = 0
+    with transaction.atomic():
+        core_models.SalarySketch.objects.all().delete()
+        sketches = _salary_sketches_build(
+            core_models.EmployerReviewMVP.objects.all(), chunk_size=chunk_size
+        )
+        while batch := list(itertools.islice(sketches, batch_size)):
+            core_models.SalarySketch.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def _leaderboard_entries(
+    *, location: str, companies: Mapping[int, Mapping[str, Any]], size: int, prior_reviews: int
+) -> Iterator[core_models.LeaderboardEntry]:
+    review_count = sum(company["review_count"] for company in companies.values())
+    for field in core_models.RATING_FIELDS:
+        prior = sum(company[f"{field}_sum"] for company in companies.values()) / review_count
+
+        def score(company: Mapping[str, Any], field=field, prior=prior) -> float:
+            total = company[f"{field}_sum"] + prior * prior_reviews
+            return total / (company["review_count"] + prior_reviews)
+
+        # Ties go to the company with more reviews, then to the older one
+        ranked = heapq.nlargest(
+            size,
+            companies.items(),
+            key=lambda item: (score(item[1]), item[1]["review_count"], -item[0]),
+        )
+        for rank, (company_id, company) in enumerate(ranked, start=1):
+            yield core_models.LeaderboardEntry(
+                rating_field=field,
+                location=location,
+                rank=rank,
+                company_id=company_id,
+                company_name=company["company_name"],
+                score=score(company),
+                average=company[f"{field}_sum"] / company["review_count"],
+                review_count=company["review_count"],
+            )
+
+
+def _leaderboard_replace(
+    *,
+    rating_field: str,
+    location: str,
+    entries: list[core_models.LeaderboardEntry],
+    batch_size: int,
+) -> None:
+    core_models.LeaderboardEntry.objects.filter(
+        rating_field=rating_field, location=location
+    ).delete()
+    core_models.LeaderboardEntry.objects.bulk_create(entries, batch_size=batch_size)
+
+
+def leaderboard_rebuild(
+    *,
+    size: int = LEADERBOARD_SIZE,
+    prior_reviews: int = LEADERBOARD_PRIOR_REVIEWS,
+    batch_size: int = 500,
+) -> int:
+    """Recompute the company leaderboards of every rating and location.
+
+    The reviews are grouped by company and location in a single query, which runs
+    outside of the write transactions. Every leaderboard is then replaced by a write of
+    its own, handed to ``orgtorii.db.writer.WriteQueue``, so readers see either its old
+    or its new entries and the other writes of the process never wait for more than one
+    leaderboard. The leaderboards of locations left without reviews are deleted.
+
+    A company's score is its Bayesian average: its average rating with
+    ``prior_reviews`` more reviews at the average of all companies on the leaderboard.
+
+    Args:
+        size (int): the number of companies kept per leaderboard
+        prior_reviews (int): the weight of the average of all companies in a score
+        batch_size (int): the number of entries to insert per query
+
+    Returns:
+        int: the number of leaderboard entries written
+    """
+    total_fields = ["review_count", *(f"{field}_sum" for field in core_models.RATING_FIELDS)]
+    groups = (
+        core_models.EmployerReviewMVP.objects.filter(company__isnull=False)
+        .values("company_id", "company__name", "location")
+        .annotate(
+            review_count=Count("id"),
+            **{f"{field}_sum": Sum(field) for field in core_models.RATING_FIELDS},
+        )
+        .order_by()
+    )
+
+    # The totals per normalized location and company, "" being every location
+    totals: dict[str, dict[int, dict[str, Any]]] = defaultdict(dict)
+    for row in groups.iterator(chunk_size=batch_size):
+        for location in {"", core_models.normalize_location(row["location"])}:
+            company = totals[location].setdefault(
+                row["company_id"],
+                {"company_name": row["company__name"], **dict.fromkeys(total_fields, 0)},
+            )
+            for name in total_fields:
+                company[name] += row[name]
+
+    previous = set(
+        core_models.LeaderboardEntry.objects.values_list("rating_field", "location").distinct()
+    )
+    write_queue = writer.get_write_queue()
+    written = 0
+    for location, companies in totals.items():
+        entries = _leaderboard_entries(
+            location=location, companies=companies, size=size, prior_reviews=prior_reviews
+        )
+        for rating_field, board in itertools.groupby(entries, key=attrgetter("rating_field")):
+            board = list(board)
+            # A batch job, it waits for its turn however long the queue is
+            write_queue.run(
+                _leaderboard_replace,
+                rating_field=rating_field,
+                location=location,
+                entries=board,
+                batch_size=batch_size,
+            )
+            previous.discard((rating_field, location))
+            written += len(board)
+    for rating_field, location in previous:
+        write_queue.run(
+            _leaderboard_replace,
+            rating_field=rating_field,
+            location=location,
+            entries=[],
+            batch_size=batch_size,
+        )
+    return written
+
+
+def review_search_index_rebuild() -> int:
+    """Rebuild the full-text search index from the review table.
+
+    The index is kept in sync by database triggers, so this is only needed to recover
+    from an index that was dropped or corrupted.
+
+    Returns:
+        int: the number of reviews indexed
+    """
+    table = core_models.REVIEW_SEARCH_TABLE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            f"""
+            INSERT INTO {table}(rowid, review_title, review, company_name, job_title, pros, cons)
+            SELECT
+                id, review_title, review, company_name, job_title,
+                (SELECT group_concat(value, ' ') FROM json_each(pros)),
+                (SELECT group_concat(value, ' ') FROM json_each(cons))
+            FROM {core_models.EmployerReviewMVP._meta.db_table}
+            """
+        )
+        indexed = cursor.rowcount
+    review_search_index_optimize()
+    return indexed
+
+
+def review_search_index_optimize() -> None:
+    """Merge the search index segments into a single b-tree.
+
+    Every write adds a small segment to the index which makes queries slower over time,
+    run this periodically (e.g. nightly) to keep searches fast.
+    """
+    table = core_models.REVIEW_SEARCH_TABLE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+def newsletter_signup_create(*, email: str) -> bool:
+    """Subscribe an email to the newsletter.
+
+    The signup is written in a batch with others, see ``newsletter.NewsletterSignupBuffer``.
+    With ``settings.NEWSLETTER_SIGNUP_WAIT_FOR_WRITE`` this waits until it is written, on a
+    best-effort basis: after ``settings.NEWSLETTER_SIGNUP_WRITE_TIMEOUT`` seconds the email
+    is reported as subscribed while the buffer keeps retrying the write, and the signup is
+    lost if the process crashes before that succeeds.
+
+    Args:
+        email (str): the email to subscribe
+
+    Returns:
+        bool: whether the email was subscribed, False if it already was
+    """
+    written = newsletter.get_signup_buffer().add(email)
+    if written is None:
+        return False
+    if settings.NEWSLETTER_SIGNUP_WAIT_FOR_WRITE:
+        try:
+            written.result(timeout=settings.NEWSLETTER_SIGNUP_WRITE_TIMEOUT)
+        except TimeoutError:
+            logger.warning("A newsletter signup wasn't written in time, it stays buffered")
+    return True
+
+
+def newsletter_signup_export(
+    *, output: TextIO, file_format: Literal["csv", "jsonl"], chunk_size: int = 2000
+) -> int:
+    """Write all newsletter signups to a CSV or JSON lines file, oldest first.
+
+    Signups are streamed from the database ``chunk_size`` rows at a time, so memory use
+    doesn't grow with the number of signups.
+
+    Args:
+        output (TextIO): where to write the signups
+        file_format (str): ``csv`` or ``jsonl``
+        chunk_size (int): the number of signups to fetch from the database at a time
+
+    Returns:
+        int: the number of signups written
+    """
+    signups = (
+        core_models.NewsletterSignup.objects.order_by("pk")
+        .values_list("email", "created_at")
+        .iterator(chunk_size=chunk_size)
+    )
+    written = 0
+    if file_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(NEWSLETTER_EXPORT_FIELDS)
+        for email, created_at in signups:
+            writer.writerow((email, created_at.isoformat()))
+            written += 1
+    else:
+        for email, created_at in signups:
+            output.write(json.dumps({"email": email, "created_at": created_at.isoformat()}))
+            output.write("\n")
+            written += 1
+    return written
+
+
+@dataclass
+class NewsletterImportResult:
+    imported: int = 0
+    duplicates: int = 0  # Repeated in the file or already subscribed
+    rejected: int = 0
+
+
+def _newsletter_import_sorted_chunks(
+    *,
+    emails: Iterable[str],
+    rejected: TextIO,
+    result: NewsletterImportResult,
+    run_size: int,
+) -> Iterator[tuple[list[str], int]]:
+    """Clean the emails ``run_size`` at a time.
+
+    Yields:
+        tuple: the valid emails of a chunk, sorted and deduplicated, and its size
+    """
+    field = core_models.NewsletterSignup._meta.get_field("email").formfield()
+    read = 0
+    while chunk := list(itertools.islice(emails, run_size)):
+        valid = set()
+        for row, raw in enumerate(chunk, start=read + 1):
+            try:
+                # The same cleaning as the signup form
+                email = field.clean(raw)
+            except ValidationError as e:
+                rejected.write(json.dumps({"row": row, "email": raw, "errors": e.messages}))
+                rejected.write("\n")
+                result.rejected += 1
+            else:
+                valid.add(email)
+        yield sorted(valid), len(chunk)
+        read += len(chunk)
+
+
+def newsletter_signup_import(
+    *,
+    emails: Iterable[str],
+    rejected: TextIO,
+    run_size: int = 100_000,
+    batch_size: int = 1000,
+) -> NewsletterImportResult:
+    """Subscribe emails in bulk, e.g. a list moved from another newsletter provider.
+
+    Emails are cleaned like the signup form cleans them and deduplicated with an
+    external merge sort: sorted runs of at most ``run_size`` emails are written to
+    temporary files and merged, so memory use doesn't grow with the size of the list.
+    The merged emails are inserted ``batch_size`` at a time, ignoring those already
+    subscribed.
+
+    Invalid emails are written to ``rejected`` as JSON lines with their row number and
+    errors.
+
+    Args:
+        emails (Iterable[str]): the emails to subscribe
+        rejected (TextIO): where to write rejected emails
+        run_size (int): the number of emails sorted in memory at a time
+        batch_size (int): the number of emails to insert per transaction
+
+    Returns:
+        NewsletterImportResult: the number of imported, duplicate and rejected emails
+    """
+    result = NewsletterImportResult()
+    rows = 0
+    with contextlib.ExitStack() as stack:
+        # Closed with the stack, also when reading the emails fails
+        runs = []
+        for valid, read in _newsletter_import_sorted_chunks(
+            emails=iter(emails), rejected=rejected, result=result, run_size=run_size
+        ):
+            run = stack.enter_context(tempfile.TemporaryFile("w+", encoding="utf-8"))
+            run.writelines(f"{email}\n" for email in valid)
+            run.seek(0)
+            runs.append(run)
+            rows += read
+        merged = heapq.merge(*((line.rstrip("\n") for line in run) for run in runs))
+        unique = (email for email, _ in itertools.groupby(merged))
+        for batch in itertools.batched(unique, batch_size):
+            result.imported += _newsletter_signups_insert(batch)
+
+    result.duplicates = rows - result.rejected - result.imported
+    return result
+
+
+def _newsletter_signups_insert(emails: Sequence[str]) -> int:
+    """Subscribe the emails which aren't subscribed yet, in one transaction.
+
+    Returns:
+        int: the number of emails subscribed, not counting those already subscribed
+    """
+    # bulk_create(ignore_conflicts=True) doesn't tell how many rows were inserted
+    opts = core_models.NewsletterSignup._meta
+    quote_name = connection.ops.quote_name
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(opts.db_table)} "
+            f"({quote_name(opts.get_field('email').column)}, "
+            f"{quote_name(opts.get_field('created_at').column)}) "
+            f"VALUES {', '.join(['(%s, %s)'] * len(emails))} ON CONFLICT DO NOTHING",
+            [param for email in emails for param in (email, created_at)],
+        )
+        return cursor.rowcount
+
+
+@dataclass
+class NewsletterCampaignResult:
+    sent: int = 0
+    refused: int = 0  # Recipients refused by the mail server
+    skipped: int = 0  # Subscribers sent the campaign by a previous run
+
+
+def newsletter_campaign_send(
+    *,
+    campaign: str,
+    pool: mailing.EmailConnectionPool,
+    rate: float,
+    threads: int,
+    batch_size: int = 1000,
+    checkpoint_interval: float = 1,
+) -> NewsletterCampaignResult:
+    """Send a newsletter campaign to every subscriber, in subscription order.
+
+    The campaign is rendered once from the ``subject.txt``, ``body.txt`` and optional
+    ``body.html`` templates in ``core/emails/newsletter/<campaign>/``, the messages only
+    differ by recipient. They are sent by ``threads`` threads sharing the connections of
+    ``pool``, at most ``rate`` messages per second.
+
+    The last subscriber up to whom every message was sent is saved every
+    ``checkpoint_interval`` seconds, and a later run resumes after them. Messages sent
+    after the checkpoint by a run which crashed are sent again.
+
+    Args:
+        campaign (str): the name of the campaign templates directory
+        pool (mailing.EmailConnectionPool): the connections to send the messages with
+        rate (float): the maximum number of messages per second
+        threads (int): the number of messages sent concurrently
+        batch_size (int): the number of subscribers to fetch from the database at a time
+        checkpoint_interval (float): seconds between saves of the progress
+
+    Returns:
+        NewsletterCampaignResult: the number of sent, refused and skipped messages
+    """
+    template_dir = f"core/emails/newsletter/{campaign}"
+    context = {"site": Site.objects.get_current()}
+    subject = " ".join(render_to_string(f"{template_dir}/subject.txt", context).split())
+    body = render_to_string(f"{template_dir}/body.txt", context)
+    try:
+        html_body = render_to_string(f"{template_dir}/body.html", context)
+    except TemplateDoesNotExist:
+        html_body = None
+
+    checkpoint, _ = core_models.ImportCheckpoint.objects.get_or_create(
+        name=f"newsletter-campaign:{campaign}"
+    )
+    signups = core_models.NewsletterSignup.objects.order_by("pk")
+    result = NewsletterCampaignResult(skipped=signups.filter(pk__lte=checkpoint.position).count())
+    bucket = mailing.TokenBucket(rate)
+    # Bounds the messages waiting for a thread
+    slots = threading.BoundedSemaphore(2 * threads)
+
+    def send(email: str) -> bool:
+        try:
+            message = EmailMultiAlternatives(subject, body, to=[email])
+            if html_body is not None:
+                message.attach_alternative(html_body, "text/html")
+            pool.send(message)
+            return True
+        except smtplib.SMTPRecipientsRefused:
+            logger.warning("The mail server refused newsletter campaign %s to %s", campaign, email)
+            return False
+        finally:
+            slots.release()
+
+    # Messages in subscription order, the checkpoint moves past those which are done
+    in_flight: deque[tuple[int, Future]] = deque()
+    position = checkpoint.position
+
+    def advance(*, wait: bool) -> None:
+        nonlocal position
+        while in_flight and (wait or in_flight[0][1].done()):
+            pk, future = in_flight[0]
+            if future.result():  # Raises if the message couldn't be sent
+                result.sent += 1
+            else:
+                result.refused += 1
+            in_flight.popleft()
+            position = pk
+
+    saved_at = time.monotonic()
+    last_pk = position
+    with ThreadPoolExecutor(threads, thread_name_prefix="newsletter-sender") as executor:
+        try:
+            while batch := list(
+                signups.filter(pk__gt=last_pk).values_list("pk", "email")[:batch_size]
+            ):
+                last_pk = batch[-1][0]
+                for pk, email in batch:
+                    slots.acquire()
+                    bucket.acquire()
+                    in_flight.append((pk, executor.submit(send, email)))
+                    advance(wait=False)
+                    if time.monotonic() - saved_at >= checkpoint_interval:
+                        core_models.ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                            position=position
+                        )
+                        saved_at = time.monotonic()
+            advance(wait=True)
+        finally:
+            core_models.ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(position=position)
+    return result
+
+
+def company_get_or_create(*, name: str, domain: str = "") -> core_models.Company:
+    """Return the canonical company for a company name and domain, creating it if needed.
+
+    Names are compared after normalization. A review without a domain is linked to an
+    existing company with the same name whatever its domain, and a company without a
+    domain adopts the domain of the first review that provides one.
+
+    Args:
+        name (str): the company name as entered by a reviewer
+        domain (str): the company domain as entered by a reviewer, if any
+
+    Returns:
+        core_models.Company: the canonical company
+    """
+    normalized_name = core_models.normalize_company_name(name)
+    domain = core_models.normalize_domain(domain)
+    companies = core_models.Company.objects.filter(normalized_name=normalized_name)
+
+    if not domain:
+        company = companies.order_by("id").first()
+    else:
+        # Prefer the company with the same domain over one without a domain
+        company = companies.filter(domain__in=[domain, ""]).order_by("-domain", "id").first()
+        if company is not None and not company.domain:
+            company.domain = domain
+            company.save(update_fields=["domain"])
+    if company is not None:
+        return company
+
+    company, _ = core_models.Company.objects.get_or_create(
+        normalized_name=normalized_name, domain=domain, defaults={"name": name.strip()}
+    )
+    return company
+
+
+def company_link_reviews(*, batch_size: int = 1000) -> int:
+    """Link reviews without a company to their canonical company.
+
+    Reviews are processed in primary key order, one batch per transaction, so the
+    command can be interrupted and restarted safely.
+
+    Args:
+        batch_size (int): the number of reviews to update per transaction
+
+    Returns:
+        int: the number of reviews linked
+    """
+    companies = LRUCache(maxsize=10_000)
+    linked = 0
+    last_id = 0
+    while True:
+        reviews = list(
+            core_models.EmployerReviewMVP.objects.filter(company__isnull=True, id__gt=last_id)
+            .only("id", "company_name", "company_domain")
+            .order_by("id")[:batch_size]
+        )
+        if not reviews:
+            return linked
+
+        with transaction.atomic():
+            for review in reviews:
+                key = (
+                    core_models.normalize_company_name(review.company_name),
+                    core_models.normalize_domain(review.company_domain),
+                )
+                company = companies.get(key)
+                if company is None:
+                    company = company_get_or_create(
+                        name=review.company_name, domain=review.company_domain
+                    )
+                    companies.set(key, company)
+                review.company = company
+            core_models.EmployerReviewMVP.objects.bulk_update(reviews, ["company"])
+        linked += len(reviews)
+        last_id = reviews[-1].id
+
+
+@dataclass
+class ReviewImportResult:
+    imported: int = 0
+    rejected: int = 0
+    skipped: int = 0  # Rows already processed by a previous run
+
+
+class _ReviewImportCleaner:
+    """Validates import rows a column at a time using the model field validators.
+
+    Results for fields with few distinct values (ratings, dates, domains, ...) are cached
+    so each distinct value is only validated once per import.
+    """
+
+    def __init__(self) -> None:
+        self.fields = {
+            name: core_models.EmployerReviewMVP._meta.get_field(name)
+            for name in REVIEW_IMPORT_FIELDS
+        }
+        self.cache = LRUCache(maxsize=100_000)
+
+    def _clean_value(self, name: str, raw: Any) -> Any:
+        field = self.fields[name]
+        if raw is None or raw == "":
+            if field.null:
+                return None
+            if field.has_default():
+                return field.get_default()
+            if field.blank and field.empty_strings_allowed:
+                # Blank string columns are stored as "", e.g. a row without a domain
+                return ""
+        if isinstance(field, models.BooleanField) and isinstance(raw, str):
+            raw = _BOOLEAN_STRINGS.get(raw.strip().lower(), raw)
+        if name in ("pros", "cons") and isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise ValidationError("Enter a valid JSON list.") from e
+            if not isinstance(raw, list):
+                raise ValidationError("Enter a valid JSON list.")
+        return field.clean(raw, None)
+
+    def _clean_cached(self, name: str, raw: Any) -> Any:
+        try:
+            key = (name, raw)
+            result = self.cache.get(key)
+        except TypeError:  # Unhashable, e.g. a list in a JSON lines file
+            return self._clean_value(name, raw)
+        if result is None:
+            try:
+                result = (True, self._clean_value(name, raw))
+            except ValidationError as e:
+                result = (False, e)
+            self.cache.set(key, result)
+        is_valid, value = result
+        if not is_valid:
+            raise value
+        return value
+
+    def clean(
+        self, rows: list[Mapping[str, Any]]
+    ) -> tuple[list[dict[str, Any]], dict[int, dict[str, list[str]]]]:
+        """Clean a batch of rows.
+
+        Returns:
+            tuple: the cleaned values of every row and the errors of invalid rows by index
+        """
+        cleaned: list[dict[str, Any]] = [{} for _ in rows]
+        errors: dict[int, dict[str, list[str]]] = {}
+        for name, field in self.fields.items():
+            clean = (
+                self._clean_cached if name in _REVIEW_IMPORT_CACHED_FIELDS else self._clean_value
+            )
+            for index, row in enumerate(rows):
+                if name not in row and field.has_default():
+                    cleaned[index][name] = field.get_default()
+                    continue
+                try:
+                    cleaned[index][name] = clean(name, row.get(name))
+                except ValidationError as e:
+                    errors.setdefault(index, {})[name] = e.messages
+        return cleaned, errors
+
+
+def review_create(*, fields: Mapping[str, Any]) -> core_models.EmployerReviewMVP:
+    """Submit a review, written with the other writes of the process.
+
+    The review is saved by ``orgtorii.db.writer.WriteQueue``, so its company link and
+    statistics are updated by the model signals in the same transaction.
+
+    Args:
+        fields (Mapping[str, Any]): the validated values of the review, e.g. the
+            ``cleaned_data`` of ``EmployerReviewMVPForm``
+
+    Returns:
+        EmployerReviewMVP: the saved review
+
+    Raises:
+        TimeoutError: the review wasn't committed within ``settings.WRITE_QUEUE_TIMEOUT``,
+            it is still written afterwards, so it mustn't be submitted again
+    """
+    return writer.get_write_queue().run(
+        core_models.EmployerReviewMVP.objects.create,
+        timeout=settings.WRITE_QUEUE_TIMEOUT,
+        **fields,
+    )
+
+
+def review_import(
+    *,
+    rows: Iterable[Mapping[str, Any]],
+    source: str,
+    rejected: TextIO,
+    chunk_size: int = 1000,
+    rebuild_statistics: bool = True,
+) -> ReviewImportResult:
+    """Import reviews in bulk, e.g. from partner data dumps.
+
+    Rows are validated a chunk at a time with the model field validators and valid rows
+    are written with ``bulk_create``. Each chunk is committed in its own (IMMEDIATE)
+    transaction together with the import checkpoint, so an interrupted import resumes
+    after the last committed chunk without duplicating reviews.
+
+    Invalid rows are written to ``rejected`` as JSON lines with their row number and
+    errors. Rows of a chunk that was interrupted before committing may be rejected twice.
+
+    ``bulk_create`` skips the model signals, so the rating aggregates and salary sketches
+    are rebuilt at the end unless ``rebuild_statistics`` is False.
+
+    Args:
+        rows (Iterable[Mapping[str, Any]]): the rows to import, keyed by field name
+        source (str): a name identifying the import, used as the checkpoint key
+        rejected (TextIO): where to write rejected rows
+        chunk_size (int): the number of rows to validate and insert per transaction
+        rebuild_statistics (bool): rebuild the precomputed review statistics afterwards
+
+    Returns:
+        ReviewImportResult: the number of imported, rejected and skipped rows
+    """
+    checkpoint, _ = core_models.ImportCheckpoint.objects.get_or_create(name=source)
+    result = ReviewImportResult(skipped=checkpoint.position)
+    rows = iter(rows)
+    # Skip the rows committed by a previous run
+    for _ in itertools.islice(rows, checkpoint.position):
+        pass
+
+    cleaner = _ReviewImportCleaner()
+    companies = LRUCache(maxsize=10_000)
+    position = checkpoint.position
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        cleaned, errors = cleaner.clean(chunk)
+        for index, row_errors in errors.items():
+            rejected.write(
+                json.dumps(
+                    {"row": position + index + 1, "data": chunk[index], "errors": row_errors},
+                    default=str,
+                )
+                + "\n"
+            )
+        rejected.flush()
+
+        reviews = []
+        with transaction.atomic():
+            for index, values in enumerate(cleaned):
+                if index in errors:
+                    continue
+                key = (
+                    core_models.normalize_company_name(values["company_name"]),
+                    core_models.normalize_domain(values["company_domain"]),
+                )
+                company = companies.get(key)
+                if company is None:
+                    company = company_get_or_create(
+                        name=values["company_name"], domain=values["company_domain"]
+                    )
+                    companies.set(key, company)
+                reviews.append(core_models.EmployerReviewMVP(company=company, **values))
+            core_models.EmployerReviewMVP.objects.bulk_create(reviews)
+            position += len(chunk)
+            core_models.ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(position=position)
+
+        result.imported += len(reviews)
+        result.rejected += len(errors)
+
+    if rebuild_statistics and result.imported:
+        company_rating_aggregate_rebuild()
+        salary_sketch_rebuild()
+    return result
+
+
+def review_verify(
+    *, review: core_models.EmployerReviewMVP, confidence: float | None = None
+) -> core_models.EmployerReviewMVP:
+    """Mark a review as verified.
+
+    Saving through the model keeps the verified rating aggregates in sync.
+
+    Args:
+        review (core_models.EmployerReviewMVP): the review to verify
+        confidence (float | None): the confidence of an automatic verification, if any
+
+    Returns:
+        core_models.EmployerReviewMVP: the verified review
+    """
+    review.verified = True
+    update_fields = ["verified"]
+    if confidence is not None:
+        review.verification_confidence = confidence
+        update_fields.append("verification_confidence")
+    review.save(update_fields=update_fields)
+    return review
+
+
+def payslip_match_confidence(*, text: str, company_name: str, company_domain: str = "") -> float:
+    """Score how confidently the text of a payslip names a company.
+
+    The company domain appearing in the text (e.g. in an email address) is a certain
+    match, followed by the normalized company name. Otherwise the most similar run of
+    words in the text is scored, so small extraction errors still match.
+
+    Args:
+        text (str): the text extracted from the payslip
+        company_name (str): the company name of the review
+        company_domain (str): the company domain of the review, if any
+
+    Returns:
+        float: the confidence between 0 and 1
+    """
+    domain = core_models.normalize_domain(company_domain)
+    if domain and re.search(rf"(?<![\w.-]){re.escape(domain)}(?![\w-])", text, re.IGNORECASE):
+        return 1.0
+
+    name = core_models.normalize_company_name(company_name)
+    name_length = len(name.split())
+    words = core_models.normalize_company_name(text).split()
+    if not name or not words:
+        return 0.0
+
+    # The name is compared against every run of as many words in the text
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(name)
+    best = 0.0
+    for start in range(max(1, len(words) - name_length + 1)):
+        window = " ".join(words[start : start + name_length])
+        if window == name:
+            return 0.95
+        matcher.set_seq1(window)
+        if matcher.real_quick_ratio() > best and matcher.quick_ratio() > best:
+            best = max(best, matcher.ratio())
+    return round(best * 0.9, 3)
+
+
+def review_payslip_verify(*, review_id: int) -> core_models.EmployerReviewMVP | None:
+    """Verify a review by matching the text of its payslip against the company.
+
+    The review is verified when the match confidence reaches
+    ``settings.PAYSLIP_VERIFICATION_THRESHOLD``, unless the same payslip was submitted with
+    another review. Verified reviews are never unverified.
+
+    Args:
+        review_id (int): the ID of the review
+
+    Returns:
+        core_models.EmployerReviewMVP | None: the review, None if it has no payslip anymore
+    """
+    review = core_models.EmployerReviewMVP.objects.filter(id=review_id).first()
+    if review is None or not review.payslip:
+        return None
+    with review.payslip.open("rb") as payslip:
+        text = pdf.extract_text(payslip.read())
+    confidence = payslip_match_confidence(
+        text=text, company_name=review.company_name, company_domain=review.company_domain
+    )
+
+    if (
+        not review.verified
+        and confidence >= settings.PAYSLIP_VERIFICATION_THRESHOLD
+        and not selectors.payslip_duplicate_exists(
+            sha256=review.payslip_sha256, exclude_review_id=review.id
+        )
+    ):
+        return review_verify(review=review, confidence=confidence)
+    review.verification_confidence = confidence
+    review.save(update_fields=["verification_confidence"])
+    return review
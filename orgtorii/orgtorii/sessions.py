@@ -0,0 +1,114 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.sessions.backends import db
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.core import signing
+from django.db import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Session keys of the sessions stored in their cookie
+_SIGNED_PREFIX = "signed:"
+_SIGNING_SALT = "orgtorii.sessions"
+# Attempts to create a session in the database, a locked database is retried like a
+# collision with an existing key
+_CREATE_ATTEMPTS = 3
+
+
+class SessionStore(db.SessionStore):
+    """Sessions in the ``ephemeral`` database, or in a signed cookie while it can't be written.
+
+    Sessions are rows of Django's session table, which ``EphemeralRouter`` keeps in the
+    ``ephemeral`` database. They are only removed once expired, by running
+    ``manage.py clearsessions`` periodically.
+
+    When the database can't be written, e.g. it stays locked, the session data is signed
+    and sent as the session cookie like Django's ``signed_cookies`` engine does, rather
+    than failing the request. It moves back to the database the next time it is saved.
+    Until then it can't be invalidated on the server, so it is only valid for
+    ``SESSION_COOKIE_AGE``.
+    """
+
+    def _is_signed(self) -> bool:
+        return bool(self.session_key) and self.session_key.startswith(_SIGNED_PREFIX)
+
+    def _save_signed(self, *, no_load: bool) -> None:
+        logger.warning("The session database can't be written, storing a session in its cookie")
+        self._session_key = _SIGNED_PREFIX + signing.dumps(
+            self._get_session(no_load=no_load),
+            salt=_SIGNING_SALT,
+            serializer=self.serializer,
+            compress=True,
+        )
+        self.modified = True
+
+    def load(self):
+        if not self._is_signed():
+            return super().load()
+        try:
+            return signing.loads(
+                self.session_key.removeprefix(_SIGNED_PREFIX),
+                salt=_SIGNING_SALT,
+                serializer=self.serializer,
+                max_age=self.get_session_cookie_age(),
+            )
+        except (signing.BadSignature, ValueError):
+            self._session_key = None
+            return {}
+
+    def create(self):
+        for _ in range(_CREATE_ATTEMPTS):
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+        self._save_signed(no_load=True)
+
+    def save(self, must_create=False):
+        if self._is_signed():
+            # Move the session back to the database under a new key
+            self._session_key = None
+        try:
+            return super().save(must_create=must_create)
+        except UpdateError as e:
+            # Also raised when the session was deleted meanwhile, e.g. by a logout
+            if not isinstance(e.__context__, OperationalError):
+                raise
+            self._save_signed(no_load=False)
+        except OperationalError as e:
+            if must_create:
+                raise CreateError from e
+            self._save_signed(no_load=False)
+
+    def exists(self, session_key):
+        if session_key and session_key.startswith(_SIGNED_PREFIX):
+            return False
+        return super().exists(session_key)
+
+    def delete(self, session_key=None):
+        if (session_key or self.session_key or "").startswith(_SIGNED_PREFIX):
+            # Only in the cookie, which the middleware deletes
+            return
+        super().delete(session_key)
+
+    # The async methods run the sync ones to handle signed sessions as well, the database
+    # backend runs its queries in a thread anyway
+
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def acreate(self):
+        return await sync_to_async(self.create)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create=must_create)
+
+    async def aexists(self, session_key):
+        return await sync_to_async(self.exists)(session_key)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
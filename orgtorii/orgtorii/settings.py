@@ -74,23 +74,27 @@ INSTALLED_APPS = [
     "orgtorii.core",
 ]
 
+# The Django and WhiteNoise middleware are subclassed in orgtorii/middleware.py so they
+# run on the event loop under ASGI instead of a thread per hook
 MIDDLEWARE = [
-    "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
-    "django.middleware.common.CommonMiddleware",
+    "orgtorii.middleware.SecurityMiddleware",
+    "orgtorii.middleware.WhiteNoiseMiddleware",
+    "orgtorii.page_cache.PageCacheMiddleware",
+    "orgtorii.middleware.SessionMiddleware",
+    "orgtorii.middleware.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
-    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "orgtorii.middleware.AuthenticationMiddleware",
+    "orgtorii.middleware.MessageMiddleware",
+    "orgtorii.middleware.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",  # adds request.htmx attribute
     # allauth account middleware:
     "allauth.account.middleware.AccountMiddleware",
 ]
 
-if not TESTING:
+if DEBUG and not TESTING:
     # Don't add debug toolbar in testing mode
     # https://django-debug-toolbar.readthedocs.io/en/latest/installation.html#disable-the-toolbar-when-running-tests-optional
+    # nor in production, its templates panel instruments the rendering of every template
     INSTALLED_APPS = [
         *INSTALLED_APPS,
         "debug_toolbar",
@@ -107,9 +111,9 @@ if not TESTING:
         "django_prometheus",
     ]
     MIDDLEWARE = [
-        "django_prometheus.middleware.PrometheusBeforeMiddleware",
+        "orgtorii.middleware.PrometheusBeforeMiddleware",
         *MIDDLEWARE,
-        "django_prometheus.middleware.PrometheusAfterMiddleware",
+        "orgtorii.middleware.PrometheusAfterMiddleware",
     ]
 
 ROOT_URLCONF = "orgtorii.urls"
@@ -118,8 +122,18 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": ["templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Templates are parsed once per process, also in development where the
+            # autoreloader resets the cache when a template changes
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -130,38 +144,94 @@ TEMPLATES = [
     },
 ]
 
+# Seconds the blocks wrapped in {% fragmentcache %} (header, footer, ...) are cached for,
+# rendered every time in development so template changes show up, and in tests
+TEMPLATE_FRAGMENT_CACHE_TIMEOUT = 0 if DEBUG or TESTING else 24 * 60 * 60
+
+# Anonymous visitors are served the pages of views decorated with cache_anonymous_page
+# from the cache for this many seconds (0 disables the cache, e.g. in development)
+PAGE_CACHE_TIMEOUT = 0 if DEBUG or TESTING else 60
+# Seconds an expired page is still served while a single worker renders it again
+PAGE_CACHE_STALE_TIMEOUT = 5 * 60
+# Seconds other workers wait for a page being rendered before rendering it themselves
+PAGE_CACHE_LOCK_TIMEOUT = 10
+
 WSGI_APPLICATION = "orgtorii.wsgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Both aliases open the same SQLite file: writes go to "default" and reads outside of
+# transactions to the query_only connections of "read", see orgtorii.db.routers.
+# Sessions and the ephemeral cache are written to a file of their own, "ephemeral", so
+# logins don't queue for the write lock of the business data.
+# orgtorii.db.backends.sqlite3 keeps the connections open between requests in pools.
+_SQLITE_INIT_COMMAND = (
+    "PRAGMA foreign_keys=ON;"
+    "PRAGMA journal_mode = WAL;"
+    "PRAGMA synchronous = NORMAL;"
+    "PRAGMA busy_timeout = 500;"  # 500ms
+    "PRAGMA temp_store = MEMORY;"
+    f"PRAGMA mmap_size = {128 * 1024 * 1024};"  # 128MB
+    f"PRAGMA journal_size_limit = {64 * 1024 * 1024};"  # 64MB
+    f"PRAGMA cache_size = -{8 * 1024};"  # 8MB, in KiB
+)
+# The replicate_database command ships the WAL to DATABASE_REPLICA_DIRECTORY and runs
+# the checkpoints, the requests committing transactions leave them to it
+DATABASE_REPLICATION = env.bool("DATABASE_REPLICATION", False)
+DATABASE_REPLICA_DIRECTORY = env.str("DATABASE_REPLICA_DIRECTORY", str(BASE_DIR / "backups"))
+_DATABASE_INIT_COMMAND = _SQLITE_INIT_COMMAND
+if DATABASE_REPLICATION:
+    _DATABASE_INIT_COMMAND += "PRAGMA wal_autocheckpoint = 0;"
 DATABASES = {
     "default": {
-        "ENGINE": "django_prometheus.db.backends.sqlite3",
+        "ENGINE": "orgtorii.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
         # https://gcollazo.com/optimal-sqlite-settings-for-django/
         "OPTIONS": {
-            "init_command": (
-                "PRAGMA foreign_keys=ON;"
-                "PRAGMA journal_mode = WAL;"
-                "PRAGMA synchronous = NORMAL;"
-                "PRAGMA busy_timeout = 500;"  # 500ms
-                "PRAGMA temp_store = MEMORY;"
-                f"PRAGMA mmap_size = {128 * 1024 * 1024};"  # 128MB
-                f"PRAGMA journal_size_limit = {64 * 1024 * 1024};"  # 64MB
-                f"PRAGMA cache_size = -{8 * 1024 * 1024};"  # 8MB of 4096 bytes pages
-            ),
+            "init_command": _DATABASE_INIT_COMMAND,
+            "transaction_mode": "IMMEDIATE",
+            "pool_size": 4,
+            # Seconds write transactions queue for each other, before SQLite's busy_timeout
+            "write_lock_timeout": 5,
+        },
+    },
+    "read": {
+        "ENGINE": "orgtorii.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "init_command": _DATABASE_INIT_COMMAND,
+            "pool_size": 16,
+            "query_only": True,
+        },
+        "TEST": {"MIRROR": "default"},
+    },
+    "ephemeral": {
+        "ENGINE": "orgtorii.db.backends.sqlite3",
+        "NAME": BASE_DIR / "ephemeral.sqlite3",
+        "OPTIONS": {
+            # Not backed up and not synced: a crash at most signs the last logins out
+            "init_command": _SQLITE_INIT_COMMAND + "PRAGMA synchronous = OFF;",
             "transaction_mode": "IMMEDIATE",
+            "pool_size": 4,
+            "write_lock_timeout": 5,
         },
-    }
+    },
 }
+DATABASE_ROUTERS = ["orgtorii.db.routers.EphemeralRouter", "orgtorii.db.routers.ReadWriteRouter"]
+# Writes handed to orgtorii.db.writer.WriteQueue run on a single thread of the process,
+# committed in groups. Without background writes every write runs in its caller's thread.
+WRITE_QUEUE_BACKGROUND = not TESTING
+WRITE_QUEUE_BATCH_SIZE = 100  # writes per transaction
+WRITE_QUEUE_TIMEOUT = 10  # seconds callers wait for their write to commit
 
 # Cache
 # https://docs.djangoproject.com/en/5.1/topics/cache/#using-a-custom-cache-backend
 CACHES = {
     "default": {
-        "BACKEND": "diskcache.DjangoCache",
+        # diskcache.DjangoCache with a per-process LRU cache in front of it
+        "BACKEND": "orgtorii.cache.TieredDjangoCache",
         "LOCATION": os.path.join(tempfile.gettempdir(), f"{PROJECT_SLUG}-cache"),
         "TIMEOUT": 30,
         # ^-- Django setting for default timeout of each key.
@@ -169,7 +239,25 @@ CACHES = {
         "DATABASE_TIMEOUT": 0.010,  # 10 milliseconds
         # ^-- Timeout for each DjangoCache database transaction.
         "OPTIONS": {"size_limit": 2**30},  # 1 gigabyte
+        "LOCAL_MAX_ENTRIES": 1024,
+        "LOCAL_TIMEOUT": 5,
+        # ^-- Seconds a process may serve a value another process has since overwritten
+        "GENERATION_CHECK_INTERVAL": 1,
+        # ^-- Seconds before a process sees keys deleted by another process
     },
+    # State every process must see as soon as it is written, such as allauth's rate
+    # limits, in the ephemeral database. Create its table with `manage.py createcachetable`.
+    # Its writes count the rows and cull them past MAX_ENTRIES, which is cheap enough for
+    # login attempts but not for sessions, they have a table of their own.
+    "ephemeral": (
+        {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        if TESTING
+        else {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "ephemeral_cache",
+            "OPTIONS": {"MAX_ENTRIES": 1_000_000},
+        }
+    ),
 }
 
 # Email settings
@@ -185,6 +273,13 @@ SERVER_EMAIL = f"root@{env.str('EMAIL_DOMAIN')}"
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-timeout
 EMAIL_TIMEOUT = 5
+# Mail servers limit the messages sent per connection, pooled connections are closed after
+EMAIL_MAX_MESSAGES_PER_CONNECTION = 100
+
+# Newsletter campaigns, see the send_newsletter_campaign command. Keep the rate within
+# the limits of the mail provider
+NEWSLETTER_CAMPAIGN_RATE = env.float("NEWSLETTER_CAMPAIGN_RATE", 10)  # messages per second
+NEWSLETTER_CAMPAIGN_THREADS = env.int("NEWSLETTER_CAMPAIGN_THREADS", 4)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -216,6 +311,14 @@ PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.ScryptPasswordHasher",
 ]
 
+# Argon2 parameters of orgtorii.hashers.SecureArgon2PasswordHasher, the
+# calibrate_password_hasher command recommends values for the host. Existing hashes are
+# upgraded when their users log in.
+ARGON2_TIME_COST = env.int("ARGON2_TIME_COST", 2)  # iterations
+ARGON2_MEMORY_COST = env.int("ARGON2_MEMORY_COST", 20 * 1024)  # KiB
+# Password hashes computed at once per process, each one takes ARGON2_MEMORY_COST memory
+PASSWORD_HASHING_THREADS = env.int("PASSWORD_HASHING_THREADS", os.cpu_count() or 1)
+
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",  # default
     "guardian.backends.ObjectPermissionBackend",
@@ -223,6 +326,14 @@ AUTHENTICATION_BACKENDS = (
     "allauth.account.auth_backends.AuthenticationBackend",
 )
 
+# Sessions, which also hold allauth's login codes and MFA stages, are kept in the
+# ephemeral database, see orgtorii.sessions. Run `manage.py clearsessions` periodically
+# (e.g. hourly) to delete the expired ones.
+SESSION_ENGINE = "orgtorii.sessions"
+# allauth keeps its rate limit counters in this cache rather than in the default one,
+# whose per-process tier would lose the attempts counted by the other processes
+RATELIMIT_CACHE_ALIAS = "ephemeral"
+
 LOGIN_REDIRECT_URL = "account:dashboard"
 LOGOUT_REDIRECT_URL = "home"
 
@@ -269,9 +380,20 @@ MFA_TOTP_ISSUER = PROJECT_DISPLAY_NAME
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    # Payslips are private: they have no URL, their storage refuses to make one, and
+    # nothing serves MEDIA_ROOT. Identical payslips are stored once, run the
+    # collect_payslip_garbage command to remove unreferenced ones
+    "payslips": {
+        "BACKEND": "orgtorii.core.storage.ContentAddressedStorage",
+        # MEDIA_ROOT is shared with the default storage, see get_payslip_upload_path
+        "OPTIONS": {"private": True, "adopt_directory": "employer_reviews/payslips"},
+    },
 }
 STATICFILES_DIRS = [
     BASE_DIR / "static",
@@ -280,6 +402,34 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATIC_HOST = env.str("DJANGO_STATIC_HOST", "")
 STATIC_URL = STATIC_HOST + "/static/"
 
+# User uploaded files
+# https://docs.djangoproject.com/en/5.1/topics/files/
+MEDIA_ROOT = BASE_DIR / "media"
+FILE_UPLOAD_HANDLERS = [
+    "orgtorii.core.uploads.PayslipUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+PAYSLIP_MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5 MiB
+# Payslips matching the company at least this well (0-1) verify their review
+PAYSLIP_VERIFICATION_THRESHOLD = 0.8
+
+# Background jobs, run by the run_worker command. Use the Valkey queue service in
+# production, e.g. redis://queue:6379/0. memory://, only allowed with DEBUG, keeps jobs
+# inside the current process and runs them on a thread of it
+JOBS_BROKER_URL = env.str("JOBS_BROKER_URL", "memory://")
+
+# Newsletter signups are written in batches, see orgtorii.newsletter.NewsletterSignupBuffer.
+# Without background writes every signup is written in its request.
+NEWSLETTER_SIGNUP_BACKGROUND_WRITES = not TESTING
+NEWSLETTER_SIGNUP_BATCH_SIZE = 500  # rows per INSERT statement
+NEWSLETTER_SIGNUP_REFRESH_INTERVAL = 0 if TESTING else 5  # seconds
+# Wait for the batch of a signup to be written before acknowledging it, for at most
+# NEWSLETTER_SIGNUP_WRITE_TIMEOUT. A signup still waiting in memory then is acknowledged
+# anyway, and lost if the process crashes before it is written
+NEWSLETTER_SIGNUP_WAIT_FOR_WRITE = env.bool("NEWSLETTER_SIGNUP_WAIT_FOR_WRITE", True)
+NEWSLETTER_SIGNUP_WRITE_TIMEOUT = 5  # seconds
+
 # Django newsletter
 # https://django-newsletter.readthedocs.io/en/latest/installation.html
 # Using sorl-thumbnail
@@ -0,0 +1,195 @@
+import hashlib
+import math
+from typing import Any
+
+
+class TDigest:
+    """A mergeable t-digest for estimating quantiles of a stream of numbers.
+
+    Values are clustered into weighted centroids which are small near the tails and
+    larger around the median, so extreme percentiles stay accurate while the size of the
+    digest is bounded by ``compression`` rather than the number of values added.
+
+    Digests can be merged with each other and serialized to plain JSON-compatible
+    dictionaries for storage.
+
+    Based on the merging digest from "Computing Extremely Accurate Quantiles Using
+    t-Digests" (Dunning & Ertl): https://arxiv.org/abs/1902.04023
+
+    >>> digest = TDigest()
+    >>> for value in range(1, 101):
+    ...     digest.add(value)
+    >>> digest.quantile(0.5)
+    50.5
+    """
+
+    def __init__(self, compression: int = 100) -> None:
+        self.compression = compression
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._centroids: list[list[float]] = []  # [mean, weight] sorted by mean
+        self._unmerged: list[list[float]] = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, value: float, weight: int = 1) -> None:
+        """Add a value to the digest.
+
+        Args:
+            value (float): the value to add
+            weight (int): how many times the value was seen
+        """
+        self._unmerged.append([float(value), weight])
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._unmerged) > self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> None:
+        """Merge the values of another digest into this one.
+
+        Args:
+            other (TDigest): the digest to merge in
+        """
+        other._compress()
+        self._unmerged.extend([mean, weight] for mean, weight in other._centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate the value at a quantile.
+
+        Args:
+            q (float): the quantile between 0 and 1, e.g. 0.5 for the median
+
+        Returns:
+            float | None: the estimated value or None if the digest is empty
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("The quantile must be between 0 and 1.")
+        self._compress()
+        if not self._centroids:
+            return None
+        if len(self._centroids) == 1:
+            return self._centroids[0][0]
+
+        target = q * self.count
+        first_mean, first_weight = self._centroids[0]
+        if target < first_weight / 2:
+            return self.min + (first_mean - self.min) * target / (first_weight / 2)
+        last_mean, last_weight = self._centroids[-1]
+        if target > self.count - last_weight / 2:
+            tail = target - (self.count - last_weight / 2)
+            return last_mean + (self.max - last_mean) * tail / (last_weight / 2)
+
+        # Interpolate between the centers of the two centroids surrounding the target
+        cumulative = first_weight / 2
+        for (mean, weight), (next_mean, next_weight) in zip(
+            self._centroids, self._centroids[1:], strict=False
+        ):
+            step = (weight + next_weight) / 2
+            if cumulative + step >= target:
+                return mean + (next_mean - mean) * (target - cumulative) / step
+            cumulative += step
+        return last_mean
+
+    def to_dict(self) -> dict[str, Any]:
+        """Serialize the digest to a JSON-compatible dictionary."""
+        self._compress()
+        return {
+            "compression": self.compression,
+            "count": self.count,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "centroids": self._centroids,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TDigest":
+        """Load a digest serialized with ``to_dict``.
+
+        An empty dictionary returns an empty digest.
+        """
+        digest = cls(compression=data.get("compression", 100))
+        if data.get("count"):
+            digest.count = data["count"]
+            digest.min = data["min"]
+            digest.max = data["max"]
+            digest._centroids = [list(centroid) for centroid in data["centroids"]]
+        return digest
+
+    def _k(self, q: float) -> float:
+        # The k1 scale function, keeps centroids small near the tails
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k: float) -> float:
+        k = min(k, self.compression / 4)
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self) -> None:
+        if not self._unmerged:
+            return
+        centroids = sorted(self._centroids + self._unmerged, key=lambda centroid: centroid[0])
+        self._unmerged = []
+
+        merged = [centroids[0][:]]
+        weight_so_far = 0.0
+        weight_limit = self.count * self._k_inverse(self._k(0) + 1)
+        for mean, weight in centroids[1:]:
+            current = merged[-1]
+            if weight_so_far + current[1] + weight <= weight_limit:
+                current[1] += weight
+                current[0] += (mean - current[0]) * weight / current[1]
+            else:
+                weight_so_far += current[1]
+                weight_limit = self.count * self._k_inverse(self._k(weight_so_far / self.count) + 1)
+                merged.append([mean, weight])
+        self._centroids = merged
+
+
+class BloomFilter:
+    """A set of strings answering membership with false positives but no false negatives.
+
+    ``capacity`` items fit in ``-capacity * ln(error_rate) / ln(2)²`` bits with a false
+    positive rate of ``error_rate``, the rate rises as more items are added.
+
+    >>> known = BloomFilter(capacity=1000)
+    >>> known.add("alice@example.com")
+    >>> "alice@example.com" in known
+    True
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._positions(item))
+
+    def add(self, item: str) -> None:
+        """Add an item to the filter.
+
+        Args:
+            item (str): the item to add
+        """
+        for i in self._positions(item):
+            self._bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def _positions(self, item: str):
+        # Double hashing: the positions are derived from the two halves of a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
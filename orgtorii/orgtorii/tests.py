@@ -1,9 +1,54 @@
+import asyncio
+import contextlib
+import dataclasses
+import gzip
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import UTC, datetime
+from pathlib import Path
+from unittest import mock
+
 import factory
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from diskcache import DjangoCache
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils.module_loading import import_string
 from djstripe.enums import PriceType, ProductType
-from djstripe.models import Price, Product
+from djstripe.models import Event, Price, Product
+from djstripe.signals import WEBHOOK_SIGNALS
+from guardian.shortcuts import assign_perm
+from prometheus_client import REGISTRY
+
+from . import cache as tiered_cache
+from . import hashers, jobs, mailing, pdf, permissions, selectors, views
+from .core.models import Company, NewsletterSignup
+from .db import replication, threads, writer
+from .db.backends.sqlite3 import base as sqlite_backend
+from .db.replication import WALReplicator
+from .db.routers import EphemeralRouter, ReadWriteRouter
+from .db.writer import WriteQueue
+from .lru import LRUCache
+from .newsletter import NewsletterSignupBuffer
+from .page_cache import PageCacheMiddleware, _page_key
+from .sessions import SessionStore
+from .sketches import BloomFilter, TDigest
 
 User = get_user_model()
 
@@ -43,6 +88,7 @@ class HomepageTestCase(TestCase):
 
 
 class AuthTestCase(TestCase):
+    databases = {"default", "ephemeral"}  # The sessions
     email = "jane@example.com"
     password = "iKDt6EFwyQEjkgqSzCdvFdC7imS5JN0H"
 
@@ -101,44 +147,1182 @@ class AuthTestCase(TestCase):
 
 
 class PricingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_uses_pricing_template(self):
         response = self.client.get(reverse("pricing"))
 
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "orgtorii/pricing.html")
 
-    def test_pricing_view_returns_products(self):
-        ProductFactory()
-        ProductFactory()
+    def plan_names(self, response):
+        return [plan.name for plan in response.context["plans"]]
+
+    def test_pricing_view_renders_plans(self):
+        ProductFactory(name="Hobby")
+        ProductFactory(name="Enterprise")
 
         response = self.client.get(reverse("pricing"))
 
-        self.assertIn("products", response.context)
-        self.assertIsNotNone(response.context["products"])
-        self.assertEqual(len(response.context["products"]), 2)
+        self.assertNotIn("products", response.context)
+        self.assertEqual(sorted(self.plan_names(response)), ["Enterprise", "Hobby"])
+        self.assertContains(response, 'data-testid="pricing-plan"', count=2)
+        self.assertContains(response, "Enterprise")
 
     def test_pricing_view_only_shows_service_products(self):
-        ProductFactory(type=ProductType.good)
-        service = ProductFactory(type=ProductType.service)
+        ProductFactory(name="Mug", type=ProductType.good)
+        ProductFactory(name="Hobby", type=ProductType.service)
 
         response = self.client.get(reverse("pricing"))
 
-        self.assertEqual(len(response.context["products"]), 1)
-        self.assertEqual(response.context["products"][0].type, ProductType.service)
-        self.assertEqual(response.context["products"][0].name, service.name)
+        self.assertEqual(self.plan_names(response), ["Hobby"])
+        self.assertNotContains(response, "Mug")
 
     def test_pricing_view_shows_price_details(self):
-        product = ProductFactory()
-        PriceFactory(product=product)
-        PriceFactory(product=product)
+        product = ProductFactory(name="Hobby")
+        PriceFactory(product=product, unit_amount=1900, recurring={"interval": "month"})
+        PriceFactory(product=product, unit_amount=19000, recurring={"interval": "year"})
+
+        response = self.client.get(reverse("pricing"))
+
+        self.assertContains(response, 'data-testid="plan-price">19 USD', html=False)
+        self.assertContains(response, 'data-testid="plan-price">190 USD', html=False)
+        self.assertContains(response, "/year")
 
+    def test_cached_pricing_page_does_not_query_the_database(self):
+        PriceFactory()
+        self.client.get(reverse("pricing"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("pricing"))
+
+        self.assertContains(response, 'data-testid="pricing-plan"', count=1)
+
+    def test_price_change_clears_pricing_cache(self):
+        price = PriceFactory(unit_amount=1900)
+        self.client.get(reverse("pricing"))
+
+        PriceFactory(product=price.product, unit_amount=4900)
         response = self.client.get(reverse("pricing"))
 
-        self.assertIn("products", response.context)
-        self.assertIsNotNone(response.context["products"])
-        self.assertEqual(len(response.context["products"]), 1)
+        self.assertContains(response, "49 USD")
+
+    def test_stripe_webhook_clears_pricing_cache(self):
+        self.client.get(reverse("pricing"))
+        # Simulate a product created without signals, e.g. by another process
+        Product.objects.bulk_create([Product(id="prod_1", name="Pro", type=ProductType.service)])
+
+        WEBHOOK_SIGNALS["product.created"].send(sender=Event, event=None)
+        response = self.client.get(reverse("pricing"))
+
+        self.assertContains(response, 'data-testid="plan-name">Pro<')
+
+
+class PricingPlanListTestCase(TestCase):
+    def test_loads_plans_and_prices_in_two_queries(self):
+        for _ in range(3):
+            product = ProductFactory()
+            PriceFactory.create_batch(2, product=product, recurring={"interval": "month"})
+
+        with self.assertNumQueries(2):
+            plans = selectors.pricing_plan_list()
+
+        self.assertEqual(len(plans), 3)
+        self.assertEqual([len(plan.prices) for plan in plans], [2, 2, 2])
+        self.assertEqual(plans[0].prices[0].interval, "month")
+
+    def test_only_lists_active_recurring_prices(self):
+        product = ProductFactory()
+        PriceFactory(product=product, nickname="Monthly", recurring={"interval": "month"})
+        PriceFactory(product=product, active=False)
+        PriceFactory(product=product, type=PriceType.one_time)
+        ProductFactory(type=ProductType.good)
+
+        plans = selectors.pricing_plan_list()
+
+        self.assertEqual([plan.name for plan in plans], [product.name])
+        self.assertEqual([price.nickname for price in plans[0].prices], ["Monthly"])
+
+    def test_plans_are_immutable_and_picklable(self):
+        PriceFactory(recurring={"interval": "year"})
+        plans = selectors.pricing_plan_list()
+
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            plans[0].name = "Free"
+        self.assertFalse(hasattr(plans[0], "__dict__"))
+        self.assertEqual(pickle.loads(pickle.dumps(plans)), plans)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        self.client.get(reverse("pricing"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("pricing"))
+
+        self.assertEqual(response.templates, [])
+        self.assertContains(response, 'data-testid="pricing-table"')
+
+    def test_pages_are_compressed(self):
+        response = self.client.get(reverse("homepage"), HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"</html>", gzip.decompress(response.content))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    def test_unchanged_pages_are_not_modified(self):
+        etag = self.client.get(reverse("homepage"))["ETag"]
+
+        response = self.client.get(reverse("homepage"), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_visitors_with_a_session_are_not_served_from_cache(self):
+        self.client.get(reverse("homepage"))
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "session"
+
+        response = self.client.get(reverse("homepage"))
+
+        self.assertTemplateUsed(response, "orgtorii/homepage.html")
+
+    def test_unmarked_views_are_not_cached(self):
+        self.client.get(reverse("core:review_list"))
+
+        response = self.client.get(reverse("core:review_list"))
+
+        self.assertTemplateUsed(response, "core/pages/reviews/list.html")
+
+    def test_expired_page_is_served_while_another_worker_renders_it(self):
+        self.client.get(reverse("homepage"))
+        key = _page_key(RequestFactory().get(reverse("homepage")))
+        cache.set(key, dataclasses.replace(cache.get(key), fresh_until=0))
+        cache.add(f"{key}:lock", True)
+
+        response = self.client.get(reverse("homepage"))
+        self.assertEqual(response.templates, [])
+
+        cache.touch(f"{key}:lock", 0)
+        response = self.client.get(reverse("homepage"))
+        self.assertTemplateUsed(response, "orgtorii/homepage.html")
+
+    async def test_async_cache_is_not_used_on_event_loop(self):
+        def assert_not_on_event_loop(method):
+            def wrapper(*args, **kwargs):
+                with self.assertRaises(RuntimeError):
+                    asyncio.get_running_loop()
+                return method(*args, **kwargs)
+
+            return wrapper
+
+        with (
+            mock.patch.object(
+                PageCacheMiddleware,
+                "_lookup",
+                assert_not_on_event_loop(PageCacheMiddleware._lookup),
+            ),
+            mock.patch.object(
+                PageCacheMiddleware, "_store", assert_not_on_event_loop(PageCacheMiddleware._store)
+            ),
+        ):
+            await self.async_client.get(reverse("homepage"))
+            response = await self.async_client.get(reverse("homepage"))
+
+        self.assertEqual(response.templates, [])
+
+    def test_csrf_token_is_fetched_separately(self):
+        response = self.client.get(reverse("csrf_token"))
+
+        self.assertTrue(response.json()["token"])
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+
+class AsyncViewsTestCase(TestCase):
+    def test_middleware_is_async_capable(self):
+        # A single sync-only middleware makes Django run the whole request in a thread
+        for middleware_path in settings.MIDDLEWARE:
+            if middleware_path.startswith("opentelemetry."):
+                # Inserted by the instrumentation in manage.py, not used under ASGI
+                continue
+            with self.subTest(middleware=middleware_path):
+                middleware = import_string(middleware_path)
+                self.assertTrue(getattr(middleware, "async_capable", False))
+
+    def test_views_are_async(self):
+        for view in (views.homepage, views.pricing):
+            with self.subTest(view=view.__name__):
+                self.assertTrue(iscoroutinefunction(view))
+
+    async def test_async_views_render(self):
+        urls = (
+            reverse("homepage"),
+            reverse("pricing"),
+            reverse("core:coming_soon"),
+            reverse("core:review_list"),
+            reverse("newsletter:signup_success"),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    async def test_async_pricing_lists_plans(self):
+        await sync_to_async(ProductFactory)(name="Hobby")
+        response = await self.async_client.get(reverse("pricing"))
+        self.assertContains(response, "Hobby")
+
+
+class SQLiteBackendTestCase(TestCase):
+    # The connections of the test databases aren't used, but they share the backend class
+    databases = {"default", "read"}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = f"{directory.name}/db.sqlite3"
+        engine = "orgtorii.db.backends.sqlite3"
+        self.connections = ConnectionHandler(
+            {
+                "default": {
+                    "ENGINE": engine,
+                    "NAME": name,
+                    "OPTIONS": {
+                        "transaction_mode": "IMMEDIATE",
+                        "pool_size": 2,
+                        "write_lock_timeout": 0.1,
+                    },
+                },
+                "read": {
+                    "ENGINE": engine,
+                    "NAME": name,
+                    "OPTIONS": {"pool_size": 2, "query_only": True},
+                },
+            }
+        )
+        self.addCleanup(self.close_pools, name)
+
+    def close_pools(self, name):
+        self.connections.close_all()
+        for alias in ("default", "read"):
+            pool = sqlite_backend._pools.pop((alias, name), None)
+            while pool is not None and not pool.empty():
+                pool.get_nowait().close()
+
+    def test_closed_connections_are_reused(self):
+        connection = self.connections["default"]
+        connection.ensure_connection()
+        raw_connection = connection.connection
+        connection.close()
+
+        connection.ensure_connection()
+
+        self.assertIs(connection.connection, raw_connection)
+
+    def test_read_connections_are_query_only(self):
+        with self.connections["read"].cursor() as cursor, self.assertRaises(OperationalError):
+            cursor.execute("CREATE TABLE example (id INTEGER)")
+
+    def test_write_transactions_are_serialized(self):
+        writer = self.connections["default"]
+        writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        errors = []
+
+        def write():
+            other = self.connections["default"]  # A connection of another thread
+            try:
+                other.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                other.close()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join()
+        writer.commit()
+        writer.set_autocommit(True)
+
+        self.assertEqual(len(errors), 1)
+        self.assertIn("Waited", str(errors[0]))
+
+    def test_router_reads_outside_transactions_from_read_alias(self):
+        router = ReadWriteRouter()
+
+        self.assertEqual(router.db_for_read(NewsletterSignup), DEFAULT_DB_ALIAS)
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", False):
+            self.assertEqual(router.db_for_read(NewsletterSignup), "read")
+        self.assertEqual(router.db_for_write(NewsletterSignup), DEFAULT_DB_ALIAS)
+
+    def test_router_keeps_sessions_and_cache_in_ephemeral_database(self):
+        router = EphemeralRouter()
+        self.assertEqual(router.db_for_write(Session), "ephemeral")
+        self.assertIsNone(router.db_for_write(NewsletterSignup))
+        self.assertTrue(router.allow_migrate("ephemeral", "sessions"))
+        self.assertFalse(router.allow_migrate("ephemeral", "core"))
+        self.assertFalse(router.allow_migrate(DEFAULT_DB_ALIAS, "sessions"))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, "core"))
+
+
+class WALReplicationTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.database = self.directory / "db.sqlite3"
+        self.connection = sqlite3.connect(self.database, isolation_level=None)
+        self.addCleanup(self.connection.close)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # Checkpoints are left to the replicator, like with DATABASE_REPLICATION
+        self.connection.execute("PRAGMA wal_autocheckpoint = 0")
+        self.connection.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, value TEXT)")
+        self.insert("snapshot", 500)
+
+    def replicator(self, **kwargs):
+        replicator = WALReplicator(
+            database=self.database, directory=self.directory / "backup", **kwargs
+        )
+        self.addCleanup(replicator.close)
+        return replicator
+
+    def insert(self, value, count):
+        with self.connection:
+            self.connection.executemany("INSERT INTO item (value) VALUES (?)", [(value,)] * count)
+
+    def rows(self, database):
+        connection = sqlite3.connect(database)
+        try:
+            return connection.execute("SELECT * FROM item ORDER BY id").fetchall()
+        finally:
+            connection.close()
+
+    def restore(self, **kwargs):
+        restored = self.directory / "restored.db"
+        result = replication.restore(directory=self.directory / "backup", target=restored, **kwargs)
+        return result, self.rows(restored)
+
+    def test_restore_replays_the_shipped_transactions(self):
+        replicator = self.replicator()
+        self.assertEqual(replicator.sync(), 0)  # The snapshot has the rows
+        self.insert("shipped", 100)
+        self.connection.execute("DELETE FROM item WHERE id % 3 = 0")
+        self.assertGreater(replicator.sync(), 0)
+
+        result, rows = self.restore()
+
+        self.assertEqual(rows, self.rows(self.database))
+        self.assertEqual(result.segments, 1)
+
+    def test_shipping_continues_after_the_wal_restarts(self):
+        replicator = self.replicator()
+        replicator.sync()
+        self.insert("before", 100)
+        self.assertEqual(replicator.checkpoint("RESTART"), "RESTART")
+        self.insert("after", 100)  # Restarts the WAL
+        replicator.sync()
+
+        _, rows = self.restore()
+
+        self.assertEqual(rows, self.rows(self.database))
+        self.assertEqual(len(list((self.directory / "backup").iterdir())), 1)
+
+    def test_restore_until_a_time(self):
+        replicator = self.replicator()
+        replicator.sync()
+        self.insert("early", 10)
+        replicator.sync()
+        until = datetime.now(UTC)
+        time.sleep(0.01)
+        self.insert("late", 10)
+        replicator.sync()
+
+        result, rows = self.restore(until=until)
+
+        self.assertEqual(result.segments, 1)
+        self.assertEqual({value for _, value in rows}, {"snapshot", "early"})
+
+    def test_restarted_replicator_continues_the_generation(self):
+        replicator = self.replicator()
+        replicator.sync()
+        self.insert("first", 10)
+        replicator.sync()
+        replicator.close()
+
+        replicator = self.replicator()
+        self.insert("second", 10)
+        replicator.sync()
+
+        result, rows = self.restore()
+        self.assertEqual(len(list((self.directory / "backup").iterdir())), 1)
+        self.assertEqual(result.segments, 2)
+        self.assertEqual(rows, self.rows(self.database))
+
+    def test_partially_written_transactions_are_not_shipped(self):
+        replicator = self.replicator()
+        replicator.sync()
+        wal = self.database.with_name("db.sqlite3-wal")
+        with wal.open("rb") as f:
+            committed = f.read()
+        self.insert("torn", 10)
+        with wal.open("r+b") as f:
+            f.truncate(len(committed) + 100)
+
+        self.assertEqual(replicator.sync(), 0)
+
+
+class PermissionResolverTestCase(TestCase):
+    permission = "core.change_company"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.companies = [
+            Company.objects.create(name=name, normalized_name=name.lower())
+            for name in ("Acme", "Globex", "Initech")
+        ]
+
+    def setUp(self):
+        self.user = User.objects.create(email="jane@example.com", username="jane")
+
+    def test_object_permissions_are_preloaded_in_one_query(self):
+        acme, globex, initech = self.companies
+        assign_perm(self.permission, self.user, acme)
+        group = Group.objects.create(name="moderators")
+        self.user.groups.add(group)
+        assign_perm(self.permission, group, globex)
+
+        with self.assertNumQueries(1):
+            selectors.object_permissions_preload(user=self.user, objects=self.companies)
+        with self.assertNumQueries(0):
+            granted = [
+                selectors.user_has_permission(user=self.user, permission=self.permission, obj=c)
+                for c in self.companies
+            ]
+
+        self.assertEqual(granted, [True, True, False])
+        self.assertFalse(selectors.user_has_permission(user=self.user, permission=self.permission))
+
+    def test_global_permission_grants_every_object(self):
+        self.user.user_permissions.add(Permission.objects.get(codename="change_company"))
+
+        self.assertTrue(
+            selectors.user_has_permission(
+                user=self.user, permission=self.permission, obj=self.companies[0]
+            )
+        )
+        self.assertEqual(
+            selectors.filter_objects_with_permission(
+                user=self.user, permission=self.permission, queryset=Company.objects.all()
+            ).count(),
+            len(self.companies),
+        )
+
+    def test_granting_a_permission_invalidates_the_memoized_ones(self):
+        acme = self.companies[0]
+        self.assertFalse(
+            selectors.user_has_permission(user=self.user, permission=self.permission, obj=acme)
+        )
+
+        assign_perm(self.permission, self.user, acme)
+
+        self.assertTrue(
+            selectors.user_has_permission(user=self.user, permission=self.permission, obj=acme)
+        )
+
+    def test_filter_objects_with_permission(self):
+        acme, globex, _ = self.companies
+        assign_perm(self.permission, self.user, acme)
+        group = Group.objects.create(name="moderators")
+        self.user.groups.add(group)
+        assign_perm(self.permission, group, globex)
+
+        companies = selectors.filter_objects_with_permission(
+            user=self.user, permission=self.permission, queryset=Company.objects.order_by("id")
+        )
+
+        self.assertEqual(list(companies), [acme, globex])
+        self.assertFalse(
+            selectors.filter_objects_with_permission(
+                user=AnonymousUser(), permission=self.permission, queryset=Company.objects.all()
+            ).exists()
+        )
+
+    def test_inactive_and_superusers(self):
+        superuser = User.objects.create(username="admin", is_superuser=True)
+        self.user.is_active = False
+        self.user.save()
+        assign_perm(self.permission, self.user, self.companies[0])
+
+        self.assertTrue(
+            permissions.get_resolver(superuser).has_perm(self.permission, self.companies[0])
+        )
+        self.assertFalse(
+            permissions.get_resolver(self.user).has_perm(self.permission, self.companies[0])
+        )
+
+
+class SessionStoreTestCase(TestCase):
+    databases = {"default", "ephemeral"}  # The sessions
+
+    def test_session_is_stored_in_database(self):
+        session = SessionStore()
+        session["user"] = 1
+        session.save()
+
+        self.assertFalse(session.session_key.startswith("signed:"))
+        self.assertTrue(
+            Session.objects.using("ephemeral").filter(session_key=session.session_key).exists()
+        )
+        self.assertEqual(SessionStore(session.session_key)["user"], 1)
+
+    def test_session_is_signed_when_database_fails(self):
+        session = SessionStore()
+        session["user"] = 1
+        with (
+            mock.patch.object(Session, "save", side_effect=OperationalError("locked")),
+            self.assertLogs("orgtorii.sessions", "WARNING"),
+        ):
+            session.save()
+
+        self.assertTrue(session.session_key.startswith("signed:"))
+        self.assertEqual(SessionStore(session.session_key)["user"], 1)
+        self.assertEqual(SessionStore(session.session_key[:-1] + "x").load(), {})
+
+    def test_signed_session_moves_back_to_database(self):
+        session = SessionStore()
+        session["user"] = 1
+        with (
+            mock.patch.object(Session, "save", side_effect=IntegrityError("collision")),
+            self.assertLogs("orgtorii.sessions", "WARNING"),
+        ):
+            session.save()
+        signed = SessionStore(session.session_key)
+
+        signed["user"] = 2
+        signed.save()
+
+        self.assertFalse(signed.session_key.startswith("signed:"))
+        self.assertEqual(SessionStore(signed.session_key)["user"], 2)
+
+    def test_session_is_signed_when_database_update_fails(self):
+        session = SessionStore()
+        session["user"] = 1
+        session.save()
+        session["user"] = 2
+
+        with (
+            mock.patch.object(Session, "save", side_effect=OperationalError("locked")),
+            self.assertLogs("orgtorii.sessions", "WARNING"),
+        ):
+            session.save()
+
+        self.assertTrue(session.session_key.startswith("signed:"))
+        self.assertEqual(SessionStore(session.session_key)["user"], 2)
+
+    def test_deleted_session_is_not_saved_again(self):
+        session = SessionStore()
+        session["user"] = 1
+        session.save()
+        Session.objects.all().delete()
+        session["user"] = 2
+
+        with self.assertRaises(UpdateError):
+            session.save()
+
+        self.assertFalse(Session.objects.exists())
+
+    def test_expired_sessions_are_cleared(self):
+        expired = SessionStore()
+        expired.set_expiry(-1)
+        expired.save()
+        session = SessionStore()
+        session.save()
 
-        product = response.context["products"][0]
+        call_command("clearsessions")
+
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)), [session.session_key]
+        )
+
+
+class BloomFilterTestCase(TestCase):
+    def test_added_items_are_found(self):
+        known = BloomFilter(capacity=1000)
+        for i in range(1000):
+            known.add(f"{i}@example.com")
+
+        self.assertTrue(all(f"{i}@example.com" in known for i in range(1000)))
+        self.assertEqual(len(known), 1000)
+
+    def test_false_positive_rate(self):
+        known = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            known.add(f"{i}@example.com")
+
+        false_positives = sum(f"{i}@example.org" in known for i in range(10_000))
+        self.assertLess(false_positives / 10_000, 0.02)
+
+
+@mock.patch.object(NewsletterSignupBuffer, "_start_writer")
+class NewsletterSignupBufferTestCase(TestCase):
+    def test_signups_are_written_in_a_batch(self, _):
+        buffer = NewsletterSignupBuffer()
+        written = [buffer.add(f"{i}@example.com") for i in range(3)]
+        self.assertFalse(NewsletterSignup.objects.exists())
+
+        self.assertEqual(buffer.flush(), 3)
+
+        self.assertEqual(NewsletterSignup.objects.count(), 3)
+        self.assertTrue(all(future.result(timeout=0) for future in written))
+        self.assertEqual(len(buffer), 0)
+
+    def test_duplicates_are_rejected(self, _):
+        NewsletterSignup.objects.create(email="jane@example.com")
+        buffer = NewsletterSignupBuffer()
+
+        self.assertIsNone(buffer.add("jane@example.com"))
+        self.assertIsNotNone(buffer.add("john@example.com"))
+        self.assertIsNone(buffer.add("john@example.com"))
+
+    def test_new_emails_are_accepted_without_queries(self, _):
+        buffer = NewsletterSignupBuffer(refresh_interval=60)
+        buffer.add("jane@example.com")  # Loads the subscribed emails
+
+        with self.assertNumQueries(0):
+            self.assertIsNotNone(buffer.add("john@example.com"))
+
+    def test_lock_is_not_held_while_querying(self, _):
+        NewsletterSignup.objects.create(email="jane@example.com")
+        buffer = NewsletterSignupBuffer()
+        execute = connections[DEFAULT_DB_ALIAS].execute_wrapper
+
+        def assert_unlocked(run, *args):
+            self.assertFalse(buffer._lock.locked())
+            return run(*args)
+
+        with execute(assert_unlocked):
+            self.assertIsNone(buffer.add("jane@example.com"))
+            self.assertIsNotNone(buffer.add("john@example.com"))
+
+    def test_emails_subscribed_elsewhere_are_ignored_when_written(self, _):
+        buffer = NewsletterSignupBuffer(refresh_interval=60)
+        buffer.add("jane@example.com")
+        NewsletterSignup.objects.create(email="john@example.com")
+        buffer.add("john@example.com")
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(NewsletterSignup.objects.count(), 2)
+
+    def test_failed_batches_are_retried(self, _):
+        buffer = NewsletterSignupBuffer()
+        written = buffer.add("jane@example.com")
+
+        with (
+            mock.patch.object(
+                NewsletterSignup.objects, "bulk_create", side_effect=OperationalError
+            ),
+            self.assertRaises(OperationalError),
+        ):
+            buffer.flush()
+        self.assertFalse(written.done())
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertTrue(written.result(timeout=0))
+
+
+class BackgroundWorkTestCase(TestCase):
+    def test_old_connections_are_closed_after_failed_work(self):
+        with (
+            mock.patch.object(threads, "close_old_connections") as close_old_connections,
+            self.assertRaises(ValueError),
+            threads.background_work(),
+        ):
+            raise ValueError
+
+        close_old_connections.assert_called_once_with()
+
+
+class WriteQueueTestCase(TestCase):
+    def test_waiting_writes_are_committed_together(self):
+        write_queue = WriteQueue(batch_size=10)
+        started, release = threading.Event(), threading.Event()
+
+        def first():
+            started.set()
+            release.wait(timeout=5)
+            return "first"
+
+        def fail():
+            raise ValueError
+
+        batches = []
+        write = write_queue._write
+
+        def record(batch):
+            batches.append(len(batch))
+            write(batch)
+
+        with (
+            mock.patch.object(write_queue, "_write", side_effect=record),
+            mock.patch.object(writer.transaction, "atomic", return_value=contextlib.nullcontext()),
+        ):
+            futures = [write_queue.submit(first)]
+            started.wait(timeout=5)
+            futures += [write_queue.submit(str, i) for i in range(3)]
+            failed = write_queue.submit(fail)
+            release.set()
+
+            self.assertEqual(
+                [future.result(timeout=5) for future in futures], ["first", "0", "1", "2"]
+            )
+            with self.assertRaises(ValueError):
+                failed.result(timeout=5)
+        self.assertEqual(batches, [1, 4])
+
+    def test_failed_writes_are_rolled_back_alone(self):
+        write_queue = WriteQueue()
+        NewsletterSignup.objects.create(email="jane@example.com")
+        batch = [
+            writer._Write(NewsletterSignup.objects.create, (), {"email": email})
+            for email in ("john@example.com", "jane@example.com")
+        ]
+
+        write_queue._write(batch)
+
+        self.assertEqual(batch[0].future.result(timeout=0).email, "john@example.com")
+        self.assertIsInstance(batch[1].future.exception(timeout=0), IntegrityError)
+        self.assertEqual(NewsletterSignup.objects.count(), 2)
+
+    def test_starting_the_transaction_is_retried_while_locked(self):
+        write_queue = WriteQueue(lock_timeout=5)
+        write = writer._Write(str, ("written",), {})
+        transaction = write_queue._transaction
+        locked = [OperationalError("database is locked")]
+
+        def start(batch, outcomes):
+            if locked:
+                raise locked.pop()
+            transaction(batch, outcomes)
+
+        with (
+            mock.patch.object(write_queue, "_transaction", side_effect=start),
+            mock.patch.object(writer.time, "sleep") as sleep,
+        ):
+            write_queue._write([write])
+
+        sleep.assert_called_once_with(writer._LOCKED_RETRY_DELAY)
+        self.assertEqual(write.future.result(timeout=0), "written")
+
+    def test_other_errors_fail_the_batch_right_away(self):
+        write_queue = WriteQueue(lock_timeout=5)
+        write = writer._Write(str, ("written",), {})
+        error = OperationalError("disk I/O error")
+
+        with (
+            mock.patch.object(write_queue, "_transaction", side_effect=error) as start,
+            self.assertLogs(writer.logger, "ERROR"),
+        ):
+            write_queue._write([write])
+
+        start.assert_called_once()
+        self.assertIs(write.future.exception(timeout=0), error)
+
+    def test_writes_inside_a_transaction_run_in_it(self):
+        write_queue = WriteQueue()
+
+        with mock.patch.object(write_queue, "submit") as submit:
+            signup = write_queue.run(NewsletterSignup.objects.create, email="jane@example.com")
+
+        submit.assert_not_called()
+        self.assertTrue(NewsletterSignup.objects.filter(pk=signup.pk).exists())
+
+    def test_writes_run_in_the_caller_without_background(self):
+        write_queue = WriteQueue(background=False)
+
+        written = write_queue.submit(NewsletterSignup.objects.create, email="jane@example.com")
+
+        self.assertEqual(written.result(timeout=0).email, "jane@example.com")
+        self.assertIsNone(write_queue._writer)
+
+
+class MailingTestCase(TestCase):
+    def test_token_bucket_limits_rate(self):
+        bucket = mailing.TokenBucket(rate=100, capacity=1)
+
+        started = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_pool_reuses_smtp_connections(self):
+        with mailing.LocalSMTPServer() as server:
+            server.start()
+            pool = mailing.EmailConnectionPool(
+                size=2,
+                max_messages=3,
+                backend="django.core.mail.backends.smtp.EmailBackend",
+                host="127.0.0.1",
+                port=server.port,
+            )
+            for i in range(7):
+                pool.send(EmailMessage("Hello", "Hi", to=[f"{i}@example.com"]))
+            pool.close()
+
+            self.assertEqual(len(server.messages), 7)
+            self.assertEqual(server.messages[0][0], ["0@example.com"])
+            self.assertEqual(server.connections, 3)
+
+    def test_pool_reconnects_closed_connections(self):
+        with mailing.LocalSMTPServer() as server:
+            server.start()
+            pool = mailing.EmailConnectionPool(
+                size=1,
+                backend="django.core.mail.backends.smtp.EmailBackend",
+                host="127.0.0.1",
+                port=server.port,
+            )
+            pool.send(EmailMessage("Hello", "Hi", to=["jane@example.com"]))
+            with pool.connection() as connection:
+                connection.connection.sock.close()  # Like a server closing an idle connection
+
+            pool.send(EmailMessage("Hello", "Hi", to=["john@example.com"]))
+            pool.close()
+
+            self.assertEqual(len(server.messages), 2)
+
+
+class TDigestTestCase(TestCase):
+    values = [(i * 7919) % 10_000 for i in range(10_000)]  # 0-9999 shuffled
+
+    def test_empty_digest_has_no_quantiles(self):
+        self.assertIsNone(TDigest().quantile(0.5))
+
+    def test_quantiles_are_accurate(self):
+        digest = TDigest()
+        for value in self.values:
+            digest.add(value)
+
+        self.assertEqual(digest.count, 10_000)
+        for q in (0.01, 0.25, 0.5, 0.75, 0.99):
+            self.assertAlmostEqual(digest.quantile(q), q * 10_000, delta=50)
+
+    def test_size_is_bounded(self):
+        digest = TDigest(compression=100)
+        for value in self.values:
+            digest.add(value)
+
+        self.assertLess(len(digest.to_dict()["centroids"]), 200)
+
+    def test_merged_digests_match_single_digest(self):
+        first, second = TDigest(), TDigest()
+        for value in self.values[:5_000]:
+            first.add(value)
+        for value in self.values[5_000:]:
+            second.add(value)
+        first.merge(second)
+
+        self.assertEqual(first.count, 10_000)
+        self.assertEqual(first.min, 0)
+        self.assertEqual(first.max, 9_999)
+        self.assertAlmostEqual(first.quantile(0.5), 5_000, delta=50)
+
+    def test_serialization_round_trip(self):
+        digest = TDigest()
+        for value in self.values:
+            digest.add(value)
+
+        loaded = TDigest.from_dict(digest.to_dict())
+
+        self.assertEqual(loaded.count, digest.count)
+        self.assertEqual(loaded.quantile(0.9), digest.quantile(0.9))
+
+
+class LRUCacheTestCase(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_entries_expire(self):
+        cache = LRUCache(ttl=0)
+        cache.set("a", 1)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_hits_and_misses_are_counted(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+class TieredDjangoCacheTestCase(TestCase):
+    params = {"LOCAL_TIMEOUT": 60, "GENERATION_CHECK_INTERVAL": 0}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache = self.new_process_cache()
+
+    def new_process_cache(self, **params):
+        # Forget the in-process tier, as if the cache was opened by another process
+        tiered_cache._local_tiers.pop(self.directory, None)
+        backend = tiered_cache.TieredDjangoCache(self.directory, {**self.params, **params})
+        self.addCleanup(backend._cache.close)
+        return backend
+
+    def test_values_are_served_from_memory(self):
+        self.cache.set("a", 1)
+        # Change the value on disk only
+        DjangoCache.set(self.cache, "a", 2)
+
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_values_read_from_disk_are_kept_in_memory(self):
+        DjangoCache.set(self.cache, "a", 1)
+        self.cache.get("a")
+        DjangoCache.set(self.cache, "a", 2)
+
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+
+    def test_delete_by_another_process_invalidates_memory(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        other = self.new_process_cache()
+
+        other.delete("a")
+
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_delete_only_invalidates_its_namespace(self):
+        self.cache.set("page:a", 1)
+        self.cache.set("pricing:table", 1)
+        # Change the values on disk only
+        DjangoCache.set(self.cache, "page:a", 2)
+        DjangoCache.set(self.cache, "pricing:table", 2)
+        other = self.new_process_cache()
+
+        other.delete("pricing:other")
+
+        self.assertEqual(self.cache.get("page:a"), 1)
+        self.assertEqual(self.cache.get("pricing:table"), 2)
+
+    def test_clear_invalidates_memory(self):
+        self.cache.set("a", 1)
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_hits_misses_and_evictions_are_exported(self):
+        backend = self.new_process_cache(LOCAL_MAX_ENTRIES=1)
+
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        hits = sample("django_cache_get_hits_total", backend="local")
+        misses = sample("django_cache_get_misses_total", backend="local")
+        backend.set("a", 1)
+        backend.get("a")
+        backend.get("b")
+        backend.set("b", 2)
+
+        self.assertEqual(sample("django_cache_get_hits_total", backend="local") - hits, 1)
+        self.assertEqual(sample("django_cache_get_misses_total", backend="local") - misses, 1)
+        self.assertEqual(
+            sample("django_cache_local_evictions_total", directory=backend.directory), 1
+        )
+
+
+class PasswordHashingTestCase(TestCase):
+    databases = {"default", "ephemeral"}  # The sessions
+    password = "iKDt6EFwyQEjkgqSzCdvFdC7imS5JN0H"
+
+    def test_executor_bounds_concurrent_hashes(self):
+        executor = hashers.HashingExecutor(2)
+        running = 0
+        max_running = 0
+        lock = threading.Lock()
+
+        def hash_password():
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+        for future in [executor.submit("encode", hash_password) for _ in range(6)]:
+            future.result()
+
+        self.assertEqual(max_running, 2)
+
+    @override_settings(ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=8 * 1024)
+    def test_hasher_parameters_come_from_settings(self):
+        encoded = make_password(self.password)
+        decoded = identify_hasher(encoded).decode(encoded)
+
+        self.assertEqual((decoded["time_cost"], decoded["memory_cost"]), (1, 8 * 1024))
+        with self.settings(ARGON2_TIME_COST=2):
+            self.assertTrue(get_hasher().must_update(encoded))
+
+    def test_legacy_hashes_are_upgraded_in_background(self):
+        user = User.objects.create(email="jane@example.com", username="jane")
+        user.password = make_password(self.password, hasher="pbkdf2_sha256")
+        user.save()
+
+        with mock.patch.object(hashers, "password_upgrade_in_background") as upgrade:
+            self.assertTrue(user.check_password(self.password))
+
+        upgrade.assert_called_once_with(
+            user_id=user.pk, encoded=user.password, raw_password=self.password
+        )
+
+    def test_upgrade_keeps_sessions_valid(self):
+        user = User.objects.create(email="jane@example.com", username="jane")
+        user.password = make_password(self.password, hasher="pbkdf2_sha256")
+        user.save()
+        self.client.force_login(user)
+
+        self.assertTrue(
+            hashers._password_upgrade(
+                user_id=user.pk, encoded=user.password, raw_password=self.password
+            )
+        )
+
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm, "argon2")
+        response = self.client.get(reverse("homepage"))
+        self.assertEqual(response.wsgi_request.user, user)
+
+    def test_password_change_ends_sessions_started_before_upgrade(self):
+        user = User.objects.create(email="jane@example.com", username="jane")
+        user.password = make_password(self.password, hasher="pbkdf2_sha256")
+        user.save()
+        self.client.force_login(user)
+        hashers._password_upgrade(
+            user_id=user.pk, encoded=user.password, raw_password=self.password
+        )
+
+        user.refresh_from_db()
+        user.set_password("a new password")
+        user.save()
+
+        response = self.client.get(reverse("homepage"))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_failed_upgrade_keeps_no_session_hash(self):
+        user = User.objects.create(email="jane@example.com", username="jane")
+        encoded = make_password(self.password, hasher="pbkdf2_sha256")
+
+        self.assertFalse(
+            hashers._password_upgrade(user_id=user.pk, encoded=encoded, raw_password=self.password)
+        )
+        self.assertIsNone(
+            hashers.upgraded_session_auth_hash(user_id=user.pk, password=user.password)
+        )
+
+
+class JobsTestCase(TestCase):
+    def setUp(self):
+        self.broker = jobs.InMemoryBroker()
+        self.calls = []
+
+    def test_jobs_run_with_bounded_concurrency(self):
+        running = 0
+        max_running = 0
+        lock = threading.Lock()
+
+        @jobs.register("test_sleep")
+        def sleep(*, seconds):
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(seconds)
+            with lock:
+                running -= 1
+            self.calls.append(seconds)
+
+        for _ in range(8):
+            self.broker.enqueue(jobs.Job("test_sleep", {"seconds": 0.02}))
+        jobs.Worker(self.broker, concurrency=2).run(burst=True)
+
+        self.assertEqual(len(self.calls), 8)
+        self.assertEqual(max_running, 2)
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        @jobs.register("test_flaky", max_retries=2, retry_delay=0.01)
+        def flaky():
+            self.calls.append(time.monotonic())
+            raise RuntimeError("Flaky")
+
+        worker = jobs.Worker(self.broker)
+        with self.assertLogs("orgtorii.jobs", level="WARNING"):
+            self.assertFalse(worker.process(jobs.Job("test_flaky")))
+            # The retry only becomes available once its delay has passed
+            self.assertIsNone(self.broker.dequeue(timeout=0))
+            time.sleep(0.02)
+            retry = self.broker.dequeue(timeout=0)
+            self.assertEqual(retry.attempt, 1)
+            worker.process(retry)
+            time.sleep(0.04)
+            worker.process(self.broker.dequeue(timeout=0))
+        # Given up after the retries
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(len(self.broker), 0)
+
+    def test_jobs_are_serializable(self):
+        job = jobs.Job("test_sleep", {"seconds": 1}, attempt=2)
+        self.assertEqual(jobs.Job.loads(job.dumps()), job)
+
+    def test_unknown_jobs_cannot_be_queued(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue("test_unknown")
+
+    def test_memory_broker_is_refused_in_production(self):
+        with (
+            mock.patch.object(jobs, "_broker", None),
+            override_settings(JOBS_BROKER_URL="memory://", DEBUG=False, TESTING=False),
+            self.assertRaises(ImproperlyConfigured),
+        ):
+            jobs.get_broker()
+
+
+class PdfTestCase(TestCase):
+    @staticmethod
+    def make_pdf(content: bytes) -> bytes:
+        stream = zlib.compress(content)
+        return (
+            b"%PDF-1.4\n1 0 obj\n<< /Length "
+            + str(len(stream)).encode()
+            + b" /Filter /FlateDecode >>\nstream\n"
+            + stream
+            + b"\nendstream\nendobj\n2 0 obj\n<< /Type /XObject /Subtype /Image /Length 6 >>\n"
+            + b"stream\n(x) Tj\nendstream\nendobj\n%%EOF\n"
+        )
+
+    def test_extract_text(self):
+        pdf_data = self.make_pdf(
+            b"BT /F1 12 Tf 72 712 Td (Acme Widgets \\(UK\\) Ltd) Tj 0 -14 Td "
+            b"[(Net) -250 (pay)] TJ T* <FEFF00E9> Tj ET"
+        )
+        self.assertEqual(pdf.extract_text(pdf_data), "Acme Widgets (UK) Ltd\nNet pay\n\xe9")
 
-        self.assertIsNotNone(product.prices)
-        self.assertEqual(product.prices.count(), 2)
+    def test_extract_text_without_text(self):
+        self.assertEqual(pdf.extract_text(self.make_pdf(b"0 0 m 100 100 l S")), "")
+        self.assertEqual(pdf.extract_text(b"%PDF-1.4\n%%EOF\n"), "")
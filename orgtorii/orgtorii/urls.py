@@ -28,6 +28,7 @@ urlpatterns = [
     path("auth/", include("allauth.urls")),  # Django allauth
     path("stripe/", include("djstripe.urls", namespace="djstripe")),  # dj-stripe
     path("pricing/", views.pricing, name="pricing"),
+    path("csrf-token", views.csrf_token, name="csrf_token"),
     path(
         "newsletter/",
         include(
@@ -47,6 +48,17 @@ urlpatterns = [
             (
                 [
                     path("coming-soon", core_views.coming_soon, name="coming_soon"),
+                    path("reviews", core_views.review_list, name="review_list"),
+                    path(
+                        "companies/autocomplete",
+                        core_views.company_autocomplete,
+                        name="company_autocomplete",
+                    ),
+                    path(
+                        "companies/leaderboard",
+                        core_views.company_leaderboard,
+                        name="company_leaderboard",
+                    ),
                 ],
                 "core",
             ),
@@ -1,7 +1,10 @@
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractUser
 from django.db.models import CharField
 from django.utils.translation import gettext_lazy as _
 
+from orgtorii import hashers
+
 
 class OrgToriiUser(AbstractUser):
     """Custom user model.
@@ -17,3 +20,26 @@ class OrgToriiUser(AbstractUser):
     last_name = None  # type: ignore[assignment]
 
     REQUIRED_FIELDS = []
+
+    def check_password(self, raw_password):
+        # Rehashing a password with an outdated hasher or parameters is left to a hashing
+        # thread, so logging in doesn't pay for a second hash
+        def setter(raw_password):
+            hashers.password_upgrade_in_background(
+                user_id=self.pk, encoded=self.password, raw_password=raw_password
+            )
+
+        return check_password(raw_password, self.password, setter)
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        # The sessions started before a password hash upgrade end with the password
+        hashers.upgraded_session_auth_hash_delete(user_id=self.pk)
+
+    def get_session_auth_fallback_hash(self):
+        yield from super().get_session_auth_fallback_hash()
+        # Upgrading the password hash changes the session auth hash, which would log the
+        # user out of the sessions started before
+        upgraded = hashers.upgraded_session_auth_hash(user_id=self.pk, password=self.password)
+        if upgraded is not None:
+            yield upgraded
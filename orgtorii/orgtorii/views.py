@@ -1,10 +1,20 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
 
 from . import selectors
+from .page_cache import cache_anonymous_page
 
 
-def homepage(request):
+@cache_anonymous_page
+async def homepage(request):
     return render(request, "orgtorii/homepage.html")
 
 
@@ -19,6 +29,25 @@ def dashboard(request):
     return render(request, "orgtorii/dashboard.html")
 
 
-def pricing(request):
-    products = selectors.product_list()
-    return render(request, "orgtorii/pricing.html", {"products": products})
+@sync_to_async
+def _pricing_context():
+    pricing_table = cache.get(selectors.PRICING_TABLE_CACHE_KEY)
+    if pricing_table is None:
+        pricing_table = render_to_string(
+            "partials/orgtorii/pricing_table.html", {"plans": selectors.pricing_plan_list()}
+        )
+        cache.set(selectors.PRICING_TABLE_CACHE_KEY, pricing_table, selectors.PRICING_CACHE_TIMEOUT)
+    return {"pricing_table": mark_safe(pricing_table)}
+
+
+@cache_anonymous_page
+async def pricing(request):
+    # Served from the cache without querying the database, see selectors.pricing_plan_list
+    return render(request, "orgtorii/pricing.html", await _pricing_context())
+
+
+@require_GET
+@never_cache
+def csrf_token(request):
+    # Cached pages can't contain a CSRF token, static/orgtorii/js/csrf.js fetches one here
+    return JsonResponse({"token": get_token(request)})
@@ -0,0 +1,23 @@
+// Pages cached for anonymous visitors can't contain a CSRF token, fetch one when the page
+// has a form or an HTMX element which needs it (see orgtorii/page_cache.py)
+(() => {
+  const url = document.currentScript.dataset.url;
+  const unsafe = 'form[method="post" i], [hx-post], [hx-put], [hx-patch], [hx-delete]';
+  if (!document.querySelector(unsafe)) {
+    return;
+  }
+  fetch(url, { credentials: "same-origin" })
+    .then((response) => response.json())
+    .then(({ token }) => {
+      for (const form of document.querySelectorAll('form[method="post" i]')) {
+        if (!form.querySelector('[name="csrfmiddlewaretoken"]')) {
+          const input = document.createElement("input");
+          Object.assign(input, { type: "hidden", name: "csrfmiddlewaretoken", value: token });
+          form.append(input);
+        }
+      }
+      document.body.addEventListener("htmx:configRequest", (event) => {
+        event.detail.headers["X-CSRFToken"] = token;
+      });
+    });
+})();
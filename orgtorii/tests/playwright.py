@@ -13,6 +13,7 @@ class PlaywrightTestCase(ABC, StaticLiveServerTestCase):
     and launches the Django static live server."""
 
     expect = expect  # helper for assertions
+    databases = {"default", "ephemeral"}  # The sessions of the logged in users
 
     @classmethod
     def setUpClass(cls) -> None: